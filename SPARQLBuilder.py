@@ -1,6 +1,12 @@
+from typing import Callable
+
 import SPARQLConstants
 import CommonNamespaces
 
+# Default maximum numbers of triples and bytes per update in bulk mode
+BULK_MAX_TRIPLES = 10000
+BULK_MAX_BYTES = 1000000
+
 def makeIRIRef(iri) -> str:
     return iri if CommonNamespaces.isNamespacedIRI(iri, \
         CommonNamespaces.default_prefixes) else '<' + iri + '>'
@@ -119,15 +125,61 @@ class SPARQLUpdateBuilder(SPARQLWhereBuilder):
         super().__init__()
         self._inserts = []
         self._deletes = []
+        # Bulk mode
+        self._flush_func = None
+        self._max_triples = None
+        self._max_bytes = None
+        self._num_bytes = 0
+
+    def set_bulk(self, flush_func: Callable[[str], None],
+        max_triples: int | None = BULK_MAX_TRIPLES,
+        max_bytes: int | None = BULK_MAX_BYTES) -> None:
+        """
+        Switches to bulk mode, in which inserted triples are accumulated,
+        and passed on to the given function as an INSERT DATA update as
+        soon as there are the given maximum number of triples, or their
+        size reaches the given maximum number of bytes (approximately,
+        not counting prefix declarations). Any remaining triples must be
+        passed on by calling `flush`. Deletions and where clauses are
+        not supported in bulk mode.
+        """
+        if self._deletes or self._wheres or self._optional_wheres:
+            raise ValueError("Bulk mode only supports insertions of data!")
+        self._flush_func = flush_func
+        self._max_triples = max_triples
+        self._max_bytes = max_bytes
 
     def addInsert(self, asub, apred, aobj):
         self._inserts.append([asub, apred, aobj])
+        if self._flush_func is not None:
+            # Size of the triple, including separators
+            self._num_bytes += len(f"{asub} {apred} {aobj} . ".encode())
+            if ((self._max_triples is not None
+                and len(self._inserts) >= self._max_triples)
+                or (self._max_bytes is not None
+                and self._num_bytes >= self._max_bytes)):
+                self.flush()
         return self
 
     def addDelete(self, asub, apred, aobj):
+        if self._flush_func is not None:
+            raise ValueError("Bulk mode only supports insertions of data!")
         self._deletes.append([asub, apred, aobj])
         return self
 
+    def flush(self) -> int:
+        """
+        Passes any accumulated triples on as an INSERT DATA update in
+        bulk mode, and returns their number.
+        """
+        num_triples = len(self._inserts)
+        if self._flush_func is not None and num_triples > 0:
+            ustr = self.build()
+            self._inserts = []
+            self._num_bytes = 0
+            self._flush_func(ustr)
+        return num_triples
+
     def build(self):
         strlist = []
         if self._inserts:
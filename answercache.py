@@ -0,0 +1,218 @@
+"""
+Caching of whole answers to questions.
+"""
+
+import logging
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from time import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from common import log_msg
+
+# Characters stripped from either end of a normalised question
+QUESTION_STRIP_CHARS = " ?!.,;:\"'"
+
+def normalise_question(question: str) -> str:
+    """
+    Normalises a question such that trivially different spellings of
+    the same question, e.g. in terms of case, white space, or trailing
+    punctuation, map to the same text.
+    """
+    text = unicodedata.normalize("NFKC", question).casefold()
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(QUESTION_STRIP_CHARS)
+
+class AnswerCache:
+    """
+    Size-bounded, least-recently-used in-memory cache of answers, keyed
+    by normalised question text. Each answer is tagged with the version
+    of the dataset it was generated from, and is only returned as long as
+    that version is current and the answer has not expired.
+    """
+
+    def __init__(self, max_entries: int = 1000,
+        ttl: float | None = None) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[dict[str, str], str, float]] = (
+            OrderedDict())
+        self._lock = threading.Lock()
+
+    def lookup(self, question: str, version: str) -> dict[str, str] | None:
+        """
+        Returns a copy of the cached answer to the given question, or
+        none if there is no valid cached answer.
+        """
+        key = normalise_question(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                response, entry_version, created = entry
+                if entry_version != version or (self.ttl is not None
+                    and time() - created > self.ttl):
+                    del self._entries[key]
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(response)
+
+    def update(self, question: str, version: str,
+        response: dict[str, str]) -> None:
+        if self.max_entries <= 0:
+            return
+        key = normalise_question(question)
+        with self._lock:
+            self._entries[key] = (dict(response), version, time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                "size": len(self._entries)}
+
+class _SemanticEntry:
+
+    def __init__(self, question: str, response: dict[str, str],
+        version: str, latency: float) -> None:
+        self.question = question
+        self.response = response
+        self.version = version
+        self.latency = latency
+        self.created = time()
+        self.last_used = self.created
+
+class SemanticAnswerCache:
+    """
+    In-memory cache of answers that also matches paraphrased questions,
+    by comparing the embedding of a question with those of previously
+    answered questions. An answer is returned if the cosine similarity
+    of the most similar question is at least the given threshold, and
+    if the answer was generated from the current version of the dataset.
+
+    Only non-empty answers are admitted. If the cache is full, the least
+    recently used answer is evicted.
+    """
+
+    def __init__(self, embeddings: Embeddings, threshold: float = 0.95,
+        max_entries: int = 1000, ttl: float | None = None,
+        answer_key: str = "answer") -> None:
+        self.embeddings = embeddings
+        self.answer_key = answer_key
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.saved_latency = 0.0
+        self._entries: list[_SemanticEntry] = []
+        # Normalised question embeddings, one row per entry
+        self._matrix: np.ndarray | None = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalise(vector: list[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm > 0 else v
+
+    def _remove(self, index: int) -> None:
+        del self._entries[index]
+        self._matrix = (np.delete(self._matrix, index, axis=0)
+            if len(self._entries) > 0 else None)
+
+    def _lookup_vector(self, question: str, vector: np.ndarray,
+        version: str) -> dict[str, str] | None:
+        with self._lock:
+            # Drop expired entries and entries from outdated versions.
+            now = time()
+            for i in reversed(range(len(self._entries))):
+                e = self._entries[i]
+                if e.version != version or (self.ttl is not None
+                    and now - e.created > self.ttl):
+                    self._remove(i)
+            if self._matrix is None:
+                self.misses += 1
+                return None
+            similarities = self._matrix @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            e = self._entries[best]
+            e.last_used = now
+            self.hits += 1
+            self.saved_latency += e.latency
+            log_msg(f"Semantic cache hit for question '{question}', "
+                f"matching '{e.question}' with similarity "
+                f"{similarities[best]:.3f}.", level=logging.DEBUG)
+            return dict(e.response)
+
+    def _update_vector(self, question: str, vector: np.ndarray,
+        version: str, response: dict[str, str], latency: float) -> None:
+        if self.max_entries <= 0 or response.get(self.answer_key, "") == "":
+            return
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                lru = min(range(len(self._entries)),
+                    key=lambda i: self._entries[i].last_used)
+                self._remove(lru)
+            self._entries.append(
+                _SemanticEntry(question, dict(response), version, latency))
+            self._matrix = (vector[np.newaxis, :] if self._matrix is None
+                else np.vstack([self._matrix, vector]))
+
+    def lookup(self, question: str, version: str) -> dict[str, str] | None:
+        """
+        Returns a copy of the cached answer to the most similar question,
+        or none if there is no sufficiently similar question.
+        """
+        vector = self._normalise(self.embeddings.embed_query(question))
+        return self._lookup_vector(question, vector, version)
+
+    async def alookup(self, question: str,
+        version: str) -> dict[str, str] | None:
+        vector = self._normalise(await self.embeddings.aembed_query(question))
+        return self._lookup_vector(question, vector, version)
+
+    def update(self, question: str, version: str, response: dict[str, str],
+        latency: float = 0.0) -> None:
+        """
+        Admits an answer, together with the time (in seconds) it took to
+        generate it, which is counted as saved whenever it is reused.
+        """
+        vector = self._normalise(self.embeddings.embed_query(question))
+        self._update_vector(question, vector, version, response, latency)
+
+    async def aupdate(self, question: str, version: str,
+        response: dict[str, str], latency: float = 0.0) -> None:
+        vector = self._normalise(await self.embeddings.aembed_query(question))
+        self._update_vector(question, vector, version, response, latency)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries = []
+            self._matrix = None
+
+    def stats(self) -> dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+                "saved_latency": self.saved_latency,
+                "size": len(self._entries)}
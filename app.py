@@ -4,19 +4,23 @@ a web app.
 """
 
 import os
-from typing import Any
+import json
+import asyncio
+from typing import Any, AsyncIterator
 from contextlib import asynccontextmanager
-from logging import INFO
+from logging import INFO, WARN
 
 from fastapi import FastAPI, Request
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 
 from common import logger, log_msg
 from hybridrag import HybridRAG
-from ragconfig import RAGConfig
-from questions import Questions
+from hybridqachain import SET_STAGE, SET_TOKEN, SET_SOURCES
+from ragconfig import RAGConfig, APP_CONFIG_FILE, CVN_DS_VERSION_INTERVAL
+from ragconfig import CVN_PRECOMPUTE_CONCURRENCY, CVN_PRECOMPUTE_REFRESH
+from precompute import PrecomputedAnswers
 
 class RAGApp(FastAPI):
     """
@@ -28,12 +32,14 @@ class RAGApp(FastAPI):
         self.rag: HybridRAG | None = None
         logger.setLevel(INFO)
         # Load configuration
-        self.config = RAGConfig("config-hybrid.yaml")
+        self.config = RAGConfig(APP_CONFIG_FILE)
         self.config.set_openai_api_key()
-        # Load example question catalogue
-        questions = Questions()
-        questions.load(os.path.join("data", "questions-example.json"))
-        cat_qs = questions.categorised_question_dict(default_cat="Allgemein")
+        # Load example question catalogue, including any precomputed
+        # answers.
+        self.precomputed = PrecomputedAnswers(
+            os.path.join("data", "questions-example.json"))
+        cat_qs = self.precomputed.questions.categorised_question_dict(
+            default_cat="Allgemein")
         subdomains: list[dict[str, Any]] = []
         for cat, qs in cat_qs.items():
             subdomains.append({"label": cat, "questions": qs})
@@ -41,13 +47,34 @@ class RAGApp(FastAPI):
         # Load HTML templates
         self.html_templates = Jinja2Templates(directory="html_templates")
 
+async def refresh_precomputed(r: RAGApp) -> None:
+    """
+    Keeps the precomputed answers to the example questions up to date,
+    by checking for changes to the dataset periodically.
+    """
+    while True:
+        try:
+            await r.precomputed.refresh(r.rag,
+                concurrency=r.config.get_or_default(
+                    CVN_PRECOMPUTE_CONCURRENCY, 4))
+        except Exception as e:
+            log_msg(f"Error refreshing precomputed answers: {e}", level=WARN)
+        await asyncio.sleep(
+            r.config.get_or_default(CVN_DS_VERSION_INTERVAL, 300))
+
 @asynccontextmanager
 async def lifespan(r: RAGApp):
     """
-    Context manager to ensure initialisation of hybrid RAG system.
+    Context manager to ensure initialisation of hybrid RAG system,
+    and the closing of its store clients on shutdown.
     """
-    r.rag = HybridRAG(r.config)
+    r.rag = await HybridRAG.acreate(r.config)
+    refresh_task = (asyncio.create_task(refresh_precomputed(r))
+        if r.config.get_or_default(CVN_PRECOMPUTE_REFRESH, False) else None)
     yield
+    if refresh_task is not None:
+        refresh_task.cancel()
+    await r.rag.aclose()
 
 app = RAGApp(lifespan=lifespan)
 # Serve static files
@@ -94,9 +121,17 @@ async def query(question: str=""):
         answer = ""
         sources = ""
     else:
-        result = app.rag.query(question)
-        answer = result[app.rag.chain.answer_key].replace("\n", "<br/>")
-        sources = result[app.rag.chain.sources_key].replace("\n", "<br/>")
+        precomputed = app.precomputed.lookup(question,
+            await app.rag.version_probe.aget())
+        if precomputed is not None:
+            answer = precomputed.get_text()
+            sources = precomputed.get_sources()
+        else:
+            result = await app.rag.aquery(question)
+            answer = result[app.rag.chain.answer_key]
+            sources = result[app.rag.chain.sources_key]
+        answer = answer.replace("\n", "<br/>")
+        sources = sources.replace("\n", "<br/>")
     log_msg(f"Question:\n{question}")
     log_msg(f"Answer:\n{answer}")
     log_msg(f"Sources:\n{sources}")
@@ -105,3 +140,71 @@ async def query(question: str=""):
         "answer": answer,
         "sources": sources
     }
+
+def make_sse_event(event: str, data: str) -> str:
+    """
+    Returns a server-sent event of the given type, with the data encoded
+    as JSON, such that line breaks are preserved.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_events(question: str) -> AsyncIterator[str]:
+    if (question == "") or (app.rag is None):
+        yield make_sse_event("done", "")
+        return
+    log_msg(f"Question:\n{question}")
+    precomputed = app.precomputed.lookup(question,
+        await app.rag.version_probe.aget())
+    if precomputed is not None:
+        yield make_sse_event(SET_TOKEN, precomputed.get_text())
+        yield make_sse_event(SET_SOURCES, precomputed.get_sources())
+        yield make_sse_event("done", "")
+        return
+    answer_chunks: list[str] = []
+    try:
+        async for event, data in app.rag.astream_query(question):
+            if event == SET_TOKEN:
+                answer_chunks.append(data)
+            elif event == SET_SOURCES:
+                log_msg(f"Sources:\n{data}")
+            yield make_sse_event(event, data)
+    except Exception as e:
+        log_msg(f"Error streaming answer: {e}", level=WARN)
+        # NB Not "error", as that is reserved for connection errors by
+        # the EventSource API.
+        yield make_sse_event("failure", "Bei der Beantwortung der Frage "
+            "ist ein Fehler aufgetreten.")
+        return
+    log_msg(f"Answer:\n{''.join(answer_chunks)}")
+    yield make_sse_event("done", "")
+
+@app.get("/stream/",
+    summary="API route to query the RAG system with streamed progress",
+    response_description="A stream of server-sent events:\n"
+        " - `stage` events, as processing steps complete\n"
+        " - `token` events, with parts of the answer as it is generated\n"
+        " - a `sources` event, with the sources used in the answer\n"
+        " - a `done` event, or a `failure` event in case of an error",
+    tags=["API"]
+)
+async def stream(question: str=""):
+    """
+    Streaming API route of the RAG system. Reports progress on answering
+    a plain-text question passed as an argument, and streams the answer
+    as it is generated, as server-sent events.
+    """
+    return StreamingResponse(stream_events(question),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/stats/",
+    summary="API route to obtain statistics of the RAG system",
+    response_description="A JSON-dictionary that contains cache "
+        "statistics, e.g. hit and miss counts",
+    tags=["API"]
+)
+async def stats():
+    """
+    Returns statistics of the RAG system in JSON format.
+    """
+    return {} if app.rag is None else app.rag.get_stats()
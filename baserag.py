@@ -1,32 +1,21 @@
 from datetime import datetime
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain.embeddings import CacheBackedEmbeddings
-from langchain.storage import LocalFileStore
+from langchain_openai import ChatOpenAI
 from langchain_core.runnables import RunnablePassthrough
 from langchain.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams
 
 from common import *
 from ragconfig import *
 from debateloader import DebateLoader
+from embeddingcache import make_cached_embeddings
+from vectorstore import make_search_params, make_vector_store
 from questions import Questions, Answer
 
 class BaseRAG:
 
     def __init__(self, config: RAGConfig) -> None:
-        # https://platform.openai.com/docs/guides/embeddings/
-        underlying_embeddings = OpenAIEmbeddings(
-            model=config.get(CVN_EMBEDDING_MODEL)
-        )
-        self.emb_cache_store = LocalFileStore(config.get(CVN_EMBEDDING_CACHE))
-        self.embeddings = CacheBackedEmbeddings.from_bytes_store(
-            underlying_embeddings, self.emb_cache_store,
-            namespace=underlying_embeddings.model
-        )
+        self.embeddings = make_cached_embeddings(config)
         self._init_vector_store(config)
         self.llm = ChatOpenAI(
             model=config.get(CVN_MODEL),
@@ -35,37 +24,7 @@ class BaseRAG:
         self._init_chain(config)
 
     def _init_vector_store(self, config: RAGConfig) -> None:
-        collection_name = config.get(CVN_VS_COLLECTION)
-        vs_cache_path = config.get(CVN_VSTORE_CACHE)
-        # If the vector store cache directory exists, we attempt to
-        # read an existing collection.
-        if os.path.isdir(vs_cache_path):
-            log_msg(f"Reading collection '{collection_name}' from "
-                f"existing vector store in '{vs_cache_path}'...")
-            self.vector_store = QdrantVectorStore.from_existing_collection(
-                path=vs_cache_path,
-                collection_name=collection_name,
-                embedding=self.embeddings
-            )
-        else:
-            log_msg(f"Creating new vector store in '{vs_cache_path}', "
-                f"with new collection '{collection_name}'...")
-            client = QdrantClient(path=vs_cache_path)
-            # NB Unfortunately, at time of writing, there does not
-            # seem to be a good way to determine the dimension of
-            # the embedding, so we read that from config, too.
-            client.create_collection(
-                collection_name=collection_name,
-                vectors_config=VectorParams(
-                    size=config.get(CVN_EMBEDDING_DIM),
-                    distance=Distance.COSINE
-                )
-            )
-            self.vector_store = QdrantVectorStore(
-                client=client,
-                collection_name=collection_name,
-                embedding=self.embeddings
-            )
+        self.vector_store = make_vector_store(config, self.embeddings)
 
     def _init_chain(self, config: RAGConfig) -> None:
         prompt = PromptTemplate(
@@ -78,7 +37,8 @@ class BaseRAG:
         retriever = self.vector_store.as_retriever(
             search_type="similarity", # This is the default search type.
             search_kwargs={
-                "k": config.get(CVN_TOP_K) # Defaults to 4, apparently, if not given.
+                "k": config.get(CVN_TOP_K), # Defaults to 4, apparently, if not given.
+                "search_params": make_search_params(config)
             }
         )
         self.chain = (
@@ -0,0 +1,112 @@
+"""
+Benchmark of the packed embedding store against `LocalFileStore`, with
+one JSON file per embedding, on synthetic embeddings: writing, size on
+disk, cold start (opening the store and listing its keys), the one-shot
+migration, and look-ups, singly and in batches. The operating system's
+file cache is not dropped between runs, so cold starts are only cold as
+far as the process is concerned.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from time import perf_counter
+
+import numpy as np
+from langchain.embeddings.cache import _create_key_encoder
+from langchain.storage import LocalFileStore
+from langchain_core.stores import ByteStore
+
+from embeddingstore import SQLiteByteStore, decode_vector, encode_vector
+from embeddingstore import migrate_embedding_directory
+
+NUM_EMBEDDINGS = 5000
+DIMENSION = 3072
+NAMESPACE = "text-embedding-3-large"
+BATCH_SIZE = 32
+NUM_LOOKUPS = 2000
+
+def disk_usage(path: str) -> tuple[int, int]:
+    """
+    Returns the total size in bytes, and the number of files, of the
+    given file or directory.
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path), 1
+    sizes = [os.path.getsize(os.path.join(root, f))
+        for root, _, files in os.walk(path) for f in files]
+    return sum(sizes), len(sizes)
+
+def time_lookups(store: ByteStore, keys: list[str], decode,
+    batch_size: int) -> float:
+    """
+    Returns the number of embeddings looked up and decoded per second,
+    in random batches of the given size.
+    """
+    rng = np.random.default_rng(0)
+    t_start = perf_counter()
+    for _ in range(NUM_LOOKUPS // batch_size):
+        batch = [keys[i] for i in rng.integers(len(keys), size=batch_size)]
+        for v in store.mget(batch):
+            decode(v)
+    return (NUM_LOOKUPS // batch_size) * batch_size / (perf_counter()-t_start)
+
+def main():
+    """
+    Runs the benchmark and prints the results for both stores.
+    """
+    rng = np.random.default_rng(0)
+    key_encoder = _create_key_encoder(NAMESPACE)
+    keys = [key_encoder(f"Rede {i}") for i in range(NUM_EMBEDDINGS)]
+    vectors = rng.standard_normal((NUM_EMBEDDINGS, DIMENSION),
+        dtype=np.float32).tolist()
+    root = tempfile.mkdtemp()
+    directory = os.path.join(root, "embeddings")
+    filename = os.path.join(root, "embeddings.sqlite")
+    stores = {
+        "files": (lambda: LocalFileStore(directory), directory,
+            lambda v: json.dumps(v).encode(),
+            lambda b: json.loads(b.decode())),
+        "packed": (lambda: SQLiteByteStore(filename), filename,
+            encode_vector, decode_vector),
+    }
+    results: dict[str, dict[str, str]] = {}
+    try:
+        for name, (make_store, path, encode, decode) in stores.items():
+            r = results[name] = {}
+            store = make_store()
+            t_start = perf_counter()
+            for start in range(0, NUM_EMBEDDINGS, BATCH_SIZE):
+                store.mset([(k, encode(v)) for k, v in zip(
+                    keys[start:start+BATCH_SIZE],
+                    vectors[start:start+BATCH_SIZE])])
+            r["Write /s"] = f"{NUM_EMBEDDINGS/(perf_counter()-t_start):.0f}"
+            size, num_files = disk_usage(path)
+            r["Size MB"] = f"{size/1e6:.1f}"
+            r["Files"] = str(num_files)
+            t_start = perf_counter()
+            store = make_store()
+            num_keys = sum(1 for _ in store.yield_keys())
+            r["Cold start ms"] = f"{(perf_counter()-t_start)*1000:.1f}"
+            assert num_keys == NUM_EMBEDDINGS
+            r["Lookup /s"] = f"{time_lookups(store, keys, decode, 1):.0f}"
+            r[f"Batch {BATCH_SIZE} /s"] = (
+                f"{time_lookups(store, keys, decode, BATCH_SIZE):.0f}")
+        os.remove(filename)
+        t_start = perf_counter()
+        migrated = SQLiteByteStore(filename)
+        migrate_embedding_directory(directory, migrated)
+        migration = perf_counter() - t_start
+    finally:
+        shutil.rmtree(root)
+
+    print(f"{NUM_EMBEDDINGS} embeddings of dimension {DIMENSION}")
+    print(f"{'':<16}" + "".join(f"{name:>12}" for name in results))
+    for metric in results["files"]:
+        print(f"{metric:<16}"
+            + "".join(f"{r[metric]:>12}" for r in results.values()))
+    print(f"Migration of files to packed store: {migration:.2f} s")
+
+if __name__ == "__main__":
+    main()
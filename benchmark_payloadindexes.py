@@ -0,0 +1,111 @@
+"""
+Benchmark of filtered vector searches with and without payload indexes
+on the speech metadata fields, on a synthetic collection of speech-like
+points. Payload indexes only take effect on a Qdrant server, so the
+benchmark uses the server at `QDRANT_URL` if it is reachable, and a
+local in-memory store otherwise, in which case both runs scan all points.
+"""
+
+from time import perf_counter
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+from qdrant_client.http.models import Distance, PointStruct, VectorParams
+
+from vectorstore import ensure_payload_indexes, is_local, metadata_key
+
+QDRANT_URL = "http://localhost:6333"
+COLLECTION_NAME = "benchmark_payload_indexes"
+NUM_POINTS = 10000
+DIMENSION = 256
+NUM_QUERIES = 10
+TOP_K = 30
+BATCH_SIZE = 1000
+
+PARTIES = ["SPD", "CDU/CSU", "BÜNDNIS 90/DIE GRÜNEN", "FDP", "AfD",
+    "DIE LINKE", ""]
+READINGS = ["", "1.", "2.", "3.", "2./3."]
+
+def make_payload(i: int) -> dict:
+    """
+    Returns metadata resembling that of speeches loaded by
+    `SpeechKGLoader`.
+    """
+    return {"page_content": f"Rede {i}", "metadata": {
+        "ID": f"ID20{i:07d}",
+        "Datum": f"{2017 + i % 8}-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+        "Wahlperiode": str(19 + i % 2),
+        "Sitzungnr": str(i % 200 + 1),
+        "Redner": f"Vorname{i % 700} Nachname{i % 700}",
+        "Fraktion": PARTIES[i % len(PARTIES)],
+        "Lesung": READINGS[i % len(READINGS)],
+    }}
+
+def make_filters() -> dict[str, models.Filter]:
+    return {
+        "date range": models.Filter(must=[models.FieldCondition(
+            key=metadata_key("Datum"), range=models.DatetimeRange(
+                gte="2023-03-01", lte="2023-04-30"))]),
+        "party": models.Filter(must=[models.FieldCondition(
+            key=metadata_key("Fraktion"),
+            match=models.MatchValue(value="FDP"))]),
+        "speaker": models.Filter(must=[models.FieldCondition(
+            key=metadata_key("Redner"),
+            match=models.MatchValue(value="Vorname42 Nachname42"))]),
+        "date and party": models.Filter(must=[
+            models.FieldCondition(key=metadata_key("Datum"),
+                range=models.DatetimeRange(gte="2021-01-01")),
+            models.FieldCondition(key=metadata_key("Fraktion"),
+                match=models.MatchAny(any=["SPD", "AfD"]))]),
+    }
+
+def make_client() -> QdrantClient:
+    try:
+        client = QdrantClient(url=QDRANT_URL)
+        client.get_collections()
+        return client
+    except Exception:
+        print(f"No Qdrant server at '{QDRANT_URL}', using a local "
+            "in-memory store, which ignores payload indexes.")
+        return QdrantClient(":memory:")
+
+def time_searches(client: QdrantClient, queries: np.ndarray,
+    search_filter: models.Filter) -> float:
+    t_start = perf_counter()
+    for q in queries:
+        client.query_points(COLLECTION_NAME, query=q.tolist(),
+            query_filter=search_filter, limit=TOP_K)
+    return (perf_counter() - t_start) / len(queries)
+
+def main():
+    """
+    Runs the benchmark and prints the mean search latencies.
+    """
+    client = make_client()
+    rng = np.random.default_rng(0)
+    if client.collection_exists(COLLECTION_NAME):
+        client.delete_collection(COLLECTION_NAME)
+    client.create_collection(COLLECTION_NAME, vectors_config=VectorParams(
+        size=DIMENSION, distance=Distance.COSINE))
+    for start in range(0, NUM_POINTS, BATCH_SIZE):
+        vectors = rng.standard_normal((BATCH_SIZE, DIMENSION),
+            dtype=np.float32)
+        client.upsert(COLLECTION_NAME, points=[
+            PointStruct(id=start+i, vector=v.tolist(),
+                payload=make_payload(start+i))
+            for i, v in enumerate(vectors)], wait=True)
+    queries = rng.standard_normal((NUM_QUERIES, DIMENSION), dtype=np.float32)
+    filters = make_filters()
+    before = {name: time_searches(client, queries, f)
+        for name, f in filters.items()}
+    ensure_payload_indexes(client, COLLECTION_NAME)
+    after = {name: time_searches(client, queries, f)
+        for name, f in filters.items()}
+    print(f"{NUM_POINTS} points, {'local' if is_local(client) else 'server'}")
+    print(f"{'Filter':<16}{'No index ms':>14}{'Indexed ms':>14}")
+    for name in filters:
+        print(f"{name:<16}{before[name]*1000:>14.2f}{after[name]*1000:>14.2f}")
+    client.delete_collection(COLLECTION_NAME)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Benchmark of vector quantisation of the speech collection against exact
+searches on the original float32 vectors, on synthetic, clustered
+embedding-like vectors. Recall and vector memory are determined by
+emulating Qdrant's scalar (int8) and binary quantisation, with
+oversampling and rescoring, in numpy. Search latencies are measured on
+the Qdrant server at `QDRANT_URL`, if it is reachable, as local stores
+ignore quantisation.
+"""
+
+from time import perf_counter, sleep
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+from qdrant_client.http.models import Distance, PointStruct, VectorParams
+
+from vectorstore import VQ_BINARY, VQ_NONE, VQ_SCALAR
+from vectorstore import make_quantization_config
+
+QDRANT_URL = "http://localhost:6333"
+COLLECTION_PREFIX = "benchmark_quantization_"
+NUM_POINTS = 10000
+DIMENSION = 3072
+NUM_CLUSTERS = 100
+NUM_QUERIES = 50
+TOP_K = 30
+OVERSAMPLINGS = [1.0, 2.0, 4.0]
+BATCH_SIZE = 500
+SCALAR_QUANTILE = 0.99
+
+def make_vectors(rng: np.random.Generator, num: int,
+    centres: np.ndarray) -> np.ndarray:
+    """
+    Returns normalised vectors scattered around the given centres, as
+    the embeddings of speeches on a limited number of topics are.
+    """
+    vectors = (centres[rng.integers(len(centres), size=num)]
+        + 0.7*rng.standard_normal((num, DIMENSION), dtype=np.float32))
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Returns the indices of the k highest scores in each row.
+    """
+    return np.argpartition(-scores, k-1, axis=1)[:, :k]
+
+def scalar_scores(points: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """
+    Returns the approximate scores of the points quantised to int8
+    between the lower and upper quantiles of their values.
+    """
+    low, high = np.quantile(points, [1-SCALAR_QUANTILE, SCALAR_QUANTILE])
+    scale = (high-low) / 255
+    codes = np.round((np.clip(points, low, high)-low) / scale).astype(np.uint8)
+    return queries @ (codes.astype(np.float32)*scale + low).T
+
+def binary_scores(points: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """
+    Returns the approximate scores of the points quantised to one bit
+    per dimension, i.e. the number of matching signs of the query.
+    """
+    return np.sign(queries) @ np.sign(points).T
+
+def rescored_search(approx_scores: np.ndarray, points: np.ndarray,
+    queries: np.ndarray, oversampling: float) -> np.ndarray:
+    """
+    Returns the indices of the top k points by rescoring the top
+    candidates by approximate score with the original vectors.
+    """
+    candidates = top_k(approx_scores, int(TOP_K*oversampling))
+    exact = np.einsum("qd,qcd->qc", queries, points[candidates])
+    best = top_k(exact, TOP_K)
+    return np.take_along_axis(candidates, best, axis=1)
+
+def recall(found: np.ndarray, expected: np.ndarray) -> float:
+    return np.mean([len(set(f) & set(e)) / TOP_K
+        for f, e in zip(found, expected)])
+
+def make_server_client() -> QdrantClient | None:
+    try:
+        client = QdrantClient(url=QDRANT_URL)
+        client.get_collections()
+        return client
+    except Exception:
+        return None
+
+def time_server_searches(client: QdrantClient, points: np.ndarray,
+    queries: np.ndarray, expected: np.ndarray
+) -> dict[str, tuple[float, float]]:
+    """
+    Returns the mean search latency and recall by quantisation mode on
+    the server, with the highest oversampling.
+    """
+    results = {}
+    for mode in [VQ_NONE, VQ_SCALAR, VQ_BINARY]:
+        name = COLLECTION_PREFIX + mode
+        if client.collection_exists(name):
+            client.delete_collection(name)
+        quantization_config = make_quantization_config(mode)
+        client.create_collection(name, vectors_config=VectorParams(
+            size=DIMENSION, distance=Distance.COSINE,
+            on_disk=quantization_config is not None),
+            quantization_config=quantization_config)
+        for start in range(0, len(points), BATCH_SIZE):
+            client.upsert(name, points=[PointStruct(id=start+i,
+                vector=v.tolist()) for i, v in enumerate(
+                    points[start:start+BATCH_SIZE])], wait=True)
+        while (client.get_collection(name).status
+            != models.CollectionStatus.GREEN):
+            sleep(1)
+        search_params = None if quantization_config is None else (
+            models.SearchParams(quantization=models.QuantizationSearchParams(
+                rescore=True, oversampling=OVERSAMPLINGS[-1])))
+        found = []
+        t_start = perf_counter()
+        for q in queries:
+            found.append([p.id for p in client.query_points(name,
+                query=q.tolist(), search_params=search_params,
+                limit=TOP_K).points])
+        latency = (perf_counter() - t_start) / len(queries)
+        results[mode] = (latency, recall(np.array(found), expected))
+        client.delete_collection(name)
+    return results
+
+def main():
+    """
+    Runs the benchmark and prints recall, vector memory and, given a
+    server, search latencies by quantisation mode.
+    """
+    rng = np.random.default_rng(0)
+    centres = rng.standard_normal((NUM_CLUSTERS, DIMENSION), dtype=np.float32)
+    points = make_vectors(rng, NUM_POINTS, centres)
+    queries = make_vectors(rng, NUM_QUERIES, centres)
+    t_start = perf_counter()
+    expected = top_k(queries @ points.T, TOP_K)
+    exact_duration = (perf_counter() - t_start) / NUM_QUERIES
+
+    print(f"{NUM_POINTS} points of dimension {DIMENSION}, top {TOP_K}")
+    print(f"Exact float32 search (numpy): {exact_duration*1000:.2f} ms/query")
+    memory = {VQ_NONE: 4*DIMENSION, VQ_SCALAR: DIMENSION,
+        VQ_BINARY: DIMENSION // 8}
+    approx = {VQ_SCALAR: scalar_scores(points, queries),
+        VQ_BINARY: binary_scores(points, queries)}
+    print(f"{'Mode':<8}{'RAM MB':>10}"
+        + "".join(f"{f'Recall x{o:g}':>12}" for o in OVERSAMPLINGS))
+    print(f"{VQ_NONE:<8}{memory[VQ_NONE]*NUM_POINTS/1e6:>10.1f}"
+        + "".join(f"{1.0:>12.3f}" for _ in OVERSAMPLINGS))
+    for mode, scores in approx.items():
+        recalls = [recall(rescored_search(scores, points, queries, o),
+            expected) for o in OVERSAMPLINGS]
+        print(f"{mode:<8}{memory[mode]*NUM_POINTS/1e6:>10.1f}"
+            + "".join(f"{r:>12.3f}" for r in recalls))
+
+    client = make_server_client()
+    if client is None:
+        print(f"No Qdrant server at '{QDRANT_URL}', so no search latencies "
+            "are measured, as local stores ignore quantisation.")
+        return
+    print(f"Qdrant server, oversampling x{OVERSAMPLINGS[-1]:g}")
+    print(f"{'Mode':<8}{'Latency ms':>12}{'Recall':>10}")
+    for mode, (latency, r) in time_server_searches(client, points, queries,
+        expected).items():
+        print(f"{mode:<8}{latency*1000:>12.2f}{r:>10.3f}")
+    client.close()
+
+if __name__ == "__main__":
+    main()
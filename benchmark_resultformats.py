@@ -0,0 +1,105 @@
+"""
+Benchmark of the SPARQL JSON, TSV and CSV result formats for bulk
+reads, in terms of bytes transferred and time taken to parse the
+result into rows, per 100k rows of synthetic speech-like results.
+"""
+
+import csv
+import io
+import json
+from time import perf_counter
+
+from sparqlresults import RF_JSON, RF_TSV, RF_CSV, parse_tabular_result
+from sparqlresults import tabular_from_json
+
+NUM_ROWS = 100000
+NUM_REPEATS = 3
+
+VARS = ["r", "ID", "Datum", "Fraktion", "Text"]
+XSD_DATE = "http://www.w3.org/2001/XMLSchema#date"
+
+def make_bindings(n: int) -> list[dict]:
+    """
+    Returns result bindings resembling those of the speech query of
+    `SpeechKGLoader`, in SPARQL JSON form.
+    """
+    parties = ["SPD", "CDU/CSU", "BÜNDNIS 90/DIE GRÜNEN", "FDP", "AfD"]
+    bindings = []
+    for i in range(n):
+        bindings.append({
+            "r": {"type": "uri", "value":
+                f"https://www.theworldavatar.com/kg/ontoparlamentsdebatten/Rede_{i}"},
+            "ID": {"type": "literal", "value": f"ID20{i:07d}"},
+            "Datum": {"type": "literal", "datatype": XSD_DATE,
+                "value": f"2023-{i % 12 + 1:02d}-{i % 28 + 1:02d}"},
+            "Fraktion": {"type": "literal", "value": parties[i % len(parties)]},
+            "Text": {"type": "literal", "xml:lang": "de", "value":
+                f"Sehr geehrte Frau Präsidentin! Rede Nummer {i} zum \"Thema\" "
+                "Rente,\tmit Tabulator und\nZeilenumbruch."},
+        })
+    return bindings
+
+def to_json(bindings: list[dict]) -> str:
+    return json.dumps({"head": {"vars": VARS},
+        "results": {"bindings": bindings}})
+
+def _tsv_term(b: dict | None) -> str:
+    if b is None:
+        return ""
+    if b["type"] == "uri":
+        return f"<{b['value']}>"
+    value = (b["value"].replace("\\", "\\\\").replace('"', '\\"')
+        .replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r"))
+    if "xml:lang" in b:
+        return f'"{value}"@{b["xml:lang"]}'
+    if "datatype" in b:
+        return f'"{value}"^^<{b["datatype"]}>'
+    return f'"{value}"'
+
+def to_tsv(bindings: list[dict]) -> str:
+    lines = ["\t".join(f"?{v}" for v in VARS)]
+    for b in bindings:
+        lines.append("\t".join(_tsv_term(b.get(v)) for v in VARS))
+    return "\n".join(lines) + "\n"
+
+def to_csv(bindings: list[dict]) -> str:
+    out = io.StringIO(newline="")
+    writer = csv.writer(out, lineterminator="\r\n")
+    writer.writerow(VARS)
+    for b in bindings:
+        writer.writerow([b[v]["value"] if v in b else "" for v in VARS])
+    return out.getvalue()
+
+def parse(text: str, result_format: str):
+    if result_format == RF_JSON:
+        return tabular_from_json(json.loads(text))
+    return parse_tabular_result(text, result_format)
+
+def main():
+    """
+    Runs the benchmark and prints the results.
+    """
+    bindings = make_bindings(NUM_ROWS)
+    texts = {RF_JSON: to_json(bindings), RF_TSV: to_tsv(bindings),
+        RF_CSV: to_csv(bindings)}
+    reference = None
+    print(f"{'Format':<8}{'MB/100k rows':>14}{'Parse s/100k rows':>20}")
+    for result_format, text in texts.items():
+        size = len(text.encode("utf-8"))
+        durations = []
+        for _ in range(NUM_REPEATS):
+            t_start = perf_counter()
+            result = parse(text, result_format)
+            durations.append(perf_counter() - t_start)
+        # All formats must yield the same rows.
+        if reference is None:
+            reference = result.rows
+        elif result.rows != reference:
+            raise ValueError(f"Rows parsed from {result_format} differ "
+                "from those parsed from JSON!")
+        scale = 100000 / NUM_ROWS
+        print(f"{result_format:<8}{size*scale/1e6:>14.2f}"
+            f"{min(durations)*scale:>20.3f}")
+
+if __name__ == "__main__":
+    main()
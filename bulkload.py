@@ -0,0 +1,183 @@
+"""
+Bulk loading of N-Triples and Turtle files into a remote SPARQL store,
+in chunks posted over several connections in parallel.
+"""
+
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor
+from concurrent.futures import wait
+from time import perf_counter, sleep
+from typing import Callable, Iterator
+
+import requests
+from rdflib import Graph
+
+from common import ES_UTF_8, log_msg
+from storeclient import PooledStoreClient, make_store_client
+from ragconfig import RAGConfig, CVN_ENDPOINT, CVN_BULK_LOAD_CHUNK_SIZE
+from ragconfig import CVN_BULK_LOAD_MODE, CVN_BULK_LOAD_RETRIES
+from ragconfig import CVN_BULK_LOAD_WORKERS, make_arg_parser
+
+# Bulk load modes
+BLM_GSP    = "gsp"    # Chunks posted as N-Triples (Graph Store Protocol)
+BLM_UPDATE = "update" # Chunks sent as INSERT DATA updates
+
+# Delay in seconds before the first retry of a failed chunk, which is
+# doubled for each further retry
+RETRY_BACKOFF = 1.0
+
+def iter_triple_chunks(filename: str,
+    chunk_size: int) -> Iterator[list[str]]:
+    """
+    Returns an iterator over chunks of at most the given number of
+    triples from the given file, in N-Triples syntax, one per line.
+    N-Triples files (ending in `.nt`) are streamed line by line, whereas
+    files in other formats, e.g. Turtle, are parsed as a whole first.
+    NB Blank node labels are only meaningful within a chunk, as each
+    chunk is loaded by a separate request.
+    """
+    chunk: list[str] = []
+    if filename.endswith(".nt"):
+        with open(filename, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line == "" or line.startswith("#"):
+                    continue
+                chunk.append(line)
+                if len(chunk) == chunk_size:
+                    yield chunk
+                    chunk = []
+    else:
+        g = Graph()
+        g.parse(filename)
+        for s, p, o in g:
+            chunk.append(f"{s.n3()} {p.n3()} {o.n3()} .")
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+class BulkLoader:
+    """
+    Loads files into the store of the given client in chunks of the
+    given number of triples, which are either posted as N-Triples as per
+    the Graph Store Protocol, or sent as INSERT DATA updates. Up to the
+    given number of chunks are in flight at a time, and failed chunks
+    are retried up to the given number of times, with exponential
+    backoff, unless the store rejected the chunk itself.
+    """
+
+    def __init__(self, store_client: PooledStoreClient, mode: str = BLM_GSP,
+        chunk_size: int = 10000, max_workers: int = 4, max_retries: int = 3,
+        graph_store_url: str | None = None) -> None:
+        if mode not in [BLM_GSP, BLM_UPDATE]:
+            raise ValueError(f"Unsupported bulk load mode '{mode}'!")
+        self.store_client = store_client
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.graph_store_url = graph_store_url
+
+    def _send(self, chunk: list[str]) -> None:
+        if self.mode == BLM_GSP:
+            self.store_client.post_rdf(("\n".join(chunk)+"\n").encode("utf-8"),
+                url=self.graph_store_url)
+        else:
+            self.store_client.update(
+                "INSERT DATA {\n" + "\n".join(chunk) + "\n}")
+
+    def _load_chunk(self, chunk: list[str]) -> int:
+        for attempt in range(self.max_retries+1):
+            try:
+                self._send(chunk)
+                return len(chunk)
+            except requests.RequestException as e:
+                if (attempt == self.max_retries or (
+                    isinstance(e, requests.HTTPError)
+                    and e.response is not None
+                    and e.response.status_code < 500)):
+                    raise
+                log_msg(f"Loading chunk failed ({e}), retrying.",
+                    level=logging.WARN)
+                sleep(RETRY_BACKOFF*2**attempt)
+        return 0
+
+    def load(self, filename: str,
+        on_progress: Callable[[int, float], None] | None = None) -> int:
+        """
+        Loads the given file, and returns the number of triples loaded.
+        After each chunk, the given callback, if any, is passed the number
+        of triples loaded so far and the time taken so far in seconds.
+        If a chunk cannot be loaded, the remaining chunks are abandoned,
+        and the error is raised.
+        """
+        t_start = perf_counter()
+        loaded = 0
+        in_flight: set[Future] = set()
+
+        def collect(return_when: str) -> None:
+            nonlocal loaded, in_flight
+            done, in_flight = wait(in_flight, return_when=return_when)
+            for f in done:
+                loaded += f.result()
+                if on_progress is not None:
+                    on_progress(loaded, perf_counter()-t_start)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            try:
+                for chunk in iter_triple_chunks(filename, self.chunk_size):
+                    # NB Bounding the number of chunks in flight bounds
+                    # memory use for files streamed from disk.
+                    while len(in_flight) >= 2*self.max_workers:
+                        collect(FIRST_COMPLETED)
+                    in_flight.add(executor.submit(self._load_chunk, chunk))
+                while len(in_flight) > 0:
+                    collect(FIRST_COMPLETED)
+            except BaseException:
+                for f in in_flight:
+                    f.cancel()
+                raise
+        return loaded
+
+def make_bulk_loader(config: RAGConfig,
+    store_client: PooledStoreClient) -> BulkLoader:
+    """
+    Returns a bulk loader for the given store client, with mode, chunk
+    size, parallelism and retries as configured.
+    """
+    return BulkLoader(store_client,
+        mode=config.get_or_default(CVN_BULK_LOAD_MODE, BLM_GSP),
+        chunk_size=config.get_or_default(CVN_BULK_LOAD_CHUNK_SIZE, 10000),
+        max_workers=config.get_or_default(CVN_BULK_LOAD_WORKERS, 4),
+        max_retries=config.get_or_default(CVN_BULK_LOAD_RETRIES, 3))
+
+def main():
+    """
+    Loads the N-Triples or Turtle files given on the command line into
+    the configured endpoint.
+    """
+    parser = make_arg_parser("Loads RDF files into the configured endpoint.")
+    parser.add_argument("files", nargs="+",
+        help="N-Triples (.nt) or Turtle files")
+    args = parser.parse_args()
+    logging.basicConfig(filename="bulkload.log", encoding=ES_UTF_8,
+        level=logging.INFO)
+    config = RAGConfig(args.config)
+    config.check()
+    store_client = make_store_client(config, config.get(CVN_ENDPOINT))
+    loader = make_bulk_loader(config, store_client)
+
+    def report(loaded: int, duration: float) -> None:
+        log_msg(f"{loaded} triples loaded "
+            f"({loaded/max(duration, 1e-9):.0f} triples/s).")
+
+    for filename in args.files:
+        log_msg(f"Loading '{filename}'...")
+        loaded = loader.load(filename, on_progress=report)
+        log_msg(f"Loaded {loaded} triples from '{filename}'.")
+    store_client.close()
+
+if __name__ == "__main__":
+    main()
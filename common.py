@@ -5,7 +5,7 @@ import logging
 from rdflib import Namespace, URIRef
 
 from CommonNamespaces import *
-from storeclient import StoreClient
+from storeclient import StoreClient, AsyncStoreClient, gather_queries
 from SPARQLBuilder import SPARQLSelectBuilder, make_prefix_str, makeVarRef, makeIRIRef
 
 logger = logging.getLogger(__name__)
@@ -217,21 +217,37 @@ def assemble_schema_description(prefixes: str, classes: str,
         f"{dtps}\n"
     )
 
-def get_store_schema(sc: StoreClient, prefixes: dict[str, str]) -> str:
+def _describe_store_schema(prefixes: dict[str, str], classes: list[dict],
+    ops: list[dict], dtps: list[dict]) -> str:
     prefixes_str = "\n".join(
         make_prefix_str(p, prefixes[p]) for p in prefixes)
-    classes = sc.query(CLS_OWL_TBOX_QUERY)["results"]["bindings"]
     classes_str = "\n".join([_describe_iri(r, prefixes) for r in classes])
-    op_owl_tbox_query = make_prop_tbox_query("owl:ObjectProperty")
-    ops = sc.query(op_owl_tbox_query)["results"]["bindings"]
     ops_str = "\n".join([_describe_iri(r, prefixes) for r in ops])
-    dp_owl_tbox_query = make_prop_tbox_query("owl:DatatypeProperty")
-    dtps = sc.query(dp_owl_tbox_query)["results"]["bindings"]
     dtps_str = "\n".join(
         [_describe_iri(r, prefixes, include_range=False) for r in dtps])
     return assemble_schema_description(
         prefixes_str, classes_str, ops_str, dtps_str)
 
+def _make_schema_queries() -> list[str]:
+    return [CLS_OWL_TBOX_QUERY,
+        make_prop_tbox_query("owl:ObjectProperty"),
+        make_prop_tbox_query("owl:DatatypeProperty")]
+
+def get_store_schema(sc: StoreClient, prefixes: dict[str, str]) -> str:
+    classes, ops, dtps = [sc.query(q)["results"]["bindings"]
+        for q in _make_schema_queries()]
+    return _describe_store_schema(prefixes, classes, ops, dtps)
+
+async def aget_store_schema(asc: AsyncStoreClient,
+    prefixes: dict[str, str]) -> str:
+    """
+    Asynchronous version of `get_store_schema`, which issues the schema
+    queries concurrently.
+    """
+    classes, ops, dtps = [r["results"]["bindings"]
+        for r in await gather_queries(asc, _make_schema_queries())]
+    return _describe_store_schema(prefixes, classes, ops, dtps)
+
 def get_parliamentary_groups(sc: StoreClient) -> list[str]:
     """
     Queries store and returns a list containing the short name
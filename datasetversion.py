@@ -0,0 +1,78 @@
+"""
+Cheap probing of the version of the data underlying the RAG system, in
+order to invalidate cached results whenever that data changes.
+"""
+
+import asyncio
+import logging
+import threading
+from time import monotonic
+
+from langchain_qdrant import QdrantVectorStore
+
+from common import log_msg
+from storeclient import StoreClient
+
+TRIPLE_COUNT_QUERY = "SELECT (COUNT(*) AS ?n) WHERE { ?s ?p ?o }"
+
+class DatasetVersionProbe:
+    """
+    Determines a version string of the dataset from the number of
+    triples in the knowledge graph and, optionally, the number of points
+    in the vector store collection. The version is probed at most once
+    per given interval (in seconds), and remembered in between.
+    """
+
+    def __init__(self, store_client: StoreClient,
+        vector_store: QdrantVectorStore | None = None,
+        interval: float = 300.0) -> None:
+        self.store_client = store_client
+        self.vector_store = vector_store
+        self.interval = interval
+        self._version: str | None = None
+        self._probed_at = 0.0
+        self._lock = threading.Lock()
+
+    def _probe(self) -> str:
+        try:
+            reply = self.store_client.query(TRIPLE_COUNT_QUERY)
+            parts = [reply["results"]["bindings"][0]["n"]["value"]]
+            if self.vector_store is not None:
+                parts.append(str(self.vector_store.client.get_collection(
+                    self.vector_store.collection_name).points_count))
+        except Exception as e:
+            # If the data cannot be probed, keep the last known version,
+            # rather than invalidate everything.
+            log_msg(f"Error probing dataset version: {e}",
+                level=logging.WARN)
+            return self._version if self._version is not None else ""
+        return ":".join(parts)
+
+    def _is_due(self) -> bool:
+        return (self._version is None
+            or monotonic() - self._probed_at >= self.interval)
+
+    def get(self) -> str:
+        """
+        Returns the current dataset version, probing it if due.
+        """
+        with self._lock:
+            if self._is_due():
+                self._version = self._probe()
+                self._probed_at = monotonic()
+            return self._version
+
+    async def aget(self) -> str:
+        """
+        Asynchronous version of `get`, which probes in a worker thread.
+        """
+        if not self._is_due():
+            return self._version
+        return await asyncio.to_thread(self.get)
+
+    def invalidate(self) -> None:
+        """
+        Forces the version to be probed again on the next request.
+        """
+        with self._lock:
+            self._version = None
@@ -7,6 +7,7 @@ from langchain_core.documents import Document
 
 from common import *
 from storeclient import StoreClient
+from sparqlresults import RF_CSV
 
 class DebateLoader(BaseLoader):
     """
@@ -126,29 +127,34 @@ class SpeechKGLoader(BaseLoader):
                 '}'
             )
         try:
-            speeches = self.store_client.query(qstr)["results"]["bindings"]
+            # NB Speech texts make up most of the result, so the most
+            # compact result format is used. It does not distinguish
+            # unbound variables from empty literals, but neither do we.
+            speeches = self.store_client.query_rows(qstr,
+                result_format=RF_CSV)
         except Exception as e:
             raise RuntimeError("Error querying speeches from store client!") from e
 
+        col = speeches.index
         for speech in speeches:
             if self.period is None or self.session is None:
-                period = speech[period_var_name]["value"]
-                session = speech[session_var_name]["value"]
+                period = speech[col[period_var_name]]
+                session = speech[col[session_var_name]]
             else:
                 period = self.period
                 session = self.session
             metadata = {
-                id_var_name: speech[id_var_name]["value"],
-                date_var_name: speech[date_var_name]["value"],
+                id_var_name: speech[col[id_var_name]],
+                date_var_name: speech[col[date_var_name]],
                 period_var_name: period,
                 session_var_name: session,
-                reading_var_name: speech[reading_var_name]["value"]
-                    if reading_var_name in speech else "",
+                reading_var_name: speech[col[reading_var_name]]
+                    if reading_var_name in col else "",
                 speaker_var_name: " ".join(
-                    [speech[givenname_var_name]["value"], speech[surname_var_name]["value"]]
+                    [speech[col[givenname_var_name]], speech[col[surname_var_name]]]
                 ),
-                party_var_name: speech[party_var_name]["value"]
-                    if party_var_name in speech else ""
+                party_var_name: speech[col[party_var_name]]
+                    if party_var_name in col else ""
             }
-            yield Document(page_content=speech[text_var_name]["value"],
+            yield Document(page_content=speech[col[text_var_name]],
                 metadata=metadata)
@@ -0,0 +1,143 @@
+"""
+Caching of embeddings, shared by the various RAG systems.
+"""
+
+import threading
+from collections import OrderedDict
+
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.embeddings.cache import _create_key_encoder
+from langchain.storage import EncoderBackedStore
+
+from common import RAGError
+from embeddingstore import decode_vector, encode_vector, make_embedding_store
+from ragconfig import RAGConfig, CVN_EMBEDDING_MODEL, CVN_EMBEDDING_DIM
+from ragconfig import CVN_QUERY_EMB_CACHE_SIZE, CVN_QUERY_EMB_PERSISTENT
+
+# Native dimensions of embedding models
+NATIVE_EMBEDDING_DIMS = {
+    "text-embedding-3-large": 3072,
+    "text-embedding-3-small": 1536,
+    "text-embedding-ada-002": 1536,
+}
+
+# Embedding models that can return shortened (Matryoshka) embeddings
+SHORTENABLE_EMBEDDING_MODELS = {
+    "text-embedding-3-large",
+    "text-embedding-3-small",
+}
+
+def embedding_dimensions(config: RAGConfig) -> int | None:
+    """
+    Returns the configured dimension of embeddings, if it differs from
+    the native dimension of the configured model, i.e. if shortened
+    embeddings are to be requested, and `None` otherwise. Raises an
+    error if the model cannot return embeddings of that dimension.
+    """
+    model = config.get(CVN_EMBEDDING_MODEL)
+    native_dim = NATIVE_EMBEDDING_DIMS.get(model)
+    dim = config.get_or_default(CVN_EMBEDDING_DIM, native_dim)
+    if native_dim is None or dim == native_dim:
+        return None
+    if model not in SHORTENABLE_EMBEDDING_MODELS:
+        raise RAGError(f"Embedding model '{model}' does not support "
+            f"shortened embeddings, so '{CVN_EMBEDDING_DIM}' must be "
+            f"{native_dim}, not {dim}!")
+    if not 0 < dim < native_dim:
+        raise RAGError(f"'{CVN_EMBEDDING_DIM}' must be between 1 and "
+            f"{native_dim} for embedding model '{model}', not {dim}!")
+    return dim
+
+def embedding_namespace(model: str, dimensions: int | None = None) -> str:
+    """
+    Returns the namespace of cached embeddings of the given model, and
+    the given dimension, if these are shortened. Embeddings of the
+    model's native dimension keep the model name as namespace, such
+    that existing caches remain valid.
+    """
+    return model if dimensions is None else f"{model}-{dimensions}"
+
+class LRUQueryEmbeddings(Embeddings):
+    """
+    Embeddings that keep the most recently used query embeddings in
+    memory, delegating everything else to the underlying embeddings.
+    """
+
+    def __init__(self, underlying_embeddings: Embeddings,
+        max_size: int = 1024) -> None:
+        self.underlying_embeddings = underlying_embeddings
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, text: str) -> list[float] | None:
+        with self._lock:
+            vector = self._cache.get(text)
+            if vector is None:
+                self.misses += 1
+            else:
+                self._cache.move_to_end(text)
+                self.hits += 1
+            return vector
+
+    def _store(self, text: str, vector: list[float]) -> None:
+        with self._lock:
+            self._cache[text] = vector
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.underlying_embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await self.underlying_embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = self._lookup(text)
+        if vector is None:
+            vector = self.underlying_embeddings.embed_query(text)
+            self._store(text, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> list[float]:
+        vector = self._lookup(text)
+        if vector is None:
+            vector = await self.underlying_embeddings.aembed_query(text)
+            self._store(text, vector)
+        return vector
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                "size": len(self._cache)}
+
+def make_cached_embeddings(config: RAGConfig) -> LRUQueryEmbeddings:
+    """
+    Returns embeddings as configured, where document embeddings are
+    cached on disk and query embeddings are cached in memory and,
+    optionally, on disk, too.
+    """
+    # https://platform.openai.com/docs/guides/embeddings/
+    dimensions = embedding_dimensions(config)
+    underlying_embeddings = OpenAIEmbeddings(
+        model=config.get(CVN_EMBEDDING_MODEL),
+        dimensions=dimensions
+    )
+    # NB Unlike `CacheBackedEmbeddings.from_bytes_store`, which stores
+    # vectors as JSON, this keys embeddings in the same way, but stores
+    # vectors as binary blobs, at a fraction of the size.
+    emb_cache_store = EncoderBackedStore(make_embedding_store(config),
+        _create_key_encoder(embedding_namespace(underlying_embeddings.model,
+            dimensions)),
+        encode_vector, decode_vector)
+    embeddings = CacheBackedEmbeddings(underlying_embeddings, emb_cache_store,
+        query_embedding_store=(emb_cache_store if config.get_or_default(
+            CVN_QUERY_EMB_PERSISTENT, True) else None)
+    )
+    return LRUQueryEmbeddings(embeddings,
+        max_size=config.get_or_default(CVN_QUERY_EMB_CACHE_SIZE, 1024))
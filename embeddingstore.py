@@ -0,0 +1,194 @@
+"""
+Packed store of cached embeddings in a single SQLite database file,
+with vectors stored as binary float32 blobs, rather than in one JSON
+file per embedding, as with `LocalFileStore`.
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Iterator, Sequence
+
+import numpy as np
+from langchain.storage import LocalFileStore
+from langchain_core.stores import ByteStore
+
+from common import ES_UTF_8, log_msg
+from ragconfig import RAGConfig, CVN_EMBEDDING_CACHE, CVN_EMBEDDING_CACHE_FILE
+from ragconfig import make_arg_parser
+
+# Cache keys, see `CacheBackedEmbeddings`, are a namespace followed by
+# the UUID of the embedded text.
+CACHE_KEY_PATTERN = re.compile(
+    r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+# Key of the metadata entry recording the completed migration of the
+# embeddings cached in a directory
+MK_MIGRATED_FROM = "migrated_from"
+
+# Maximum number of keys per statement, below SQLite's limit on the
+# number of parameters
+MAX_KEYS_PER_STATEMENT = 500
+
+def encode_vector(vector: Sequence[float]) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+def decode_vector(value: bytes) -> list[float]:
+    return np.frombuffer(value, dtype=np.float32).tolist()
+
+class SQLiteByteStore(ByteStore):
+    """
+    Byte store persisted in a single SQLite database file, which can be
+    shared by threads. Batch operations are carried out by one statement
+    per batch of keys, and one transaction in total.
+    """
+
+    def __init__(self, filename: str) -> None:
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value BLOB) WITHOUT ROWID"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta ("
+            "key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._conn.commit()
+
+    def mget(self, keys: Sequence[str]) -> list[bytes | None]:
+        values: dict[str, bytes] = {}
+        with self._lock:
+            for start in range(0, len(keys), MAX_KEYS_PER_STATEMENT):
+                batch = keys[start:start+MAX_KEYS_PER_STATEMENT]
+                values.update(self._conn.execute(
+                    "SELECT key, value FROM entries WHERE key IN "
+                    f"({', '.join('?'*len(batch))})", batch).fetchall())
+        return [values.get(k) for k in keys]
+
+    def mset(self, key_value_pairs: Sequence[tuple[str, bytes]]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?)",
+                key_value_pairs)
+            self._conn.commit()
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM entries WHERE key = ?",
+                [(k,) for k in keys])
+            self._conn.commit()
+
+    def yield_keys(self, *, prefix: str | None = None) -> Iterator[str]:
+        with self._lock:
+            if prefix is None or prefix == "":
+                rows = self._conn.execute(
+                    "SELECT key FROM entries ORDER BY key").fetchall()
+            else:
+                # NB A range of keys, unlike LIKE, makes use of the index.
+                rows = self._conn.execute(
+                    "SELECT key FROM entries WHERE key >= ? AND key < ? "
+                    "ORDER BY key",
+                    (prefix, prefix[:-1] + chr(ord(prefix[-1])+1))
+                ).fetchall()
+        for row in rows:
+            yield row[0]
+
+    def existing_keys(self, keys: Sequence[str]) -> set[str]:
+        """
+        Returns those of the given keys that have values, without
+        reading the latter.
+        """
+        existing: set[str] = set()
+        with self._lock:
+            for start in range(0, len(keys), MAX_KEYS_PER_STATEMENT):
+                batch = keys[start:start+MAX_KEYS_PER_STATEMENT]
+                existing.update(row[0] for row in self._conn.execute(
+                    "SELECT key FROM entries WHERE key IN "
+                    f"({', '.join('?'*len(batch))})", batch))
+        return existing
+
+    def get_meta(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                (key, value))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+def migrate_embedding_directory(directory: str, store: SQLiteByteStore,
+    batch_size: int = 1000) -> int:
+    """
+    Copies the embeddings cached in the given directory, one JSON file
+    per embedding as written via `LocalFileStore`, into the given store
+    as binary vectors, unless the store has them already, and returns
+    the number of embeddings copied. Other files in the directory, e.g.
+    the store's own, are ignored. Once all embeddings are copied, this
+    is recorded in the store, such that an interrupted migration is
+    resumed, and a completed one is not repeated, by
+    `make_embedding_store`.
+    """
+    file_store = LocalFileStore(directory)
+    keys = [k for k in file_store.yield_keys() if CACHE_KEY_PATTERN.search(k)]
+    num_migrated = 0
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start+batch_size]
+        existing = store.existing_keys(batch)
+        missing = [k for k in batch if k not in existing]
+        if len(missing) > 0:
+            store.mset([(k, encode_vector(json.loads(v.decode())))
+                for k, v in zip(missing, file_store.mget(missing))
+                if v is not None])
+            num_migrated += len(missing)
+        log_msg(f"{start+len(batch)} of {len(keys)} cached embeddings "
+            "checked for migration.", level=logging.DEBUG)
+    store.set_meta(MK_MIGRATED_FROM, os.path.abspath(directory))
+    return num_migrated
+
+def make_embedding_store(config: RAGConfig) -> SQLiteByteStore:
+    """
+    Returns the configured packed store of cached embeddings, which by
+    default is a file in the configured embedding cache directory. Until
+    a migration has completed, any embeddings cached in that directory,
+    one file per embedding, that are missing from the store are
+    migrated to it first.
+    """
+    directory = config.get(CVN_EMBEDDING_CACHE)
+    filename = config.get_or_default(CVN_EMBEDDING_CACHE_FILE,
+        os.path.join(directory, "embeddings.sqlite"))
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    store = SQLiteByteStore(filename)
+    if store.get_meta(MK_MIGRATED_FROM) is None and os.path.isdir(directory):
+        num_migrated = migrate_embedding_directory(directory, store)
+        if num_migrated > 0:
+            log_msg(f"Migrated {num_migrated} cached embeddings from "
+                f"'{directory}' to '{filename}'.")
+    return store
+
+def main():
+    """
+    Migrates the configured embedding cache directory to the packed
+    store, unless this has been completed already.
+    """
+    args = make_arg_parser("Migrates the configured embedding cache "
+        "directory to the packed store.").parse_args()
+    logging.basicConfig(filename="embeddingstore.log", encoding=ES_UTF_8,
+        level=logging.INFO)
+    config = RAGConfig(args.config)
+    make_embedding_store(config).close()
+
+if __name__ == "__main__":
+    main()
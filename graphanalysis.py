@@ -1,4 +1,5 @@
-from storeclient import StoreClient, RemoteStoreClient
+from storeclient import StoreClient, make_store_client
+from sparqlresults import RF_CSV
 from SPARQLBuilder import SPARQLSelectBuilder, makeVarRef, makeIRIRef
 import SPARQLConstants
 from CommonNamespaces import RDF_TYPE, OWL_DATATYPEPROPERTY, OWL_OBJECTPROPERTY
@@ -10,12 +11,8 @@ def get_entity_of_type(sc: StoreClient, t: str) -> list[str]:
     sb.addVar(makeVarRef(entity_var_name))
     sb.addWhere(makeVarRef(entity_var_name),
         makeIRIRef(RDF_TYPE), makeIRIRef(t))
-    reply = sc.query(sb.build())
-    result_bindings = reply["results"]["bindings"]
-    entities = []
-    for b in result_bindings:
-        entities.append(b[entity_var_name]["value"])
-    return entities
+    return sc.query_rows(sb.build(), result_format=RF_CSV).column(
+        entity_var_name)
 
 def get_properties(sc: StoreClient, obj_filter: str=None) -> list[str]:
     sb = SPARQLSelectBuilder()
@@ -28,23 +25,19 @@ def get_properties(sc: StoreClient, obj_filter: str=None) -> list[str]:
         makeVarRef(pred_var_name), makeVarRef(obj_var_name))
     if obj_filter is not None:
         sb.addFilter(f"{obj_filter}({makeVarRef(obj_var_name)})")
-    reply = sc.query(sb.build())
-    result_bindings = reply["results"]["bindings"]
-    properties = []
-    for b in result_bindings:
-        properties.append(b[pred_var_name]["value"])
-    return properties
+    return sc.query_rows(sb.build(), result_format=RF_CSV).column(
+        pred_var_name)
 
 def main():
     config = RAGConfig("config.yaml")
     config.check()
 
     tbox_endpoint = config.get(CVN_TBOX_ENDPOINT)
-    tbox_client = RemoteStoreClient(tbox_endpoint)
+    tbox_client = make_store_client(config, tbox_endpoint)
     tbox_dtps = set(get_entity_of_type(tbox_client, OWL_DATATYPEPROPERTY))
     tbox_ops = set(get_entity_of_type(tbox_client, OWL_OBJECTPROPERTY))
     abox_endpoint = config.get(CVN_ENDPOINT)
-    abox_client = RemoteStoreClient(abox_endpoint)
+    abox_client = make_store_client(config, abox_endpoint)
     abox_dtps = set(get_properties(abox_client,
         obj_filter=SPARQLConstants.ISLITERAL))
     abox_ops = set(get_properties(abox_client,
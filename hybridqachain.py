@@ -1,10 +1,13 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 from langchain.chains.base import Chain
 from langchain.schema.runnable import Runnable
 from langchain_core.callbacks import CallbackManagerForChainRun
+from langchain_core.callbacks import AsyncCallbackManagerForChainRun
 from langchain_core.language_models import BaseLanguageModel
 from langchain_core.prompts.prompt import PromptTemplate
 from langchain_core.prompt_values import StringPromptValue
@@ -18,7 +21,14 @@ from pydantic import Field
 from common import *
 from ragconfig import RAGConfig, CVN_KG_MAX_ITEMS
 from ragconfig import CVN_TOP_K, CVN_THRESHOLD_TOP_K, CVN_THRESHOLD_SCORE
-from storeclient import StoreClient
+from storeclient import StoreClient, AsyncStoreClient
+from stagescheduler import StageScheduler
+from llmcache import LLMResponseCache, cached, get_model_name
+from sparqlanalysis import classify_sparql_query, strip_sparql_keyword
+from sparqlanalysis import limit_sparql_query
+from metadatafilter import DATE_FIELD, field_filters_from_classification
+from metadatafilter import make_metadata_filter
+from vectorstore import make_search_params
 
 class RunnableLogInputs(Runnable):
     """
@@ -32,6 +42,21 @@ class RunnableLogInputs(Runnable):
         log_msg(input_data.to_string(), level=logging.DEBUG)
         return input_data
 
+    async def ainvoke(
+        self, input_data: StringPromptValue, config: Dict[str, Any] = None
+    ) -> StringPromptValue:
+        # Logging is cheap, so there is no need for the default
+        # behaviour of running `invoke` in a thread pool executor.
+        return self.invoke(input_data, config)
+
+# Stream event types
+SET_STAGE   = "stage"
+SET_TOKEN   = "token"
+SET_SOURCES = "sources"
+
+# Executor shared by all synchronous chain calls for speculative steps
+SPECULATION_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
 def query_result_pretty_str(result: list[dict[str, str]],
     max_items: int, additions: dict[str, str] = None
 ) -> str:
@@ -56,25 +81,19 @@ def query_result_pretty_str(result: list[dict[str, str]],
     str_list.append("]")
     return "".join(str_list)
 
-def make_date_range_filter(
-    start_date: str=None, end_date: str=None
-) -> models.Filter:
-    # https://qdrant.tech/documentation/concepts/filtering/
-    # Use a full datetime stamp, e.g. "2023-02-08T10:49:00Z", but
-    # just date also seems to work.
-    return models.Filter(
-        must=[
-            models.FieldCondition(
-                key="metadata.Datum",
-                range=models.DatetimeRange(
-                    gt=None,
-                    gte=start_date,
-                    lt=None,
-                    lte=end_date,
-                ),
-            )
-        ]
-    )
+# Frequent German function words, used to guess the language of a question.
+GERMAN_FUNCTION_WORDS = {"der", "die", "das", "und", "oder", "nicht", "ist",
+    "sind", "welche", "welcher", "welches", "wie", "wer", "was", "zu", "zum",
+    "zur", "von", "mit", "im", "für", "über", "den", "dem", "des", "ein",
+    "eine", "einer", "häufig", "hat", "haben", "wird", "werden"}
+
+def is_probably_german(text: str) -> bool:
+    """
+    Guesses whether a text is in German, based on whether it contains
+    any frequent German function words.
+    """
+    words = {w.strip("?!.,:;\"'()").lower() for w in text.split()}
+    return len(words & GERMAN_FUNCTION_WORDS) > 0
 
 def extract_references(text: str, docs: list[Document]) -> str:
     """
@@ -95,6 +114,9 @@ def extract_references(text: str, docs: list[Document]) -> str:
 
 class HybridQAChain(Chain):
     store_client: StoreClient = Field(exclude=True)
+    # If given, used instead of the store client in asynchronous calls
+    async_store_client: AsyncStoreClient | None = Field(default=None,
+        exclude=True)
     schema_description: str
     parties: list[str]
     config: RAGConfig
@@ -109,6 +131,7 @@ class HybridQAChain(Chain):
     sparql_gen_with_docs_chain: RunnableSequence
     answer_gen_chain: RunnableSequence
     return_sparql_query: bool = False
+    classify_locally: bool = True
     input_key: str = "query"  #: :meta private:
     answer_key: str = "answer"  #: :meta private:
     sources_key: str = "sources"  #: :meta private:
@@ -145,18 +168,23 @@ class HybridQAChain(Chain):
         *,
         schema_description: str,
         parties: list[str],
+        llm_cache: LLMResponseCache | None = None,
         **kwargs: Any,
     ) -> HybridQAChain:
         """Initialise from LLM."""
+        # Responses of the deterministic stages are cached, if a cache
+        # is given.
+        model_name = get_model_name(llm)
         sparql_gen_chain = (
             sparql_gen_prompt
             | RunnableLogInputs()
-            | llm
+            | cached(llm, llm_cache, "sparql_gen", model_name)
         )
         sparql_classify_chain = (
             sparql_classify_prompt
             | RunnableLogInputs()
-            | llm.with_structured_output(None, method="json_mode")
+            | cached(llm.with_structured_output(None, method="json_mode"),
+                llm_cache, "sparql_classify", model_name)
         )
         sparql_gen_or_retrieve_chain = (
             sparql_gen_or_retrieve_prompt
@@ -166,12 +194,12 @@ class HybridQAChain(Chain):
         need_content_chain = (
             need_content_prompt
             | RunnableLogInputs()
-            | llm
+            | cached(llm, llm_cache, "need_content", model_name)
         )
         sparql_gen_with_ids_chain = (
             sparql_gen_with_ids_prompt
             | RunnableLogInputs()
-            | llm
+            | cached(llm, llm_cache, "sparql_gen_with_ids", model_name)
         )
         sparql_gen_with_docs_chain = (
             sparql_gen_with_docs_prompt
@@ -197,19 +225,17 @@ class HybridQAChain(Chain):
             **kwargs,
         )
 
-    def _retrieve_from_vector_store(self, query: str, top_k: int=4,
+    def _make_search_kwargs(self, query_vector: list[float], top_k: int=4,
         score_threshold: float=None, filter: models.Filter=None,
         exclude_page_content: bool=False
-    ) -> list[Document]:
-        embedded_query_dense_vec = (
-            self.vector_store.embeddings.embed_query(query)
-        )
+    ) -> dict[str, Any]:
         # https://qdrant.tech/documentation/concepts/search/
-        result = self.vector_store.client.query_points(
+        return dict(
             collection_name=self.vector_store.collection_name,
-            query=embedded_query_dense_vec,
+            query=query_vector,
             query_filter=filter,
             #search_params=models.SearchParams(hnsw_ef=128, exact=False),
+            search_params=make_search_params(self.config),
             #with_vectors=True, #seems to default to False
             with_payload=(
                 models.PayloadSelectorExclude(exclude=["page_content"])
@@ -218,7 +244,12 @@ class HybridQAChain(Chain):
             limit=top_k,
             score_threshold=score_threshold
         )
-        # Turn the query result into a list of documents.
+
+    def _points_to_documents(self, result: models.QueryResponse
+    ) -> list[Document]:
+        """
+        Turns a query result into a list of documents.
+        """
         doc_list: list[Document] = []
         for p in result.points:
             if "metadata" in p.payload:
@@ -232,6 +263,173 @@ class HybridQAChain(Chain):
             ))
         return doc_list
 
+    def _retrieve_from_vector_store(self, query: str, top_k: int=4,
+        score_threshold: float=None, filter: models.Filter=None,
+        exclude_page_content: bool=False
+    ) -> list[Document]:
+        embedded_query_dense_vec = (
+            self.vector_store.embeddings.embed_query(query)
+        )
+        result = self.vector_store.client.query_points(
+            **self._make_search_kwargs(embedded_query_dense_vec,
+                top_k=top_k, score_threshold=score_threshold,
+                filter=filter, exclude_page_content=exclude_page_content)
+        )
+        return self._points_to_documents(result)
+
+    async def _aretrieve_from_vector_store(self, query: str, top_k: int=4,
+        score_threshold: float=None, filter: models.Filter=None,
+        exclude_page_content: bool=False
+    ) -> list[Document]:
+        embedded_query_dense_vec = (
+            await self.vector_store.embeddings.aembed_query(query)
+        )
+        # NB The local (on-disk) Qdrant client is synchronous only, so
+        # the search is offloaded to a worker thread.
+        result = await asyncio.to_thread(
+            self.vector_store.client.query_points,
+            **self._make_search_kwargs(embedded_query_dense_vec,
+                top_k=top_k, score_threshold=score_threshold,
+                filter=filter, exclude_page_content=exclude_page_content)
+        )
+        return self._points_to_documents(result)
+
+    def _make_schema_and_question_inputs(self, question: str
+    ) -> dict[str, Any]:
+        return {
+            "schema": self.schema_description,
+            "parties": self.parties,
+            "question": question
+        }
+
+    def _make_gen_with_context_inputs(self, question: str,
+        retrieved_from_vs: list[Document]
+    ) -> dict[str, Any]:
+        return {
+            "schema": self.schema_description,
+            "parties": self.parties,
+            "context": retrieved_from_vs,
+            "question": question
+        }
+
+    def _classify_locally(self, initial_query: str, question: str
+    ) -> dict[str, str] | None:
+        """
+        Classifies the initial SPARQL query by parsing it, without the
+        need for an LLM. Returns none if the LLM needs to be consulted,
+        i.e. if parsing fails, or if a topic was found that may need to
+        be translated into German.
+        """
+        if not self.classify_locally:
+            return None
+        cl_res = classify_sparql_query(initial_query)
+        if cl_res is not None and cl_res["topic"] != "" and (
+            not is_probably_german(question)):
+            return None
+        return cl_res
+
+    def _make_combined_filter(self, cl_res: dict[str, Any],
+        additions: dict[str, str]
+    ) -> models.Filter | None:
+        """
+        Turns the classification result into a filter for the vector
+        store search, if any, and records detected filter values in the
+        given additions.
+        """
+        field_filters = field_filters_from_classification(cl_res)
+        log_msg(f"Metadata filters: {field_filters}", level=logging.DEBUG)
+        for f in field_filters:
+            # NB Only unambiguous values are added to KG-retrieved results.
+            if (f.field != DATE_FIELD and not f.negate
+                and len(f.values) == 1):
+                additions[f.field] = f.values[0]
+        combined_filter = make_metadata_filter(field_filters)
+        log_msg(f"Combined filter: {str(combined_filter)}",
+            level=logging.DEBUG)
+        return combined_filter
+
+    def _parse_need_content(self, need_content_str: str) -> bool:
+        ncs = need_content_str.lower().strip(' ."')
+        log_msg(f"Is speech content to be retrieved: '{need_content_str}'",
+            level=logging.DEBUG)
+        return ("yes" in ncs) or ("ja" in ncs)
+
+    def _make_retrieval_kwargs(self, need_content: bool,
+        combined_filter: models.Filter | None
+    ) -> dict[str, Any]:
+        if need_content:
+            return dict(top_k=self.config.get(CVN_TOP_K),
+                filter=combined_filter)
+        else:
+            # Note: Even if speech content is not needed, we
+            # retrieve it. People tend to like embellishments even if they
+            # are not explicitly asked for! This is only feasible for small
+            # top-k numbers, though, and unrealistic for global questions!
+            # TODO: Develop a more sophisticated way of detecting whether
+            # or not speech content is required, and if not, use much
+            # higher limits for item numbers, e.g. >1k!
+            return dict(top_k=self.config.get(CVN_THRESHOLD_TOP_K),
+                score_threshold=self.config.get(CVN_THRESHOLD_SCORE),
+                filter=combined_filter, exclude_page_content=False)
+
+    def _prepare_sparql_query(self, sparql_query: str) -> str:
+        sparql_query = strip_sparql_keyword(sparql_query)
+        if sparql_query != "":
+            # Stop the store from computing rows that are not used.
+            sparql_query = limit_sparql_query(sparql_query,
+                self._max_kg_rows())
+        log_msg(f"SPARQL query:\n{sparql_query}", level=logging.DEBUG)
+        return sparql_query
+
+    def _max_kg_rows(self) -> int:
+        # NB This is the number of rows `query_result_pretty_str` uses at
+        # most, such that no more rows than that are retrieved.
+        return self.config.get(CVN_KG_MAX_ITEMS) + 2
+
+    def _query_kg(self, sparql_query: str) -> list[dict]:
+        return list(self.store_client.query_iter(sparql_query,
+            max_rows=self._max_kg_rows()))
+
+    async def _aquery_kg(self, sparql_query: str) -> list[dict]:
+        if self.async_store_client is None:
+            return await asyncio.to_thread(self._query_kg, sparql_query)
+        return [row async for row in self.async_store_client.query_iter(
+            sparql_query, max_rows=self._max_kg_rows())]
+
+    def _format_kg_reply(self, reply: list[dict],
+        additions: dict[str, str]
+    ) -> str:
+        # TODO: Adjust prompts to limit query result item numbers,
+        # instead of restricting item numbers here!
+        retrieved_from_kg = query_result_pretty_str(reply,
+            self.config.get(CVN_KG_MAX_ITEMS), additions=additions)
+        # TODO: Write a function that retrieves from KG as list
+        # of documents in order to unify retrieval. Investigate
+        # beforehand if this is sensible at all, or if there is a
+        # better way to structure retrieved information in general!
+        log_msg(f"Retrieved from KG:\n{retrieved_from_kg}",
+            level=logging.DEBUG)
+        return retrieved_from_kg
+
+    def _make_answer_gen_inputs(self, question: str, retrieved_from_kg: str,
+        retrieved_from_vs: list[Document]
+    ) -> dict[str, Any]:
+        return {
+            "context": retrieved_from_kg,
+            "speeches": retrieved_from_vs,
+            "question": question
+        }
+
+    def _make_outputs(self, answer: str, retrieved_from_vs: list[Document]
+    ) -> Dict[str, str]:
+        # TODO: Extend reference extraction to KG-retrieved results!
+        # Ideally, treat context in a single, unified way, irrespective of
+        # where it was retrieved from!
+        return {
+            self.answer_key: answer,
+            self.sources_key: extract_references(answer, retrieved_from_vs)
+        }
+
     def _call(
         self,
         inputs: Dict[str, Any],
@@ -247,11 +445,8 @@ class HybridQAChain(Chain):
         question = inputs[self.input_key]
 
         # Ask the LLM to generate a SPARQL query
-        schema_and_question_inputs = {
-            "schema": self.schema_description,
-            "parties": self.parties,
-            "question": question
-        }
+        schema_and_question_inputs = (
+            self._make_schema_and_question_inputs(question))
         # Generate initial SPARQL query
         gen_res_str: str = self.sparql_gen_chain.invoke(
             schema_and_question_inputs).content
@@ -259,8 +454,17 @@ class HybridQAChain(Chain):
         # Determine if prior vector store retrieval is necessary. If the
         # query involves filtering the textual content of speeches, then
         # this means we need to retrieve the latter from the vector store
-        # first. The LLM should tell us that.
-        cl_res = self.sparql_classify_chain.invoke({"query": initial_query})
+        # first. Parsing the query tells us that, or else the LLM should.
+        cl_res = self._classify_locally(initial_query, question)
+        need_content_future = None
+        if cl_res is None:
+            # Determining whether speech texts are needed only depends on
+            # the question, so we do this speculatively, in parallel with
+            # the classification by the LLM, as a topic is likely.
+            need_content_future = SPECULATION_EXECUTOR.submit(
+                self.need_content_chain.invoke, schema_and_question_inputs)
+            cl_res = self.sparql_classify_chain.invoke(
+                {"query": initial_query})
         log_msg(f"Classification result: {str(cl_res)}", level=logging.DEBUG)
         # Things to be added to KG-retrieved results, as determined by
         # detected filters. This is a fudge, and propbably doesn't work
@@ -273,68 +477,15 @@ class HybridQAChain(Chain):
             topic = cl_res["topic"]
             log_msg(f"Topic to be retrieved from vector store: '{topic}'",
                 level=logging.DEBUG)
-            # Construct date range filter, if any.
-            if cl_res["start_date"] == "" and cl_res["end_date"] == "":
-                date_filter = None
-            else:
-                date_filter = make_date_range_filter(
-                    start_date=(cl_res["start_date"]
-                        if cl_res["start_date"] != "" else None),
-                    end_date=(cl_res["end_date"]
-                        if cl_res["end_date"] != "" else None),
-                )
-            log_msg(f"Date filter: {str(date_filter)}", level=logging.DEBUG)
-            # Party filter, if any.
-            party_filter = None
-            if "party" in cl_res:
-                if cl_res["party"] != "":
-                    party_filter = models.Filter(
-                        must=[
-                            models.FieldCondition(
-                                key="metadata.Fraktion",
-                                match=models.MatchValue(value=cl_res["party"])
-                            )
-                        ]
-                    )
-                    additions["Fraktion"] = cl_res["party"]
-            log_msg(f"Party filter: {str(party_filter)}", level=logging.DEBUG)
-            # Combine filters, if any.
-            # TODO: Add filtering for all metadata! Develop generic
-            # infrastructure to handle filters!
-            if date_filter is not None and party_filter is not None:
-                combined_filter = models.Filter(
-                    must=[date_filter, party_filter])
-            elif date_filter is not None:
-                combined_filter = date_filter
-            elif party_filter is not None:
-                combined_filter = party_filter
-            else:
-                combined_filter = None
-            log_msg(f"Combined filter: {str(combined_filter)}",
-                level=logging.DEBUG)
+            combined_filter = self._make_combined_filter(cl_res, additions)
             # Determine if we need the speech texts.
-            need_content_str: str = self.need_content_chain.invoke(
-                schema_and_question_inputs).content
-            ncs = need_content_str.lower().strip(' ."')
-            log_msg(f"Is speech content to be retrieved: '{need_content_str}'",
-                level=logging.DEBUG)
-            need_content = ("yes" in ncs) or ("ja" in ncs)
+            need_content = self._parse_need_content((
+                self.need_content_chain.invoke(schema_and_question_inputs)
+                if need_content_future is None
+                else need_content_future.result()).content)
             # Retrieve documents from vector store.
-            if need_content:
-                retrieved_from_vs = self._retrieve_from_vector_store(topic,
-                    top_k=self.config.get(CVN_TOP_K), filter=combined_filter)
-            else:
-                # Note: Even if speech content is not needed, we
-                # retrieve it. People tend to like embellishments even if they
-                # are not explicitly asked for! This is only feasible for small
-                # top-k numbers, though, and unrealistic for global questions!
-                # TODO: Develop a more sophisticated way of detecting whether
-                # or not speech content is required, and if not, use much
-                # higher limits for item numbers, e.g. >1k!
-                retrieved_from_vs = self._retrieve_from_vector_store(topic,
-                    top_k=self.config.get(CVN_THRESHOLD_TOP_K),
-                    score_threshold=self.config.get(CVN_THRESHOLD_SCORE),
-                    filter=combined_filter, exclude_page_content=False)
+            retrieved_from_vs = self._retrieve_from_vector_store(topic,
+                **self._make_retrieval_kwargs(need_content, combined_filter))
             log_msg(f"Retrieved {len(retrieved_from_vs)} items from "
                 "vector store.", level=logging.DEBUG)
             if need_content:
@@ -346,53 +497,177 @@ class HybridQAChain(Chain):
             else:
                 # Otherwise, try again to generate a query, this time with
                 # retrieved information as context.
-                gen_wc_inputs = {
-                    "schema": self.schema_description,
-                    "parties": self.parties,
-                    "context": retrieved_from_vs,
-                    "question": question
-                }
-                gen_wc_res_str: str = (
-                    # TODO: Revisit the question if we need different query
-                    # regeneration prompts for different context types!
-                    #self.sparql_gen_with_docs_chain.invoke(gen_wc_inputs).content
-                    #if need_content else
-                    self.sparql_gen_with_ids_chain.invoke(gen_wc_inputs).content
-                )
-                sparql_query = gen_wc_res_str
+                # TODO: Revisit the question if we need different query
+                # regeneration prompts for different context types, i.e.
+                # sparql_gen_with_docs_chain if need_content!
+                sparql_query = self.sparql_gen_with_ids_chain.invoke(
+                    self._make_gen_with_context_inputs(
+                        question, retrieved_from_vs)).content
         else:
             retrieved_from_vs: list[Document] = []
             sparql_query = initial_query
         # Execute SPARQL query, if necessary
-        if sparql_query.lower().startswith("sparql"):
-            sparql_query = sparql_query[len("sparql"):]
-        log_msg(f"SPARQL query:\n{sparql_query}", level=logging.DEBUG)
+        sparql_query = self._prepare_sparql_query(sparql_query)
         if sparql_query != "":
             # Retrieve from KG
-            reply = self.store_client.query(sparql_query)["results"]["bindings"]
-            # TODO: Adjust prompts to limit query result item numbers,
-            # instead of restricting item numbers here!
-            retrieved_from_kg = query_result_pretty_str(reply,
-                self.config.get(CVN_KG_MAX_ITEMS), additions=additions)
-            # TODO: Write a function that retrieves from KG as list
-            # of documents in order to unify retrieval. Investigate
-            # beforehand if this is sensible at all, or if there is a
-            # better way to structure retrieved information in general!
+            reply = self._query_kg(sparql_query)
+            retrieved_from_kg = self._format_kg_reply(reply, additions)
         else:
             retrieved_from_kg = ""
-        log_msg(f"Retrieved from KG:\n{retrieved_from_kg}",
-            level=logging.DEBUG)
         # Generate answer, based on retrieved info
-        answer: str = self.answer_gen_chain.invoke({
-            "context": retrieved_from_kg,
-            "speeches": retrieved_from_vs,
-            "question": question
-        }).content
+        answer: str = self.answer_gen_chain.invoke(
+            self._make_answer_gen_inputs(
+                question, retrieved_from_kg, retrieved_from_vs)).content
+        return self._make_outputs(answer, retrieved_from_vs)
 
-        # TODO: Extend reference extraction to KG-retrieved results!
-        # Ideally, treat context in a single, unified way, irrespective of
-        # where it was retrieved from!
-        return {
-            self.answer_key: answer,
-            self.sources_key: extract_references(answer, retrieved_from_vs)
-        }
+    async def _acall(
+        self,
+        inputs: Dict[str, Any],
+        run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> Dict[str, str]:
+        """
+        Asynchronous version of `_call`, which awaits all LLM, vector
+        store and knowledge graph calls instead of blocking on them.
+        """
+        return await self._arun(inputs[self.input_key])
+
+    async def astream_progress(self, question: str
+    ) -> AsyncIterator[tuple[str, str]]:
+        """
+        Answers a question like `ainvoke`, but yields progress events as
+        (type, data) tuples while doing so: a `stage` event whenever a
+        step completes, a `token` event for each chunk of the answer as
+        it is generated, and finally a `sources` event.
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self._arun(question, events=events))
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
+            result = await task
+            yield (SET_SOURCES, result[self.sources_key])
+        finally:
+            # The consumer may stop early, e.g. if the client disconnects.
+            task.cancel()
+
+    async def _arun(self, question: str,
+        events: asyncio.Queue | None = None
+    ) -> Dict[str, str]:
+        """
+        Runs the individual steps as stages of a dependency graph, such
+        that independent steps run concurrently. If an event queue is
+        given, progress events are put onto it, the answer is streamed
+        onto it token by token, and none is put onto it at the end.
+        """
+        schema_and_question_inputs = (
+            self._make_schema_and_question_inputs(question))
+        # Things to be added to KG-retrieved results, as determined by
+        # detected filters.
+        additions: dict[str, str] = {}
+
+        def notify(msg: str) -> None:
+            if events is not None:
+                events.put_nowait((SET_STAGE, msg))
+
+        async def generate() -> str:
+            gen_res_str: str = (await self.sparql_gen_chain.ainvoke(
+                schema_and_question_inputs)).content
+            notify("SPARQL generated")
+            return gen_res_str.strip(" .`'")
+
+        async def classify(initial_query: str) -> dict[str, str]:
+            cl_res = self._classify_locally(initial_query, question)
+            if cl_res is None:
+                # NB Only if the LLM has to classify, whether speech texts
+                # are needed is determined speculatively, alongside.
+                sched.speculate("need_content")
+                cl_res = await self.sparql_classify_chain.ainvoke(
+                    {"query": initial_query})
+            log_msg(f"Classification result: {str(cl_res)}",
+                level=logging.DEBUG)
+            notify("SPARQL classified" if cl_res["topic"] == "" else
+                f"SPARQL classified, topic: {cl_res['topic']}")
+            return cl_res
+
+        async def need_content() -> bool:
+            # NB This only depends on the question, so it can run
+            # speculatively alongside the classification.
+            return self._parse_need_content(
+                (await self.need_content_chain.ainvoke(
+                    schema_and_question_inputs)).content)
+
+        async def retrieve(cl_res: dict[str, str]) -> list[Document]:
+            # NB Retrieval is not started speculatively on the question
+            # itself, as it searches for the topic and applies the filters
+            # found in the generated query, so the result of such a search
+            # could not be used instead.
+            if cl_res["topic"] == "":
+                return []
+            topic = cl_res["topic"]
+            log_msg(f"Topic to be retrieved from vector store: '{topic}'",
+                level=logging.DEBUG)
+            combined_filter = self._make_combined_filter(cl_res, additions)
+            retrieved_from_vs = await self._aretrieve_from_vector_store(topic,
+                **self._make_retrieval_kwargs(
+                    await sched.result("need_content"), combined_filter))
+            log_msg(f"Retrieved {len(retrieved_from_vs)} items from "
+                "vector store.", level=logging.DEBUG)
+            notify(f"{len(retrieved_from_vs)} speeches retrieved")
+            return retrieved_from_vs
+
+        async def regenerate(initial_query: str, cl_res: dict[str, str],
+            retrieved_from_vs: list[Document]
+        ) -> str:
+            if cl_res["topic"] == "":
+                return initial_query
+            if await sched.result("need_content"):
+                return ""
+            sparql_query = (await self.sparql_gen_with_ids_chain.ainvoke(
+                self._make_gen_with_context_inputs(
+                    question, retrieved_from_vs))).content
+            notify("SPARQL regenerated")
+            return sparql_query
+
+        async def execute(sparql_query: str) -> str:
+            sparql_query = self._prepare_sparql_query(sparql_query)
+            if sparql_query == "":
+                return ""
+            reply = await self._aquery_kg(sparql_query)
+            notify(f"KG returned {len(reply)} rows")
+            return self._format_kg_reply(reply, additions)
+
+        async def answer(retrieved_from_kg: str,
+            retrieved_from_vs: list[Document]
+        ) -> str:
+            answer_gen_inputs = self._make_answer_gen_inputs(
+                question, retrieved_from_kg, retrieved_from_vs)
+            if events is None:
+                return (await self.answer_gen_chain.ainvoke(
+                    answer_gen_inputs)).content
+            chunks: list[str] = []
+            async for chunk in self.answer_gen_chain.astream(
+                answer_gen_inputs):
+                if chunk.content != "":
+                    chunks.append(chunk.content)
+                    events.put_nowait((SET_TOKEN, chunk.content))
+            return "".join(chunks)
+
+        try:
+            async with StageScheduler() as sched:
+                sched.add("generate", generate)
+                sched.add("need_content", need_content)
+                sched.add("classify", classify, deps=["generate"])
+                sched.add("retrieve", retrieve, deps=["classify"])
+                sched.add("regenerate", regenerate,
+                    deps=["generate", "classify", "retrieve"])
+                sched.add("execute", execute, deps=["regenerate"])
+                sched.add("answer", answer, deps=["execute", "retrieve"])
+                answer_str = await sched.result("answer")
+                retrieved_from_vs = await sched.result("retrieve")
+        finally:
+            if events is not None:
+                events.put_nowait(None)
+        return self._make_outputs(answer_str, retrieved_from_vs)
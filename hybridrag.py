@@ -2,30 +2,44 @@
 This is the backend for a hybrid RAG system.
 """
 
+import asyncio
 import os
 from datetime import datetime
+from time import perf_counter
 import logging
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain.embeddings import CacheBackedEmbeddings
-from langchain.storage import LocalFileStore
+from typing import AsyncIterator
+from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
-from langchain_qdrant import QdrantVectorStore
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, VectorParams
 
 from common import MMD_PREFIX, MMD_BASE_IRI, PD_PREFIX, PD_BASE_IRI, ES_UTF_8
 from common import get_parliamentary_groups, get_store_schema
+from common import aget_store_schema
 from common import read_text_from_file, log_msg, RAGError
 from ragconfig import RAGConfig, CVN_ENDPOINT, CVN_TBOX_ENDPOINT
+from ragconfig import CVN_ENDPOINTS, CVN_STORE_POOL_SIZE
 from ragconfig import CVN_MODEL, CVN_TEMPERATURE
 from ragconfig import CVN_THRESHOLD_SCORE, CVN_THRESHOLD_TOP_K, CVN_TOP_K
-from ragconfig import CVN_EMBEDDING_MODEL, CVN_EMBEDDING_CACHE, CVN_EMBEDDING_DIM
-from ragconfig import CVN_VS_COLLECTION, CVN_VSTORE_CACHE
-from hybridqachain import HybridQAChain
-from storeclient import RemoteStoreClient
+from ragconfig import CVN_ANSWER_CACHE_SIZE, CVN_ANSWER_CACHE_TTL
+from ragconfig import CVN_DS_VERSION_INTERVAL
+from ragconfig import CVN_SEMANTIC_CACHE_SIZE, CVN_SEMANTIC_CACHE_THRESHOLD
+from hybridqachain import HybridQAChain, SET_STAGE, SET_TOKEN, SET_SOURCES
+from llmcache import make_llm_cache
+from embeddingcache import make_cached_embeddings
+from vectorstore import make_search_params, make_vector_store
+from answercache import AnswerCache, SemanticAnswerCache, normalise_question
+from singleflight import SingleFlight
+from datasetversion import DatasetVersionProbe
+from querycache import CachingStoreClient, AsyncCachingStoreClient
+from querycache import make_query_cache
+from storeclient import make_store_client, make_async_store_client
+from storeclient import ThreadedStoreClient
+from replicatedstore import ReplicatedStoreClient, make_replicated_store_client
 from debateloader import SpeechKGLoader
 from questions import Questions, Answer
 
+# Prefixes used in the description of the schema of the KG
+SCHEMA_PREFIXES = {MMD_PREFIX: MMD_BASE_IRI, PD_PREFIX: PD_BASE_IRI}
+
 class HybridRAG:
     """
     Class for a question-answering system that uses a hybrid approach
@@ -34,13 +48,43 @@ class HybridRAG:
     retrieval from a knowledge graph.
     """
 
-    def __init__(self, config: RAGConfig) -> None:
-        self.store_client = RemoteStoreClient(config.get(CVN_ENDPOINT))
+    def __init__(self, config: RAGConfig, schema: str | None = None) -> None:
+        """
+        Sets up the system, with the given description of the schema of
+        the KG, if any, or else one queried from the TBox endpoint.
+        """
+        endpoints = config.get_or_default(CVN_ENDPOINTS)
+        self.replicated_store_client: ReplicatedStoreClient | None = None
+        if endpoints:
+            # NB Hedging is implemented with threads, hence the
+            # asynchronous client runs the synchronous one in threads.
+            self.replicated_store_client = make_replicated_store_client(
+                config, endpoints)
+            self.store_client = self.replicated_store_client
+            self.async_store_client = ThreadedStoreClient(self.store_client,
+                max_workers=config.get_or_default(CVN_STORE_POOL_SIZE, 10))
+        else:
+            self.store_client = make_store_client(config,
+                config.get(CVN_ENDPOINT))
+            self.async_store_client = make_async_store_client(config,
+                config.get(CVN_ENDPOINT))
+        # NB Dataset versions must be probed via the uncached client.
+        uncached_store_client = self.store_client
+        # Query results are cached for as long as the KG does not change.
+        self.query_cache = make_query_cache(config, DatasetVersionProbe(
+            uncached_store_client,
+            interval=config.get_or_default(CVN_DS_VERSION_INTERVAL, 300)))
+        if self.query_cache is not None:
+            self.store_client = CachingStoreClient(self.store_client,
+                self.query_cache)
+            self.async_store_client = AsyncCachingStoreClient(
+                self.async_store_client, self.query_cache)
         parliamentary_groups = get_parliamentary_groups(self.store_client)
-        schema = get_store_schema(
-            RemoteStoreClient(config.get(CVN_TBOX_ENDPOINT)),
-            {MMD_PREFIX: MMD_BASE_IRI, PD_PREFIX: PD_BASE_IRI}
-        )
+        if schema is None:
+            tbox_client = make_store_client(config,
+                config.get(CVN_TBOX_ENDPOINT))
+            schema = get_store_schema(tbox_client, SCHEMA_PREFIXES)
+            tbox_client.close()
         #schema = read_text_from_file(
         #    os.path.join("data", "processed", "20137-xml-tbox-description.txt"))
         #log_msg(schema, level=logging.DEBUG)
@@ -49,6 +93,7 @@ class HybridRAG:
             model=config.get(CVN_MODEL),
             temperature=config.get(CVN_TEMPERATURE)
         )
+        self.llm_cache = make_llm_cache(config)
         sparql_gen_prompt = PromptTemplate(
             template=read_text_from_file(
                 os.path.join("prompt_templates", "hybrid_sparql_gen.txt")
@@ -99,14 +144,16 @@ class HybridRAG:
             search_type="similarity_score_threshold",
             search_kwargs={
                 "score_threshold": config.get(CVN_THRESHOLD_SCORE),
-                "k": config.get(CVN_THRESHOLD_TOP_K)
+                "k": config.get(CVN_THRESHOLD_TOP_K),
+                "search_params": make_search_params(config)
             }
         )
         # Retriever for the "top k" most similar documents.
         top_k_retriever = self.vector_store.as_retriever(
             search_type="similarity", # This is the default search type.
             search_kwargs={
-                "k": config.get(CVN_TOP_K) # Defaults to 4, apparently, if not given.
+                "k": config.get(CVN_TOP_K), # Defaults to 4, apparently, if not given.
+                "search_params": make_search_params(config)
             }
         )
         self.chain = HybridQAChain.from_llm(
@@ -118,54 +165,56 @@ class HybridRAG:
             top_k_retriever=top_k_retriever,
             config=config,
             vector_store=self.vector_store,
-            store_client=self.store_client, schema_description=schema,
-            parties=parliamentary_groups,
+            store_client=self.store_client,
+            async_store_client=self.async_store_client,
+            schema_description=schema,
+            parties=parliamentary_groups, llm_cache=self.llm_cache,
             verbose=True, return_sparql_query=True
         )
+        # Answers are cached for as long as the underlying data does
+        # not change.
+        self.version_probe = DatasetVersionProbe(uncached_store_client,
+            vector_store=self.vector_store,
+            interval=config.get_or_default(CVN_DS_VERSION_INTERVAL, 300))
+        self.answer_cache = AnswerCache(
+            max_entries=config.get_or_default(CVN_ANSWER_CACHE_SIZE, 1000),
+            ttl=config.get_or_default(CVN_ANSWER_CACHE_TTL))
+        self.single_flight = SingleFlight()
+        # Paraphrased questions are only matched if a similarity
+        # threshold is configured.
+        threshold = config.get_or_default(CVN_SEMANTIC_CACHE_THRESHOLD)
+        self.semantic_cache = None if threshold is None else (
+            SemanticAnswerCache(self.embeddings, threshold=threshold,
+                max_entries=config.get_or_default(
+                    CVN_SEMANTIC_CACHE_SIZE, 1000),
+                ttl=config.get_or_default(CVN_ANSWER_CACHE_TTL),
+                answer_key=self.chain.answer_key))
+
+    @classmethod
+    async def acreate(cls, config: RAGConfig) -> "HybridRAG":
+        """
+        Sets up the system, querying the schema of the KG from the TBox
+        endpoint asynchronously, with the schema queries issued
+        concurrently.
+        """
+        tbox_client = make_async_store_client(config,
+            config.get(CVN_TBOX_ENDPOINT))
+        try:
+            schema = await aget_store_schema(tbox_client, SCHEMA_PREFIXES)
+        finally:
+            await tbox_client.close()
+        return cls(config, schema=schema)
+
+    async def aclose(self) -> None:
+        """
+        Closes the clients of the store, including their connection pools.
+        """
+        await self.async_store_client.close()
+        self.store_client.close()
 
     def _init_vector_store(self, config: RAGConfig) -> None:
-        # https://platform.openai.com/docs/guides/embeddings/
-        underlying_embeddings = OpenAIEmbeddings(
-            model=config.get(CVN_EMBEDDING_MODEL)
-        )
-        emb_cache_store = LocalFileStore(config.get(CVN_EMBEDDING_CACHE))
-        embeddings = CacheBackedEmbeddings.from_bytes_store(
-            underlying_embeddings, emb_cache_store,
-            namespace=underlying_embeddings.model
-        )
-        collection_name = config.get(CVN_VS_COLLECTION)
-        vs_cache_path = config.get(CVN_VSTORE_CACHE)
-        # If the vector store cache directory exists, we attempt to
-        # read an existing collection.
-        # TODO: Make this more robust by checking for existence of
-        # the meta.json file!
-        if os.path.isdir(vs_cache_path):
-            log_msg(f"Reading collection '{collection_name}' from "
-                f"existing vector store in '{vs_cache_path}'...")
-            self.vector_store = QdrantVectorStore.from_existing_collection(
-                path=vs_cache_path,
-                collection_name=collection_name,
-                embedding=embeddings
-            )
-        else:
-            log_msg(f"Creating new vector store in '{vs_cache_path}', "
-                f"with new collection '{collection_name}'...")
-            client = QdrantClient(path=vs_cache_path)
-            # NB Unfortunately, at time of writing, there does not
-            # seem to be a good way to determine the dimension of
-            # the embedding, so we read that from config, too.
-            client.create_collection(
-                collection_name=collection_name,
-                vectors_config=VectorParams(
-                    size=config.get(CVN_EMBEDDING_DIM),
-                    distance=Distance.COSINE
-                )
-            )
-            self.vector_store = QdrantVectorStore(
-                client=client,
-                collection_name=collection_name,
-                embedding=embeddings
-            )
+        self.embeddings = make_cached_embeddings(config)
+        self.vector_store = make_vector_store(config, self.embeddings)
 
     def load_speeches_from_kg(self, period: str | None = None,
         session: str | None = None) -> list[str]:
@@ -179,7 +228,27 @@ class HybridRAG:
             period=period, session=session).load()
         log_msg(f"Adding {len(documents)} speeches queried from "
             "the store client to the vector store...")
-        return self.vector_store.add_documents(documents)
+        ids = self.vector_store.add_documents(documents)
+        self.version_probe.invalidate()
+        return ids
+
+    def get_stats(self) -> dict[str, dict]:
+        """
+        Returns statistics of the caches in use, e.g. hit and miss counts.
+        """
+        stats: dict[str, dict] = {}
+        if self.llm_cache is not None:
+            stats["llm_cache"] = self.llm_cache.stats()
+        if self.query_cache is not None:
+            stats["query_cache"] = self.query_cache.stats()
+        stats["query_embedding_cache"] = self.embeddings.stats()
+        stats["answer_cache"] = self.answer_cache.stats()
+        if self.semantic_cache is not None:
+            stats["semantic_cache"] = self.semantic_cache.stats()
+        stats["single_flight"] = self.single_flight.stats()
+        if self.replicated_store_client is not None:
+            stats["store_replicas"] = self.replicated_store_client.stats()
+        return stats
 
     def query(self, question: str) -> dict[str, str]:
         """
@@ -188,12 +257,108 @@ class HybridRAG:
         language question.
         WARNING: This may cost real money and may be expensive!
         """
+        version = self.version_probe.get()
+        response = self.answer_cache.lookup(question, version)
+        if response is None and self.semantic_cache is not None:
+            response = self.semantic_cache.lookup(question, version)
+        if response is None:
+            t_start = perf_counter()
+            try:
+                response = self.chain.invoke(question)
+            except Exception as e:
+                raise RAGError(f"Error processing query '{question}'.") from e
+            self.answer_cache.update(question, version, response)
+            if self.semantic_cache is not None:
+                self.semantic_cache.update(question, version, response,
+                    latency=perf_counter()-t_start)
+        response[self.chain.input_key] = question
+        return response
+
+    async def _acompute(self, question: str, version: str) -> dict[str, str]:
+        t_start = perf_counter()
         try:
-            response = self.chain.invoke(question)
+            response = await self.chain.ainvoke(question)
         except Exception as e:
             raise RAGError(f"Error processing query '{question}'.") from e
+        self.answer_cache.update(question, version, response)
+        if self.semantic_cache is not None:
+            await self.semantic_cache.aupdate(question, version, response,
+                latency=perf_counter()-t_start)
+        return response
+
+    async def aquery(self, question: str) -> dict[str, str]:
+        """
+        Asynchronous version of `query`, which does not block the event
+        loop while waiting for the LLM, the vector store, or the KG.
+        Identical questions asked concurrently are only answered once.
+        WARNING: This may cost real money and may be expensive!
+        """
+        version = await self.version_probe.aget()
+        response = self.answer_cache.lookup(question, version)
+        if response is None and self.semantic_cache is not None:
+            response = await self.semantic_cache.alookup(question, version)
+        if response is None:
+            # NB The response is shared by all coalesced requests, so
+            # each of them receives a copy.
+            response = dict(await self.single_flight.do(
+                "\n".join([version, normalise_question(question)]),
+                lambda: self._acompute(question, version)))
+        response[self.chain.input_key] = question
         return response
 
+    async def astream_query(self, question: str
+    ) -> AsyncIterator[tuple[str, str]]:
+        """
+        Answers a question like `aquery`, but yields progress events as
+        (type, data) tuples, see `HybridQAChain.astream_progress`. Cached
+        answers are yielded at once, as a single token event.
+        WARNING: This may cost real money and may be expensive!
+        """
+        version = await self.version_probe.aget()
+        response = self.answer_cache.lookup(question, version)
+        if response is None and self.semantic_cache is not None:
+            response = await self.semantic_cache.alookup(question, version)
+        if response is not None:
+            yield (SET_STAGE, "Answer found in cache")
+            yield (SET_TOKEN, response[self.chain.answer_key])
+            yield (SET_SOURCES, response[self.chain.sources_key])
+            return
+        # NB Identical questions asked concurrently, whether streamed or
+        # not, are only answered once, and followers receive the whole
+        # answer at once, when the leader is done.
+        key = "\n".join([version, normalise_question(question)])
+        in_flight = self.single_flight.follow(key)
+        if in_flight is not None:
+            response = await asyncio.shield(in_flight)
+            yield (SET_STAGE, "Answer shared with an identical question")
+            yield (SET_TOKEN, response[self.chain.answer_key])
+            yield (SET_SOURCES, response[self.chain.sources_key])
+            return
+        future = self.single_flight.lead(key)
+        t_start = perf_counter()
+        answer_chunks: list[str] = []
+        sources = ""
+        try:
+            async for event in self.chain.astream_progress(question):
+                if event[0] == SET_TOKEN:
+                    answer_chunks.append(event[1])
+                elif event[0] == SET_SOURCES:
+                    sources = event[1]
+                yield event
+            response = {self.chain.answer_key: "".join(answer_chunks),
+                self.chain.sources_key: sources}
+            future.set_result(response)
+        except Exception as e:
+            error = RAGError(f"Error processing query '{question}'.")
+            future.set_exception(error)
+            raise error from e
+        finally:
+            self.single_flight.abandon(future)
+        self.answer_cache.update(question, version, response)
+        if self.semantic_cache is not None:
+            await self.semantic_cache.aupdate(question, version, response,
+                latency=perf_counter()-t_start)
+
 def main():
     """
     Runs the hybrid RAG backend standalone, i.e. without a frontend.
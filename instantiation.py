@@ -15,12 +15,17 @@ from langchain_core.runnables.base import RunnableSequence
 
 from common import *
 import storeclient
-from SPARQLBuilder import SPARQLSelectBuilder, makeVarRef, makeIRIRef, makeLiteralStr
+from SPARQLBuilder import SPARQLSelectBuilder, SPARQLUpdateBuilder
+from SPARQLBuilder import makeVarRef, makeIRIRef, makeLiteralStr
 from CommonNamespaces import RDF_TYPE, XSD_STRING
 from ragconfig import RAGConfig, CVN_MODEL, CVN_TEMPERATURE
 
 DEBUG = False
 
+# Maximum number of statements added per update by post-processing
+# functions that add them as they go
+UPDATE_BATCH_SIZE = 100
+
 # Parser states
 PS_NONE       = 0
 PS_GROUP      = 1
@@ -603,46 +608,54 @@ def add_speaker_party(abox: ABox) -> None:
     one deduced from their MdB party affiliation.
     """
     log_msg(" - Adding missing speaker parties...")
-    # Make a look-up dictionary of parliamentary group strings by key.
-    pgs = get_parliamentary_groups(abox.store_client)
-    pg_lookup = {}
-    for pg in pgs:
-        pg_lookup[abox.get_group_key(pg)] = pg
+    # Make a look-up dictionary of parliamentary group IRIs by key.
+    # NB The relevant prefix(es) should already be bound to the graph.
+    group_var_name = "f"
+    name_var_name = "name"
+    qstr = (
+        f'SELECT ?{group_var_name} ?{name_var_name}\n'
+        'WHERE {\n'
+        f'  ?{group_var_name} a pd:Fraktion .\n'
+        f'  ?{group_var_name} pd:hatName_kurz ?{name_var_name}\n'
+        '}'
+    )
+    pg_iri_lookup: dict[str, list[str]] = {}
+    for pg in abox.store_client.query(qstr)["results"]["bindings"]:
+        pg_iri_lookup.setdefault(abox.get_group_key(
+            pg[name_var_name]["value"]), []).append(
+            pg[group_var_name]["value"])
     # Query the parties from MdB master data for those speakers
     # without parliamentary group affiliation.
-    # NB The relevant prefix(es) should already be bound to the graph.
+    speaker_var_name = "r"
     id_var_name = "id"
     party_var_name = "partei"
     qstr = (
-        f'SELECT ?{id_var_name} ?{party_var_name}\n'
+        f'SELECT ?{speaker_var_name} ?{id_var_name} ?{party_var_name}\n'
         'WHERE {\n'
-        '  ?r a pd:Redner .\n'
-        f'  ?r pd:hatId ?{id_var_name} .\n'
-        '  FILTER NOT EXISTS { ?r pd:hatFraktion ?fraktion . }\n'
+        f'  ?{speaker_var_name} a pd:Redner .\n'
+        f'  ?{speaker_var_name} pd:hatId ?{id_var_name} .\n'
+        f'  FILTER NOT EXISTS {{ ?{speaker_var_name} pd:hatFraktion ?fraktion . }}\n'
         '  ?mdb a msd:Mdb .\n'
         f'  ?mdb msd:hatId ?{id_var_name} .\n'
         f'  ?mdb msd:hatPartei_kurz ?{party_var_name}\n'
         '}'
     )
     ids_parties = abox.store_client.query(qstr)["results"]["bindings"]
-    # Add parliamentary groups to speakers where applicable.
+    # Add parliamentary groups to speakers where applicable, in as few
+    # updates as possible.
+    triples: list[tuple[str, str, str]] = []
     for id_party in ids_parties:
         speaker_id = id_party[id_var_name]["value"]
-        pg_key = abox.get_group_key(id_party[party_var_name]["value"])
-        pg_name = pg_lookup[pg_key] if pg_key in pg_lookup else ""
-        # NB the XSD string is necessary. It will do nothing without!
-        ustr = (
-            'INSERT {\n'
-            '  ?r pd:hatFraktion ?f\n'
-            '} WHERE {\n'
-            '  ?r a pd:Redner .\n'
-            f'  ?r pd:hatId "{speaker_id}"^^xsd:string .\n'
-            '  ?f a pd:Fraktion .\n'
-            f'  ?f pd:hatName_kurz "{pg_name}"^^xsd:string\n'
-            '}'
-        )
-        abox.store_client.update(ustr)
-        log_msg(f"   Added '{pg_name}' to speaker '{speaker_id}'.")
+        party = id_party[party_var_name]["value"]
+        pg_iris = pg_iri_lookup.get(abox.get_group_key(party), [])
+        for pg_iri in pg_iris:
+            triples.append((makeIRIRef(id_party[speaker_var_name]["value"]),
+                "pd:hatFraktion", makeIRIRef(pg_iri)))
+        if len(pg_iris) > 0:
+            log_msg(f"   Adding '{party}' to speaker '{speaker_id}'.")
+    num_updates = abox.store_client.insert_data(triples,
+        prefixes={PD_PREFIX: PD_BASE_IRI})
+    log_msg(f"   Added {len(triples)} statements in {num_updates} update(s).")
 
 def name_to_iri(name: str, lookup: dict[str, str]) -> str:
     name_parts = name.split(" ")
@@ -717,6 +730,10 @@ def process_cto_iris_texts(
     cto_chain: RunnableSequence,
     speaker_name_iri_lookup: dict[str, str]
 ) -> None:
+    # Statements are added in batches rather than one by one.
+    ub = SPARQLUpdateBuilder()
+    ub.addPrefix(PD_PREFIX, PD_BASE_IRI)
+    ub.set_bulk(abox.store_client.update, max_triples=UPDATE_BATCH_SIZE)
     for iri_text in iris_texts:
         raw_speaker_list_str: str = cto_chain.invoke(
             {"text": iri_text[text_var_name]["value"]}
@@ -732,14 +749,10 @@ def process_cto_iris_texts(
                 speaker_iri = name_to_iri(speaker_name.strip(" "),
                     speaker_name_iri_lookup)
                 if speaker_iri != "":
-                    ustr = (
-                        'INSERT DATA {\n'
-                        f'  <{iri_text[iri_var_name]["value"]}> '
-                        'pd:hatOrdnungsruf_erteilt_an '
-                        f'<{speaker_iri}>\n'
-                        '}'
-                    )
-                    abox.store_client.update(ustr)
+                    ub.addInsert(makeIRIRef(iri_text[iri_var_name]["value"]),
+                        "pd:hatOrdnungsruf_erteilt_an",
+                        makeIRIRef(speaker_iri))
+    ub.flush()
 
 def add_calls_to_order(abox: ABox) -> None:
     """
@@ -856,22 +869,15 @@ def add_readings(abox: ABox) -> None:
     tops_2.difference_update(tops_23)
     tops_3.difference_update(tops_23)
     # Add the new statements to the KG.
-    statements: list[str] = []
-    for iri in tops_1:
-        statements.append(f'<{iri}> pd:hatLesung "1."^^xsd:string .')
-    for iri in tops_2:
-        statements.append(f'<{iri}> pd:hatLesung "2."^^xsd:string .')
-    for iri in tops_3:
-        statements.append(f'<{iri}> pd:hatLesung "3."^^xsd:string .')
-    for iri in tops_23:
-        statements.append(f'<{iri}> pd:hatLesung "2./3."^^xsd:string .')
-    ustr = (
-        'INSERT DATA {\n'
-        f'{"\n".join(statements)}'
-        '}'
-    )
-    abox.store_client.update(ustr)
-    log_msg(f"   Added {len(statements)} statements:")
+    triples: list[tuple[str, str, str]] = []
+    for tops, reading in [(tops_1, "1."), (tops_2, "2."), (tops_3, "3."),
+        (tops_23, "2./3.")]:
+        for iri in tops:
+            triples.append((makeIRIRef(iri), "pd:hatLesung",
+                makeLiteralStr(reading, XSD_STRING)))
+    num_updates = abox.store_client.insert_data(triples,
+        prefixes={PD_PREFIX: PD_BASE_IRI})
+    log_msg(f"   Added {len(triples)} statements in {num_updates} update(s):")
     log_msg(f"   1.: {len(tops_1)}")
     log_msg(f"   2.: {len(tops_2)}")
     log_msg(f"   3.: {len(tops_3)}")
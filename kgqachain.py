@@ -16,6 +16,7 @@ from pydantic import Field
 from rdflib.query import ResultRow
 from rdflib import Variable, URIRef, Literal
 from storeclient import StoreClient
+from llmcache import LLMResponseCache, cached, get_model_name
 
 def _make_result_row(r: dict) -> ResultRow:
     values = {}
@@ -65,11 +66,13 @@ class KGQAChain(Chain):
         llm: BaseLanguageModel,
         sparql_select_prompt: PromptTemplate,
         qa_prompt: PromptTemplate,
+        llm_cache: LLMResponseCache | None = None,
         **kwargs: Any,
     ) -> KGQAChain:
         """Initialize from LLM."""
         qa_chain = qa_prompt | llm
-        sparql_generation_select_chain = sparql_select_prompt | llm
+        sparql_generation_select_chain = sparql_select_prompt | cached(
+            llm, llm_cache, "sparql_generation_select", get_model_name(llm))
 
         return cls(
             qa_chain=qa_chain,
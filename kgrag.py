@@ -5,19 +5,20 @@ from langchain_core.prompts.prompt import PromptTemplate
 
 from common import *
 from ragconfig import *
-from storeclient import RemoteStoreClient
+from storeclient import make_store_client
 from kgqachain import KGQAChain
+from llmcache import make_llm_cache
 from questions import Questions, Answer
 
 class KGRAG:
 
     def __init__(self, config: RAGConfig) -> None:
-        store_client = RemoteStoreClient(config.get(CVN_ENDPOINT))
+        store_client = make_store_client(config, config.get(CVN_ENDPOINT))
         #schema = read_text_from_file(
         #    os.path.join("data", "processed",
         #    "MDB_STAMMDATEN-xml-tbox-description.txt"))
         schema = get_store_schema(
-            RemoteStoreClient(config.get(CVN_TBOX_ENDPOINT)),
+            make_store_client(config, config.get(CVN_TBOX_ENDPOINT)),
             {MMD_PREFIX: MMD_BASE_IRI, PD_PREFIX: PD_BASE_IRI}
         )
         log_msg(schema)
@@ -40,6 +41,7 @@ class KGRAG:
         self.chain = KGQAChain.from_llm(
             llm, sparql_gen_prompt, answer_gen_prompt,
             store_client=store_client, schema_description=schema,
+            llm_cache=make_llm_cache(config),
             verbose=True, return_sparql_query=True
         )
 
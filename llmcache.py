@@ -0,0 +1,217 @@
+"""
+Persistent cache for LLM responses, intended for deterministic
+(temperature 0) stages of a chain.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from time import time
+from typing import Any, Dict
+
+from langchain.schema.runnable import Runnable
+from langchain_core.messages import AIMessage
+from langchain_core.prompt_values import PromptValue
+
+from common import log_msg
+from ragconfig import RAGConfig, CVN_TEMPERATURE
+from ragconfig import CVN_LLM_CACHE, CVN_LLM_CACHE_SIZE, CVN_LLM_CACHE_TTLS
+
+# Key under which the time-to-live applying to all stages without
+# their own time-to-live is configured.
+DEFAULT_TTL_KEY = "default"
+
+# Types of cached values
+CVT_MESSAGE = "message"
+CVT_JSON    = "json"
+
+class LLMResponseCache:
+    """
+    Size-bounded, least-recently-used cache of LLM responses, persisted
+    in an SQLite database file. Entries are keyed by stage, model name,
+    and a hash of the rendered prompt, and expire after a time-to-live
+    (in seconds) that can be configured per stage.
+    """
+
+    def __init__(self, filename: str, max_entries: int = 10000,
+        ttls: dict[str, float] | None = None) -> None:
+        self._max_entries = max_entries
+        self._ttls = ttls if ttls is not None else {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, stage TEXT, value TEXT, "
+            "created REAL, accessed REAL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed "
+            "ON responses (accessed)"
+        )
+        self._conn.commit()
+        self._hits: dict[str, int] = {}
+        self._misses: dict[str, int] = {}
+
+    @staticmethod
+    def make_key(stage: str, model_name: str, prompt: str) -> str:
+        return hashlib.sha256(
+            "\n".join([stage, model_name, prompt]).encode()).hexdigest()
+
+    def _ttl(self, stage: str) -> float | None:
+        return self._ttls.get(stage, self._ttls.get(DEFAULT_TTL_KEY))
+
+    def lookup(self, stage: str, key: str) -> str | None:
+        """
+        Returns the cached value for the given key, or none if there
+        is no such value or if it has expired.
+        """
+        now = time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?",
+                (key,)).fetchone()
+            ttl = self._ttl(stage)
+            if row is not None and ttl is not None and now - row[1] > ttl:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self._misses[stage] = self._misses.get(stage, 0) + 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._hits[stage] = self._hits.get(stage, 0) + 1
+            return row[0]
+
+    def update(self, stage: str, key: str, value: str) -> None:
+        """
+        Stores a value, evicting the least recently used entries if the
+        maximum number of entries is exceeded.
+        """
+        now = time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, stage, value, now, now))
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed DESC "
+                "LIMIT -1 OFFSET ?)", (self._max_entries,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """
+        Returns the numbers of cache hits and misses per stage.
+        """
+        with self._lock:
+            return {
+                stage: {
+                    "hits": self._hits.get(stage, 0),
+                    "misses": self._misses.get(stage, 0)
+                }
+                for stage in sorted(set(self._hits) | set(self._misses))
+            }
+
+def _serialise(value: Any) -> str:
+    if isinstance(value, AIMessage):
+        return json.dumps({"type": CVT_MESSAGE, "value": value.content})
+    else:
+        return json.dumps({"type": CVT_JSON, "value": value})
+
+def _deserialise(value_str: str) -> Any:
+    d = json.loads(value_str)
+    if d["type"] == CVT_MESSAGE:
+        return AIMessage(content=d["value"])
+    else:
+        return d["value"]
+
+class RunnableCached(Runnable):
+    """
+    Runnable that looks up the response to a rendered prompt in an
+    LLM response cache before passing the prompt on to the wrapped
+    LLM runnable, and caches the response of the latter.
+    """
+
+    def __init__(self, runnable: Runnable, cache: LLMResponseCache,
+        stage: str, model_name: str) -> None:
+        self.runnable = runnable
+        self.cache = cache
+        self.stage = stage
+        self.model_name = model_name
+
+    def _key(self, input_data: PromptValue) -> str:
+        return self.cache.make_key(
+            self.stage, self.model_name, input_data.to_string())
+
+    def invoke(
+        self, input_data: PromptValue, config: Dict[str, Any] = None
+    ) -> Any:
+        key = self._key(input_data)
+        cached = self.cache.lookup(self.stage, key)
+        if cached is not None:
+            log_msg(f"LLM cache hit for stage '{self.stage}'.",
+                level=logging.DEBUG)
+            return _deserialise(cached)
+        response = self.runnable.invoke(input_data, config)
+        self.cache.update(self.stage, key, _serialise(response))
+        return response
+
+    async def ainvoke(
+        self, input_data: PromptValue, config: Dict[str, Any] = None
+    ) -> Any:
+        # NB Look-ups in the local database are fast enough not to be
+        # worth a thread hop.
+        key = self._key(input_data)
+        cached = self.cache.lookup(self.stage, key)
+        if cached is not None:
+            log_msg(f"LLM cache hit for stage '{self.stage}'.",
+                level=logging.DEBUG)
+            return _deserialise(cached)
+        response = await self.runnable.ainvoke(input_data, config)
+        self.cache.update(self.stage, key, _serialise(response))
+        return response
+
+def get_model_name(llm: Any) -> str:
+    """
+    Returns the name of the model underlying an LLM, or its class name
+    if the former cannot be determined.
+    """
+    for attr in ("model_name", "model"):
+        name = getattr(llm, attr, None)
+        if isinstance(name, str):
+            return name
+    return llm.__class__.__name__
+
+def cached(runnable: Runnable, cache: LLMResponseCache | None, stage: str,
+    model_name: str) -> Runnable:
+    """
+    Wraps an LLM runnable in a cache look-up, if a cache is given.
+    """
+    if cache is None:
+        return runnable
+    return RunnableCached(runnable, cache, stage, model_name)
+
+def make_llm_cache(config: RAGConfig) -> LLMResponseCache | None:
+    """
+    Returns a cache of LLM responses as configured, or none if no cache
+    file is configured or if the LLM is not deterministic.
+    """
+    filename = config.get_or_default(CVN_LLM_CACHE)
+    if filename is None or filename == "":
+        return None
+    if config.get(CVN_TEMPERATURE) != 0.0:
+        log_msg("Not caching LLM responses, as the temperature "
+            "is non-zero.", level=logging.WARN)
+        return None
+    return LLMResponseCache(filename,
+        max_entries=config.get_or_default(CVN_LLM_CACHE_SIZE, 10000),
+        ttls=config.get_or_default(CVN_LLM_CACHE_TTLS))
@@ -0,0 +1,105 @@
+"""
+Filters on speech metadata for vector store searches, as derived from
+the classification of SPARQL queries.
+"""
+
+from qdrant_client.http import models
+from qdrant_client.http.models import PayloadSchemaType
+
+from sparqlanalysis import CRK_START_DATE, CRK_END_DATE, CRK_PARTY
+from sparqlanalysis import CRK_SPEAKER, CRK_PERIOD, CRK_SESSION, CRK_READING
+from sparqlanalysis import CRK_EXCLUDED_PREFIX
+from vectorstore import PAYLOAD_INDEXES, metadata_key
+
+# Metadata fields, see `SpeechKGLoader`, by classification result key
+CLASSIFICATION_FIELDS = {
+    CRK_PARTY: "Fraktion",
+    CRK_SPEAKER: "Redner",
+    CRK_PERIOD: "Wahlperiode",
+    CRK_SESSION: "Sitzungnr",
+    CRK_READING: "Lesung",
+}
+DATE_FIELD = "Datum"
+
+class FieldFilter:
+    """
+    Condition on a metadata field, which either has to match any of the
+    given values, or fall into the given (inclusive) range, which is only
+    supported for date fields. Negated conditions exclude matches.
+    """
+
+    def __init__(self, field: str, values: list[str] | None = None,
+        gte: str | None = None, lte: str | None = None,
+        negate: bool = False) -> None:
+        if (values is None) == (gte is None and lte is None):
+            raise ValueError("Either values or a range must be given!")
+        if values is None and (
+            PAYLOAD_INDEXES.get(field) != PayloadSchemaType.DATETIME):
+            raise ValueError(f"Ranges of field '{field}' are not supported!")
+        self.field = field
+        self.values = values
+        self.gte = gte
+        self.lte = lte
+        self.negate = negate
+
+    def __repr__(self) -> str:
+        condition = (f"in {self.values}" if self.values is not None
+            else f"in [{self.gte}, {self.lte}]")
+        return f"{self.field} {'not ' if self.negate else ''}{condition}"
+
+    def to_condition(self) -> models.FieldCondition:
+        key = metadata_key(self.field)
+        if self.values is None:
+            # https://qdrant.tech/documentation/concepts/filtering/
+            # Use a full datetime stamp, e.g. "2023-02-08T10:49:00Z", but
+            # just date also seems to work.
+            return models.FieldCondition(key=key,
+                range=models.DatetimeRange(gte=self.gte, lte=self.lte))
+        if len(self.values) == 1:
+            return models.FieldCondition(key=key,
+                match=models.MatchValue(value=self.values[0]))
+        return models.FieldCondition(key=key,
+            match=models.MatchAny(any=self.values))
+
+def make_metadata_filter(field_filters: list[FieldFilter]
+) -> models.Filter | None:
+    """
+    Combines conditions on metadata fields, all of which must apply,
+    into a filter for the vector store search, if there are any.
+    """
+    must = [f.to_condition() for f in field_filters if not f.negate]
+    must_not = [f.to_condition() for f in field_filters if f.negate]
+    if len(must) == 0 and len(must_not) == 0:
+        return None
+    return models.Filter(must=must or None, must_not=must_not or None)
+
+def _as_values(value) -> list[str]:
+    """
+    Returns a classification result value, which is either the empty
+    string, a single value, or a list of values, as a list of values.
+    """
+    if isinstance(value, list):
+        return [str(v) for v in value if str(v) != ""]
+    return [] if value is None or str(value) == "" else [str(value)]
+
+def field_filters_from_classification(cl_res: dict) -> list[FieldFilter]:
+    """
+    Returns the conditions on metadata fields implied by the result of
+    classifying a SPARQL query, i.e. a date range, and any required or
+    excluded values of other fields.
+    """
+    field_filters = []
+    start_date = cl_res.get(CRK_START_DATE, "")
+    end_date = cl_res.get(CRK_END_DATE, "")
+    if start_date != "" or end_date != "":
+        field_filters.append(FieldFilter(DATE_FIELD,
+            gte=start_date or None, lte=end_date or None))
+    for key, field in CLASSIFICATION_FIELDS.items():
+        values = _as_values(cl_res.get(key))
+        if len(values) > 0:
+            field_filters.append(FieldFilter(field, values=values))
+        excluded = _as_values(cl_res.get(CRK_EXCLUDED_PREFIX+key))
+        if len(excluded) > 0:
+            field_filters.append(FieldFilter(field, values=excluded,
+                negate=True))
+    return field_filters
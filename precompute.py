@@ -0,0 +1,139 @@
+"""
+Precomputation of answers to the questions of a catalogue, e.g. the
+sample questions offered by the frontend, such that these can be served
+instantly.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime
+
+from common import ES_UTF_8, log_msg
+from answercache import normalise_question
+from hybridrag import HybridRAG
+from questions import Questions, Question, Answer
+from ragconfig import RAGConfig, CVN_PRECOMPUTE_CONCURRENCY
+
+# Agent name under which precomputed answers are recorded
+PRECOMPUTE_AGENT = "Hybrid-RAG"
+
+def make_with_answers_filename(catalogue_filename: str) -> str:
+    """
+    Returns the name of the file in which a question catalogue is saved
+    together with its answers.
+    """
+    base, ext = os.path.splitext(catalogue_filename)
+    return "".join([base, "-with-answers", ext])
+
+class PrecomputedAnswers:
+    """
+    Question catalogue with precomputed answers, which are looked up by
+    normalised question text, and which are only valid for the dataset
+    version they were computed from.
+    """
+
+    def __init__(self, catalogue_filename: str,
+        agent: str = PRECOMPUTE_AGENT) -> None:
+        self.catalogue_filename = catalogue_filename
+        self.save_filename = make_with_answers_filename(catalogue_filename)
+        self.agent = agent
+        self.questions = Questions()
+        self.questions.load(catalogue_filename)
+        if os.path.isfile(self.save_filename):
+            self._merge_saved_answers()
+        self._lookup = {normalise_question(q.get_text()): q
+            for q in self.questions.get_questions()}
+
+    def _merge_saved_answers(self) -> None:
+        """
+        Adds the latest precomputed answers saved with the catalogue to
+        the catalogue questions with the same text, such that questions
+        that have since been edited are answered anew, and answers to
+        questions that have since been removed are dropped.
+        """
+        saved = Questions()
+        saved.load(self.save_filename)
+        for q in self.questions.get_questions():
+            saved_q = saved.find_question(q.get_text())
+            a = None if saved_q is None else (
+                saved_q.get_latest_answer(self.agent))
+            if a is not None:
+                q.add_answer(a)
+
+    def _current_answer(self, q: Question, version: str) -> Answer | None:
+        a = q.get_latest_answer(self.agent)
+        if a is None or a.get_dataset_version() != version:
+            return None
+        return a
+
+    def lookup(self, question: str, version: str) -> Answer | None:
+        """
+        Returns the precomputed answer to a catalogue question, if it is
+        valid for the given dataset version, or none otherwise.
+        """
+        q = self._lookup.get(normalise_question(question))
+        return None if q is None else self._current_answer(q, version)
+
+    def outdated(self, version: str) -> list[Question]:
+        """
+        Returns the catalogue questions without an answer that is valid
+        for the given dataset version.
+        """
+        return [q for q in self.questions.get_questions()
+            if self._current_answer(q, version) is None]
+
+    async def refresh(self, rag: HybridRAG, concurrency: int = 4) -> int:
+        """
+        Answers all outdated catalogue questions, at most the given
+        number at a time, saves the catalogue, and returns the number of
+        questions answered. Questions that cannot be answered keep their
+        previous answers.
+        WARNING: This may cost real money and may be expensive!
+        """
+        version = await rag.version_probe.aget()
+        outdated = self.outdated(version)
+        if len(outdated) == 0:
+            return 0
+        log_msg(f"Precomputing answers to {len(outdated)} questions "
+            f"for dataset version '{version}'...")
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def answer(q: Question) -> bool:
+            async with semaphore:
+                try:
+                    # NB The answer caches are bypassed, as similar
+                    # catalogue questions must not share answers.
+                    result = await rag.chain.ainvoke(q.get_text())
+                except Exception as e:
+                    log_msg(f"Error precomputing answer to question "
+                        f"'{q.get_id()}': {e}", level=logging.WARN)
+                    return False
+            q.add_answer(Answer(result[rag.chain.answer_key], self.agent,
+                datetime.now(), sources=result[rag.chain.sources_key],
+                dataset_version=version))
+            return True
+
+        answered = sum(await asyncio.gather(*[answer(q) for q in outdated]))
+        self.questions.save(self.save_filename)
+        log_msg(f"Precomputed answers to {answered} questions, "
+            f"saved to '{self.save_filename}'.")
+        return answered
+
+def main():
+    """
+    Precomputes answers to the sample question catalogue offline.
+    """
+    logging.basicConfig(filename="precompute.log", encoding=ES_UTF_8,
+        level=logging.INFO)
+    config = RAGConfig("config-hybrid.yaml")
+    config.check()
+    config.set_openai_api_key()
+    rag = HybridRAG(config)
+    precomputed = PrecomputedAnswers(
+        os.path.join("data", "questions-example.json"))
+    asyncio.run(precomputed.refresh(rag, concurrency=config.get_or_default(
+        CVN_PRECOMPUTE_CONCURRENCY, 4)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+Caching of SPARQL query results, for knowledge graphs that do not
+change between uploads.
+"""
+
+import copy
+import hashlib
+import heapq
+import json
+import logging
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from itertools import islice
+from time import time
+from typing import AsyncIterator, Iterator
+
+from common import log_msg
+from datasetversion import DatasetVersionProbe
+from sparqlresults import RF_TSV, TabularResult
+from storeclient import StoreClient, AsyncStoreClient
+from ragconfig import RAGConfig, CVN_QUERY_CACHE_FILE, CVN_QUERY_CACHE_SIZE
+
+# Tokens of a query that must not be altered by normalisation, i.e.
+# string literals and IRIs, and comments, which are removed.
+QUERY_TOKEN_PATTERN = re.compile(
+    r'("""(?:[^"\\]|\\.|"(?!""))*"""'
+    r"|'''(?:[^'\\]|\\.|'(?!''))*'''"
+    r'|"(?:[^"\\\n]|\\.)*"'
+    r"|'(?:[^'\\\n]|\\.)*'"
+    r'|<[^<>"{}|^`\\\s]*>)'
+    r"|(#[^\n]*)"
+)
+PREFIX_DECL_PATTERN = re.compile(r"PREFIX ([^\s:]*): ?(<[^>]*>) ?",
+    re.IGNORECASE)
+
+# Maximum number of queries for which hit statistics are kept
+STATS_MAX_QUERIES = 10000
+# Number of most frequently hit queries reported in the statistics, which
+# are kept short as queries are generated from users' questions
+STATS_TOP_QUERIES = 20
+
+def normalise_query(query_str: str) -> str:
+    """
+    Normalises a query such that trivially different spellings of the
+    same query, in terms of white space, comments and the order of
+    prefix declarations, map to the same text.
+    """
+    parts: list[str] = []
+    # Text between string literals and IRIs, where white space and
+    # comments are insignificant
+    pending: list[str] = []
+    pos = 0
+    for m in QUERY_TOKEN_PATTERN.finditer(query_str):
+        pending.append(query_str[pos:m.start()])
+        if m.group(1) is not None:
+            parts.append(re.sub(r"\s+", " ", "".join(pending)))
+            parts.append(m.group(1))
+            pending = []
+        else:
+            # A comment is equivalent to white space.
+            pending.append(" ")
+        pos = m.end()
+    pending.append(query_str[pos:])
+    parts.append(re.sub(r"\s+", " ", "".join(pending)))
+    text = "".join(parts).strip()
+    # Sort leading prefix declarations, unless a prefix is declared more
+    # than once, in which case their order matters.
+    decls: list[tuple[str, str]] = []
+    pos = 0
+    while (m := PREFIX_DECL_PATTERN.match(text, pos)) is not None:
+        decls.append((m.group(1), m.group(2)))
+        pos = m.end()
+    if len({name for name, _ in decls}) < len(decls):
+        return text
+    return " ".join([f"PREFIX {name}: {iri}" for name, iri in sorted(decls)]
+        + [text[pos:]])
+
+class _CacheEntry:
+
+    def __init__(self, result: dict, complete: bool, version: str) -> None:
+        self.result = result
+        # Whether the result contains all rows, rather than just the
+        # first ones
+        self.complete = complete
+        self.version = version
+
+    def covers(self, max_rows: int | None) -> bool:
+        return self.complete or (max_rows is not None
+            and len(self.result["results"]["bindings"]) >= max_rows)
+
+class QueryResultCache:
+    """
+    Size-bounded, least-recently-used in-memory cache of query results,
+    keyed by normalised query text, and optionally persisted in an SQLite
+    database file, such that results survive restarts. Each result is
+    tagged with the version of the dataset it was retrieved from, and is
+    only returned as long as that version is current.
+
+    Results of queries that were only read up to a maximum number of
+    rows are cached, too, and serve later requests for at most as many
+    rows.
+    """
+
+    def __init__(self, max_entries: int = 1000, filename: str | None = None,
+        version_probe: DatasetVersionProbe | None = None) -> None:
+        self.max_entries = max_entries
+        self.version_probe = version_probe
+        self._entries: OrderedDict[str, _CacheEntry] = OrderedDict()
+        # Hits and misses per normalised query
+        self._query_stats: OrderedDict[str, list[int]] = OrderedDict()
+        # Number of times the cache has been cleared, such that results
+        # of queries issued before an update are not cached after it
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if filename is not None:
+            self._conn = sqlite3.connect(filename, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, version TEXT, complete INTEGER, "
+                "value TEXT, accessed REAL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS results_accessed "
+                "ON results (accessed)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(normalised_query: str) -> str:
+        return hashlib.sha256(normalised_query.encode()).hexdigest()
+
+    def get_version(self) -> str:
+        return "" if self.version_probe is None else self.version_probe.get()
+
+    async def aget_version(self) -> str:
+        return ("" if self.version_probe is None
+            else await self.version_probe.aget())
+
+    def _count(self, normalised_query: str, hit: bool) -> None:
+        counts = self._query_stats.setdefault(normalised_query, [0, 0])
+        counts[0 if hit else 1] += 1
+        self._query_stats.move_to_end(normalised_query)
+        while len(self._query_stats) > STATS_MAX_QUERIES:
+            self._query_stats.popitem(last=False)
+
+    def _load(self, key: str) -> _CacheEntry | None:
+        if self._conn is None:
+            return None
+        row = self._conn.execute(
+            "SELECT version, complete, value FROM results WHERE key = ?",
+            (key,)).fetchone()
+        if row is None:
+            return None
+        self._conn.execute(
+            "UPDATE results SET accessed = ? WHERE key = ?", (time(), key))
+        self._conn.commit()
+        return _CacheEntry(json.loads(row[2]), bool(row[1]), row[0])
+
+    def _put(self, key: str, entry: _CacheEntry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _remove(self, key: str) -> None:
+        self._entries.pop(key, None)
+        if self._conn is not None:
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def lookup(self, query_str: str, version: str,
+        max_rows: int | None = None, need_head: bool = False
+    ) -> dict | None:
+        """
+        Returns a copy of the cached result of the given query, if it is
+        from the given dataset version and contains the given number of
+        rows, or all rows if none is given, or none otherwise.
+        """
+        normalised_query = normalise_query(query_str)
+        key = self.make_key(normalised_query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._load(key)
+                if entry is not None:
+                    self._put(key, entry)
+            if entry is not None and entry.version != version:
+                self._remove(key)
+                entry = None
+            hit = (entry is not None and entry.covers(max_rows)
+                and (not need_head or "head" in entry.result))
+            self._count(normalised_query, hit)
+            if not hit:
+                return None
+            self._entries.move_to_end(key)
+            log_msg("Query cache hit.", level=logging.DEBUG)
+            # NB Callers may modify the result, e.g. add to it.
+            return copy.deepcopy(entry.result)
+
+    def update(self, query_str: str, version: str, result: dict,
+        complete: bool = True, generation: int | None = None) -> None:
+        """
+        Caches a copy of the result of the given query, unless the cache has been
+        cleared since the given generation, if any, when the query was
+        issued.
+        """
+        if self.max_entries <= 0:
+            return
+        key = self.make_key(normalise_query(query_str))
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._put(key, _CacheEntry(copy.deepcopy(result), complete,
+                version))
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                    (key, version, int(complete), json.dumps(result), time()))
+                self._conn.execute(
+                    "DELETE FROM results WHERE key IN ("
+                    "SELECT key FROM results ORDER BY accessed DESC "
+                    "LIMIT -1 OFFSET ?)", (self.max_entries,))
+                self._conn.commit()
+
+    def clear(self) -> None:
+        """
+        Removes all results, e.g. after an update, and forces the dataset
+        version to be probed again, as an update may leave it unchanged.
+        """
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM results")
+                self._conn.commit()
+        if self.version_probe is not None:
+            self.version_probe.invalidate()
+
+    def stats(self) -> dict:
+        """
+        Returns the total numbers of hits and misses, and the numbers of
+        hits and misses of the most frequently hit queries.
+        """
+        with self._lock:
+            queries = heapq.nlargest(STATS_TOP_QUERIES,
+                self._query_stats.items(), key=lambda item: item[1][0])
+            return {
+                "hits": sum(c[0] for c in self._query_stats.values()),
+                "misses": sum(c[1] for c in self._query_stats.values()),
+                "size": len(self._entries),
+                "distinct_queries": len(self._query_stats),
+                "top_queries": [{"query": q, "hits": c[0], "misses": c[1]}
+                    for q, c in queries]
+            }
+
+class CachingStoreClient(StoreClient):
+    """
+    Store client that looks up query results in a cache before passing
+    queries on to the wrapped store client, and caches the results of
+    the latter. Any update clears the cache once it has been applied.
+    Bulk reads via `query_rows`
+    are passed on without caching.
+    NB If the cache uses a dataset version probe, the probe must use
+    the wrapped store client, not this one.
+    """
+
+    def __init__(self, store_client: StoreClient,
+        cache: QueryResultCache) -> None:
+        self.store_client = store_client
+        self.cache = cache
+
+    def query(self, query_str: str) -> dict:
+        generation = self.cache.generation
+        version = self.cache.get_version()
+        result = self.cache.lookup(query_str, version, need_head=True)
+        if result is None:
+            result = self.store_client.query(query_str)
+            self.cache.update(query_str, version, result,
+                generation=generation)
+        return result
+
+    def query_iter(self, query_str: str,
+        max_rows: int | None = None) -> Iterator[dict]:
+        generation = self.cache.generation
+        version = self.cache.get_version()
+        result = self.cache.lookup(query_str, version, max_rows=max_rows)
+        if result is None:
+            rows = list(self.store_client.query_iter(query_str, max_rows))
+            result = {"results": {"bindings": rows}}
+            self.cache.update(query_str, version, result,
+                complete=max_rows is None or len(rows) < max_rows,
+                generation=generation)
+        return islice(result["results"]["bindings"], max_rows)
+
+    def query_rows(self, query_str: str,
+        result_format: str = RF_TSV) -> TabularResult:
+        return self.store_client.query_rows(query_str, result_format)
+
+    def update(self, query_str: str) -> None:
+        # NB The cache is cleared after the update, as queries issued
+        # while it is applied may still see the old data.
+        try:
+            self.store_client.update(query_str)
+        finally:
+            self.cache.clear()
+
+    def close(self) -> None:
+        self.store_client.close()
+
+class AsyncCachingStoreClient(AsyncStoreClient):
+    """
+    Asynchronous counterpart of `CachingStoreClient`, which may share
+    its cache.
+    """
+
+    def __init__(self, store_client: AsyncStoreClient,
+        cache: QueryResultCache) -> None:
+        self.store_client = store_client
+        self.cache = cache
+
+    async def query(self, query_str: str) -> dict:
+        generation = self.cache.generation
+        version = await self.cache.aget_version()
+        result = self.cache.lookup(query_str, version, need_head=True)
+        if result is None:
+            result = await self.store_client.query(query_str)
+            self.cache.update(query_str, version, result,
+                generation=generation)
+        return result
+
+    async def query_iter(self, query_str: str,
+        max_rows: int | None = None) -> AsyncIterator[dict]:
+        generation = self.cache.generation
+        version = await self.cache.aget_version()
+        result = self.cache.lookup(query_str, version, max_rows=max_rows)
+        if result is None:
+            rows = [row async for row in self.store_client.query_iter(
+                query_str, max_rows)]
+            result = {"results": {"bindings": rows}}
+            self.cache.update(query_str, version, result,
+                complete=max_rows is None or len(rows) < max_rows,
+                generation=generation)
+        for row in islice(result["results"]["bindings"], max_rows):
+            yield row
+
+    async def query_rows(self, query_str: str,
+        result_format: str = RF_TSV) -> TabularResult:
+        return await self.store_client.query_rows(query_str, result_format)
+
+    async def update(self, query_str: str) -> None:
+        try:
+            await self.store_client.update(query_str)
+        finally:
+            self.cache.clear()
+
+    async def close(self) -> None:
+        await self.store_client.close()
+
+def make_query_cache(config: RAGConfig,
+    version_probe: DatasetVersionProbe | None = None
+) -> QueryResultCache | None:
+    """
+    Returns a query result cache as configured, or none if caching is
+    disabled.
+    """
+    max_entries = config.get_or_default(CVN_QUERY_CACHE_SIZE, 1000)
+    if max_entries <= 0:
+        return None
+    return QueryResultCache(max_entries=max_entries,
+        filename=config.get_or_default(CVN_QUERY_CACHE_FILE),
+        version_probe=version_probe)
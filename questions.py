@@ -9,22 +9,49 @@ QADF_ANSWERS   = "answers"
 QADF_CATEGORY  = "category"
 QADF_ID        = "id"
 QADF_QUESTIONS = "questions"
+QADF_SOURCES   = "sources"
 QADF_TEXT      = "text"
 QADF_TIMESTAMP = "timestamp"
+QADF_VERSION   = "dataset_version"
 
 class Answer:
 
-    def __init__(self, text: str, agent: str, timestamp: datetime) -> None:
+    def __init__(self, text: str, agent: str, timestamp: datetime,
+        sources: str="", dataset_version: str="") -> None:
         self._text = text
         self._agent = agent
         self._timestamp = timestamp
+        self._sources = sources
+        self._dataset_version = dataset_version
+
+    def get_text(self) -> str:
+        return self._text
+
+    def get_agent(self) -> str:
+        return self._agent
+
+    def get_timestamp(self) -> datetime:
+        return self._timestamp
+
+    def get_sources(self) -> str:
+        return self._sources
+
+    def get_dataset_version(self) -> str:
+        return self._dataset_version
 
     def to_dict(self) -> dict:
-        return {
+        d = {
             QADF_TEXT: self._text,
             QADF_AGENT: self._agent,
             QADF_TIMESTAMP: self._timestamp.strftime(FMT_DATE_TIME)
         }
+        # Optional fields are only written if set, in order to keep
+        # existing catalogues unchanged.
+        if self._sources != "":
+            d[QADF_SOURCES] = self._sources
+        if self._dataset_version != "":
+            d[QADF_VERSION] = self._dataset_version
+        return d
 
 class Question:
 
@@ -46,6 +73,16 @@ class Question:
     def add_answer(self, answer: Answer) -> None:
         self._answers.append(answer)
 
+    def get_latest_answer(self, agent: str | None = None) -> Answer | None:
+        """
+        Returns the most recently added answer, optionally restricted to
+        answers by the given agent, or none if there is no such answer.
+        """
+        for a in reversed(self._answers):
+            if agent is None or a.get_agent() == agent:
+                return a
+        return None
+
     def to_dict(self) -> dict:
         answers = [a.to_dict() for a in self._answers]
         return {
@@ -60,6 +97,9 @@ class Questions:
     def __init__(self) -> None:
         self._content: list[Question] = []
 
+    def get_questions(self) -> list[Question]:
+        return self._content
+
     def find_question(self, text: str) -> Question | None:
         """
         If the text matches, returns a reference to an existing question
@@ -125,7 +165,9 @@ class Questions:
                 )
                 for a_dict in q_dict[QADF_ANSWERS]:
                     q.add_answer(Answer(a_dict[QADF_TEXT], a_dict[QADF_AGENT],
-                        datetime.strptime(a_dict[QADF_TIMESTAMP], FMT_DATE_TIME)))
+                        datetime.strptime(a_dict[QADF_TIMESTAMP], FMT_DATE_TIME),
+                        sources=a_dict.get(QADF_SOURCES, ""),
+                        dataset_version=a_dict.get(QADF_VERSION, "")))
                 self.add_question(q)
 
     def save(self, filename: str) -> None:
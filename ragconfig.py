@@ -1,25 +1,70 @@
+import argparse
 import yaml
 import os
 
 # Configuration variable names
+CVN_ANSWER_CACHE_SIZE = "AnswerCacheMaxEntries"
+CVN_ANSWER_CACHE_TTL  = "AnswerCacheTTL"
+CVN_BULK_LOAD_CHUNK_SIZE = "BulkLoadChunkSize"
+CVN_BULK_LOAD_MODE       = "BulkLoadMode"
+CVN_BULK_LOAD_RETRIES    = "BulkLoadRetries"
+CVN_BULK_LOAD_WORKERS    = "BulkLoadWorkers"
 CVN_CHUNK_OVERLAP   = "ChunkOverlap"
 CVN_CHUNK_SIZE      = "ChunkSize"
 CVN_EMBEDDING_CACHE = "EmbeddingCacheDirectory"
+CVN_EMBEDDING_CACHE_FILE = "EmbeddingCacheFile"
 CVN_EMBEDDING_DIM   = "EmbeddingDimension"
 CVN_EMBEDDING_MODEL = "EmbeddingModel"
 CVN_ENDPOINT        = "Endpoint"
+CVN_ENDPOINTS       = "Endpoints"
+CVN_DS_VERSION_INTERVAL = "DatasetVersionCheckInterval"
+CVN_HEALTH_CHECK_INTERVAL = "HealthCheckInterval"
+CVN_HEDGE_PERCENTILE      = "HedgePercentile"
 CVN_KG_MAX_ITEMS    = "KGMaxItems"
+CVN_LLM_CACHE       = "LLMCacheFile"
+CVN_LLM_CACHE_SIZE  = "LLMCacheMaxEntries"
+CVN_LLM_CACHE_TTLS  = "LLMCacheTTLs"
 CVN_MODEL           = "Model"
 CVN_OPENAI_API_KEY  = "OPENAI_API_KEY"
+CVN_PRECOMPUTE_CONCURRENCY = "PrecomputeConcurrency"
+CVN_PRECOMPUTE_REFRESH     = "PrecomputeRefresh"
+CVN_SEMANTIC_CACHE_SIZE      = "SemanticCacheMaxEntries"
+CVN_SEMANTIC_CACHE_THRESHOLD = "SemanticCacheThreshold"
+CVN_QUERY_CACHE_FILE     = "QueryCacheFile"
+CVN_QUERY_CACHE_SIZE     = "QueryCacheMaxEntries"
+CVN_QUERY_EMB_CACHE_SIZE = "QueryEmbeddingCacheSize"
+CVN_QUERY_EMB_PERSISTENT = "QueryEmbeddingCachePersistent"
+CVN_STORE_CONNECT_TIMEOUT = "StoreConnectTimeout"
+CVN_STORE_KEEP_ALIVE      = "StoreKeepAlive"
+CVN_STORE_POOL_SIZE       = "StorePoolSize"
+CVN_STORE_READ_TIMEOUT    = "StoreReadTimeout"
+CVN_STORE_SERVER_TIMEOUT  = "StoreServerTimeout"
 CVN_TEMPERATURE     = "Temperature"
 CVN_TBOX_ENDPOINT   = "TBoxEndpoint"
 CVN_THRESHOLD_SCORE = "ThresholdScore"
 CVN_THRESHOLD_TOP_K = "ThresholdTop_k"
 CVN_TOP_K           = "Top_k"
 CVN_VS_COLLECTION   = "VectorStoreCollectionName"
+CVN_VS_OVERSAMPLING = "VectorStoreOversampling"
+CVN_VS_QUANTIZATION = "VectorStoreQuantization"
 CVN_VSTORE_CACHE    = "VectorStoreCacheDirectory"
+CVN_VSTORE_URL      = "VectorStoreURL"
 CONFIG_VAR_NAMES = [CVN_ENDPOINT, CVN_MODEL, CVN_OPENAI_API_KEY, CVN_TEMPERATURE]
 
+# Configuration file read by the app
+APP_CONFIG_FILE = "config-hybrid.yaml"
+
+def make_arg_parser(description: str) -> argparse.ArgumentParser:
+    """
+    Returns a command-line argument parser for a maintenance script, with
+    an option for the configuration file to be read, which by default is
+    the one read by the app, whose data the script maintains.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--config", default=APP_CONFIG_FILE,
+        help=f"configuration file (default: {APP_CONFIG_FILE})")
+    return parser
+
 class RAGConfig:
 
     def __init__(self, yaml_file_name: str) -> None:
@@ -38,6 +83,13 @@ class RAGConfig:
         else:
             raise NameError(f"No '{var_name}' provided in configuration!")
 
+    def get_or_default(self, var_name: str, default=None):
+        """
+        Returns the value of the variable with the given name, or the
+        given default value if the variable is not provided.
+        """
+        return self._config.get(var_name, default)
+
     def check(self) -> None:
         """
         Checks for presence and non-emptiness of all expected
@@ -0,0 +1,271 @@
+"""
+Store client that spreads queries across several replicas of a SPARQL
+endpoint, e.g. Blazegraph instances holding the same data.
+"""
+
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor
+from concurrent.futures import wait
+from collections import deque
+from time import perf_counter
+from typing import Any, Callable, Iterator
+
+import requests
+
+from common import log_msg
+from sparqlresults import RF_TSV, TabularResult
+from storeclient import StoreClient, PooledStoreClient, make_store_client
+from ragconfig import RAGConfig, CVN_STORE_POOL_SIZE
+from ragconfig import CVN_HEALTH_CHECK_INTERVAL, CVN_HEDGE_PERCENTILE
+
+HEALTH_CHECK_QUERY = "ASK {}"
+
+# Number of recent request latencies from which the hedging delay is
+# determined, and minimum number required to hedge at all
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+class _Replica:
+
+    def __init__(self, client: PooledStoreClient) -> None:
+        self.client = client
+        self.healthy = True
+        # Whether the replica failed to apply an update that others
+        # applied, in which case its data may differ from theirs
+        self.diverged = False
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+
+class ReplicatedStoreClient(StoreClient):
+    """
+    Client for several replicas of a SPARQL endpoint. Each query is sent
+    to the healthy replica with the fewest outstanding requests. If it
+    takes longer than the given percentile of recent latencies, the
+    query is sent to a second replica, too (i.e. hedged), and whichever
+    reply arrives first is returned. Replicas that fail to respond are
+    considered unhealthy, the query is retried on another replica, and
+    unhealthy replicas are checked periodically (every given number of
+    seconds) until they respond again.
+
+    Updates are sent to all replicas, as these are assumed to hold
+    independent copies of the data. Replicas that fail to apply an
+    update which others applied are taken out of rotation for good, as
+    their data may differ, until they are resynchronised and restarted.
+    """
+
+    def __init__(self, clients: list[PooledStoreClient],
+        hedge_percentile: float | None = 95.0,
+        health_check_interval: float = 30.0, max_workers: int = 20) -> None:
+        if len(clients) == 0:
+            raise ValueError("At least one replica is required!")
+        self.replicas = [_Replica(c) for c in clients]
+        self.hedge_percentile = hedge_percentile
+        self.health_check_interval = health_check_interval
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._stopped = threading.Event()
+        self._health_checker = threading.Thread(
+            target=self._check_health_periodically, daemon=True)
+        self._health_checker.start()
+
+    def _check_health_periodically(self) -> None:
+        while not self._stopped.wait(self.health_check_interval):
+            for replica in self.replicas:
+                if not replica.healthy and not replica.diverged:
+                    self.check_health(replica)
+
+    def check_health(self, replica: _Replica) -> bool:
+        """
+        Checks whether the given replica responds to a trivial query,
+        and updates its health accordingly.
+        """
+        try:
+            replica.client.query(HEALTH_CHECK_QUERY)
+            healthy = True
+        except Exception:
+            healthy = False
+        if healthy != replica.healthy:
+            log_msg(f"Replica '{replica.client.url()}' is now "
+                f"{'healthy' if healthy else 'unhealthy'}.",
+                level=logging.INFO if healthy else logging.WARN)
+        replica.healthy = healthy
+        return healthy
+
+    def _acquire(self, exclude: set[_Replica]) -> _Replica | None:
+        """
+        Returns the replica with the fewest outstanding requests among
+        the healthy ones that are not excluded, or among the unhealthy
+        ones if no healthy one is left, and counts the new request.
+        Diverged replicas are never returned.
+        """
+        with self._lock:
+            candidates = [r for r in self.replicas
+                if r not in exclude and not r.diverged]
+            if len(candidates) == 0:
+                return None
+            healthy = [r for r in candidates if r.healthy]
+            replica = min(healthy if len(healthy) > 0 else candidates,
+                key=lambda r: r.outstanding)
+            replica.outstanding += 1
+            replica.requests += 1
+            return replica
+
+    def _run(self, replica: _Replica,
+        func: Callable[[PooledStoreClient], Any]) -> Any:
+        t_start = perf_counter()
+        try:
+            result = func(replica.client)
+        except Exception as e:
+            # If the query itself is at fault, the replica is fine.
+            if not self._is_query_error(e):
+                replica.failures += 1
+                replica.healthy = False
+            raise
+        finally:
+            with self._lock:
+                replica.outstanding -= 1
+        with self._lock:
+            self._latencies.append(perf_counter() - t_start)
+        replica.healthy = True
+        return result
+
+    def _hedge_delay(self) -> float | None:
+        with self._lock:
+            if (self.hedge_percentile is None
+                or len(self._latencies) < MIN_LATENCY_SAMPLES):
+                return None
+            latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1,
+            int(len(latencies) * self.hedge_percentile / 100.0))
+        return latencies[index]
+
+    @staticmethod
+    def _is_query_error(e: Exception) -> bool:
+        return (isinstance(e, requests.HTTPError) and e.response is not None
+            and e.response.status_code < 500)
+
+    def _call(self, func: Callable[[PooledStoreClient], Any]) -> Any:
+        tried: set[_Replica] = set()
+        futures: dict[Future, _Replica] = {}
+        primary: _Replica | None = None
+
+        def submit() -> bool:
+            replica = self._acquire(tried)
+            if replica is None:
+                return False
+            tried.add(replica)
+            futures[self._executor.submit(self._run, replica, func)] = replica
+            return True
+
+        submit()
+        primary = next(iter(futures.values()))
+        delay = self._hedge_delay()
+        last_error: Exception | None = None
+        while True:
+            done, _ = wait(futures, timeout=delay,
+                return_when=FIRST_COMPLETED)
+            if len(done) == 0:
+                # The reply is late, so ask another replica, too.
+                delay = None
+                if submit():
+                    self.hedges += 1
+                continue
+            for f in done:
+                replica = futures.pop(f)
+                try:
+                    result = f.result()
+                except Exception as e:
+                    if self._is_query_error(e):
+                        raise
+                    log_msg(f"Error querying replica "
+                        f"'{replica.client.url()}': {e}", level=logging.WARN)
+                    last_error = e
+                    continue
+                if replica is not primary:
+                    self.hedge_wins += 1
+                return result
+            # All requests so far have failed, so try another replica.
+            if len(futures) == 0 and not submit():
+                raise last_error
+
+    def query(self, query_str: str) -> dict:
+        return self._call(lambda c: c.query(query_str))
+
+    def query_iter(self, query_str: str,
+        max_rows: int | None = None) -> Iterator[dict]:
+        # NB The rows are read in full before returning, such that the
+        # request can be hedged.
+        return iter(self._call(
+            lambda c: list(c.query_iter(query_str, max_rows))))
+
+    def query_rows(self, query_str: str,
+        result_format: str = RF_TSV) -> TabularResult:
+        return self._call(lambda c: c.query_rows(query_str, result_format))
+
+    def update(self, query_str: str) -> None:
+        applied: list[_Replica] = []
+        failed: list[_Replica] = []
+        last_error: Exception | None = None
+        for replica in [r for r in self.replicas if not r.diverged]:
+            try:
+                replica.client.update(query_str)
+                applied.append(replica)
+            except Exception as e:
+                # If the update itself is at fault, no replica applies it.
+                if self._is_query_error(e) and len(applied) == 0:
+                    raise
+                log_msg(f"Error updating replica "
+                    f"'{replica.client.url()}': {e}", level=logging.WARN)
+                failed.append(replica)
+                last_error = e
+        if len(applied) == 0:
+            raise last_error
+        if len(failed) > 0:
+            with self._lock:
+                for replica in failed:
+                    replica.failures += 1
+                    replica.healthy = False
+                    replica.diverged = True
+            log_msg("Replicas "
+                f"{', '.join(repr(r.client.url()) for r in failed)} did not "
+                "apply an update that replicas "
+                f"{', '.join(repr(r.client.url()) for r in applied)} applied, "
+                "and are taken out of rotation.", level=logging.ERROR)
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._executor.shutdown(wait=False)
+        for replica in self.replicas:
+            replica.client.close()
+
+    def stats(self) -> dict:
+        delay = self._hedge_delay()
+        with self._lock:
+            return {
+                "replicas": [{"url": r.client.url(), "healthy": r.healthy,
+                    "diverged": r.diverged,
+                    "outstanding": r.outstanding, "requests": r.requests,
+                    "failures": r.failures} for r in self.replicas],
+                "hedge_delay": delay,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins
+            }
+
+def make_replicated_store_client(config: RAGConfig,
+    urls: list[str]) -> ReplicatedStoreClient:
+    """
+    Returns a client for the given replicas of a SPARQL endpoint, with
+    pool sizes, timeouts, hedging and health checks as configured.
+    """
+    pool_size = config.get_or_default(CVN_STORE_POOL_SIZE, 10)
+    return ReplicatedStoreClient([make_store_client(config, u) for u in urls],
+        hedge_percentile=config.get_or_default(CVN_HEDGE_PERCENTILE, 95.0),
+        health_check_interval=config.get_or_default(
+            CVN_HEALTH_CHECK_INTERVAL, 30.0),
+        # NB Hedging takes up to two threads per request.
+        max_workers=2*pool_size*len(urls))
@@ -0,0 +1,143 @@
+"""
+Re-projection of cached embeddings, and of the vectors of a collection,
+to a smaller dimension, by truncating and renormalising them locally,
+which is how text-embedding-3 models shorten (Matryoshka) embeddings,
+such that no embeddings have to be requested again.
+"""
+
+import logging
+from typing import Iterator
+
+import numpy as np
+from langchain_core.stores import ByteStore
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, PointStruct, VectorParams
+
+from common import ES_UTF_8, log_msg, RAGError
+from embeddingcache import embedding_dimensions, embedding_namespace
+from embeddingstore import decode_vector, encode_vector, make_embedding_store
+from ragconfig import RAGConfig, CVN_EMBEDDING_MODEL, CVN_VS_COLLECTION
+from ragconfig import CVN_VS_QUANTIZATION, make_arg_parser
+from vectorstore import VQ_NONE, ensure_payload_indexes, ensure_quantization
+from vectorstore import make_qdrant_client
+
+# Length of the UUIDs following the namespace in cache keys, see
+# `CacheBackedEmbeddings`
+KEY_UUID_LENGTH = 36
+
+def truncate_and_normalize(vectors: np.ndarray,
+    dimensions: int) -> np.ndarray:
+    """
+    Returns the given vectors, one per row, truncated to the given
+    dimension and normalised to unit length again.
+    """
+    truncated = vectors[:, :dimensions]
+    return truncated / np.linalg.norm(truncated, axis=1, keepdims=True)
+
+def _batched(keys: Iterator[str], batch_size: int) -> Iterator[list[str]]:
+    batch = []
+    for key in keys:
+        batch.append(key)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+def reproject_embedding_cache(store: ByteStore, model: str, dimensions: int,
+    batch_size: int = 1000) -> int:
+    """
+    Adds embeddings of the given dimension to the given cache store for
+    all cached embeddings of the given model's native dimension, and
+    returns the number of embeddings added. These are stored under the
+    namespace that `make_cached_embeddings` uses for that dimension.
+    """
+    source_namespace = embedding_namespace(model)
+    target_namespace = embedding_namespace(model, dimensions)
+    # NB The source namespace is a prefix of the target namespace.
+    keys = (k for k in store.yield_keys(prefix=source_namespace)
+        if len(k) == len(source_namespace)+KEY_UUID_LENGTH)
+    num_reprojected = 0
+    for batch in _batched(keys, batch_size):
+        values = store.mget(batch)
+        vectors = truncate_and_normalize(np.array(
+            [decode_vector(v) for v in values], dtype=np.float64),
+            dimensions)
+        store.mset([(target_namespace + k[len(source_namespace):],
+            encode_vector(v)) for k, v in zip(batch, vectors)])
+        num_reprojected += len(batch)
+        log_msg(f"{num_reprojected} cached embeddings re-projected.",
+            level=logging.DEBUG)
+    return num_reprojected
+
+def reproject_collection(client: QdrantClient, source_name: str,
+    target_name: str, dimensions: int, batch_size: int = 256) -> int:
+    """
+    Copies the points of a collection, with payloads, to a collection in
+    the same store, with vectors re-projected to the given dimension,
+    and returns the number of points copied. The target collection is
+    created if necessary, such that an interrupted copy can be resumed.
+    """
+    if client.collection_exists(target_name):
+        size = client.get_collection(target_name).config.params.vectors.size
+        if size != dimensions:
+            raise RAGError(f"Collection '{target_name}' holds vectors of "
+                f"dimension {size} rather than {dimensions}.")
+    else:
+        client.create_collection(collection_name=target_name,
+            vectors_config=VectorParams(size=dimensions,
+                distance=Distance.COSINE))
+    num_points = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(source_name, limit=batch_size,
+            offset=offset, with_payload=True, with_vectors=True)
+        if len(points) > 0:
+            vectors = truncate_and_normalize(
+                np.array([p.vector for p in points]), dimensions)
+            client.upsert(target_name, points=[PointStruct(id=p.id,
+                vector=v.tolist(), payload=p.payload)
+                for p, v in zip(points, vectors)])
+            num_points += len(points)
+        if offset is None:
+            return num_points
+
+def main():
+    """
+    Re-projects the cached embeddings of the configured model to the
+    configured dimension and, if a collection name is given on the
+    command line, the vectors of that collection into the configured
+    collection.
+    """
+    parser = make_arg_parser("Re-projects cached embeddings, and "
+        "optionally a collection, to the configured dimension.")
+    parser.add_argument("source_collection", nargs="?",
+        help="collection whose vectors are re-projected into the "
+        "configured collection")
+    args = parser.parse_args()
+    logging.basicConfig(filename="reprojection.log", encoding=ES_UTF_8,
+        level=logging.INFO)
+    config = RAGConfig(args.config)
+    model = config.get(CVN_EMBEDDING_MODEL)
+    dimensions = embedding_dimensions(config)
+    if dimensions is None:
+        log_msg(f"Embeddings of '{model}' are not shortened, nothing to do.")
+        return
+    store = make_embedding_store(config)
+    num_reprojected = reproject_embedding_cache(store, model, dimensions)
+    log_msg(f"Re-projected {num_reprojected} cached embeddings to "
+        f"dimension {dimensions}.")
+    if args.source_collection is not None:
+        collection_name = config.get(CVN_VS_COLLECTION)
+        client = make_qdrant_client(config)
+        num_points = reproject_collection(client, args.source_collection,
+            collection_name, dimensions)
+        log_msg(f"Re-projected {num_points} points of "
+            f"'{args.source_collection}' into '{collection_name}'.")
+        ensure_payload_indexes(client, collection_name)
+        ensure_quantization(client, collection_name,
+            config.get_or_default(CVN_VS_QUANTIZATION, VQ_NONE))
+        client.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Coalescing of identical concurrent requests.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+from common import RAGError, log_msg
+
+class SingleFlight:
+    """
+    Ensures that, for any given key, at most one asynchronous call is in
+    flight at a time. The first caller for a key (the leader) starts the
+    call, and any callers for the same key arriving before it completes
+    (the followers) await the leader's result, or exception, instead of
+    starting calls of their own.
+    """
+
+    def __init__(self) -> None:
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str,
+        func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Returns the result of the call for the given key, starting the
+        call via the given function only if none is in flight already.
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+            log_msg(f"Coalescing request for '{key}' with the one "
+                "in flight.", level=logging.DEBUG)
+        # Shielding ensures that a caller that is cancelled, e.g. because
+        # its client disconnected, does not cancel the call for the other
+        # callers.
+        return await asyncio.shield(task)
+
+    def follow(self, key: str) -> asyncio.Future | None:
+        """
+        Returns the future result of the call in flight for the given
+        key, which a follower is to await, if there is one.
+        """
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            log_msg(f"Coalescing request for '{key}' with the one "
+                "in flight.", level=logging.DEBUG)
+        return future
+
+    def lead(self, key: str) -> asyncio.Future:
+        """
+        Registers a call for the given key, for which none is in flight,
+        and returns a future, which the leader must resolve with the
+        result, or exception, of the call, e.g. once it has streamed all
+        of the result, for any followers.
+        """
+        self.leaders += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+
+        def done(f: asyncio.Future) -> None:
+            self._in_flight.pop(key, None)
+            # NB Retrieving the exception avoids warnings about it if
+            # there are no followers.
+            if not f.cancelled():
+                f.exception()
+
+        future.add_done_callback(done)
+        return future
+
+    @staticmethod
+    def abandon(future: asyncio.Future) -> None:
+        """
+        Fails the given future of a leader that stopped before resolving
+        it, e.g. because its client disconnected, such that followers
+        do not wait forever.
+        """
+        if not future.done():
+            future.set_exception(RAGError("Call abandoned by its leader."))
+
+    def stats(self) -> dict[str, int]:
+        return {"leaders": self.leaders, "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight)}
@@ -0,0 +1,354 @@
+"""
+Deterministic analysis of (LLM-generated) SPARQL queries by means of
+rdflib's SPARQL algebra.
+"""
+
+import logging
+import re
+
+from rdflib import Literal, URIRef, Variable
+from rdflib.namespace import XSD
+from rdflib.paths import Path, SequencePath
+from rdflib.plugins.sparql.algebra import translateQuery
+from rdflib.plugins.sparql.parser import parseQuery
+from rdflib.plugins.sparql.parserutils import CompValue
+
+from common import PD_BASE_IRI, RAGError, log_msg, make_rel_iri
+
+# Classification result keys, as expected by the hybrid QA chain.
+CRK_START_DATE = "start_date"
+CRK_END_DATE   = "end_date"
+CRK_TOPIC      = "topic"
+CRK_PARTY      = "party"
+CRK_SPEAKER    = "speaker"
+CRK_PERIOD     = "period"
+CRK_SESSION    = "session"
+CRK_READING    = "reading"
+# Prefix of the keys of values excluded rather than required, e.g.
+# "not_party"
+CRK_EXCLUDED_PREFIX = "not_"
+
+HAS_TEXT_IRI = URIRef(make_rel_iri(PD_BASE_IRI, "text"))
+HAS_NAME_SHORT_IRI = URIRef(make_rel_iri(PD_BASE_IRI, "name_kurz"))
+HAS_GIVEN_NAME_IRI = URIRef(make_rel_iri(PD_BASE_IRI, "vorname"))
+HAS_SURNAME_IRI = URIRef(make_rel_iri(PD_BASE_IRI, "nachname"))
+
+# Classification result keys of the values of data properties
+FIELD_PREDICATES = {
+    HAS_NAME_SHORT_IRI: CRK_PARTY,
+    URIRef(make_rel_iri(PD_BASE_IRI, "wahlperiode")): CRK_PERIOD,
+    URIRef(make_rel_iri(PD_BASE_IRI, "sitzung-nr")): CRK_SESSION,
+    URIRef(make_rel_iri(PD_BASE_IRI, "lesung")): CRK_READING,
+}
+
+DATE_DATATYPES = {XSD.date, XSD.dateTime}
+DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}")
+LIMIT_PATTERN = re.compile(r"\bLIMIT\s+(\d+)", re.IGNORECASE)
+
+# Algebra nodes, and those of their operands that are not required
+# to match, including the filter of an OPTIONAL block.
+NON_CONJUNCTIVE_OPERANDS = {
+    "Union": {"p1", "p2"},
+    "Minus": {"p2"},
+    "LeftJoin": {"p2", "expr"},
+}
+
+class UnsupportedQueryError(RAGError):
+    """
+    Raised if a query contains a construct relevant to classification
+    that cannot be interpreted unambiguously, e.g. a topic filter
+    within a UNION or OPTIONAL block.
+    """
+
+def strip_sparql_keyword(query_str: str) -> str:
+    """
+    Removes a leading "sparql" keyword, as left over by LLMs that wrap
+    a query in a Markdown code block.
+    """
+    query_str = query_str.strip()
+    if query_str.lower().startswith("sparql"):
+        query_str = query_str[len("sparql"):]
+    return query_str
+
+def parse_query_algebra(query_str: str) -> CompValue:
+    """
+    Parses a SPARQL query string and returns its algebra.
+    """
+    try:
+        return translateQuery(parseQuery(query_str)).algebra
+    except Exception as e:
+        raise RAGError("Error parsing SPARQL query.") from e
+
+def _predicate_ends_with(p, iri: URIRef) -> bool:
+    """
+    Returns true if the predicate is the given IRI, or a sequence
+    path ending in it.
+    """
+    if isinstance(p, SequencePath):
+        return _predicate_ends_with(p.args[-1], iri)
+    return (not isinstance(p, Path)) and p == iri
+
+def _unwrap_var(expr) -> Variable | None:
+    """
+    Returns the variable wrapped by string functions such as LCASE or
+    STR, if any.
+    """
+    while isinstance(expr, CompValue) and expr.name in (
+        "Builtin_LCASE", "Builtin_UCASE", "Builtin_STR"):
+        expr = expr.arg
+    return expr if isinstance(expr, Variable) else None
+
+def _is_date_literal(term) -> bool:
+    return isinstance(term, Literal) and (
+        term.datatype in DATE_DATATYPES or (term.datatype is None
+            and DATE_PATTERN.match(str(term)) is not None))
+
+def _values_str(values: list[str]) -> str | list[str]:
+    """
+    Returns no value as the empty string, a single value as it is, and
+    several values, any of which is allowed, as a list.
+    """
+    if len(values) == 0:
+        return ""
+    return values[0] if len(values) == 1 else values
+
+class _QueryClassifier:
+    """
+    Walks the algebra of a query, collecting date ranges, topics, and
+    required or excluded values of speech metadata (i.e. parties,
+    speakers, electoral periods, sessions and readings) from its basic
+    graph patterns and filters.
+    """
+
+    def __init__(self, algebra: CompValue) -> None:
+        self._algebra = algebra
+        self.text_vars: set[Variable] = set()
+        # Classification result keys by variable bound to their values
+        self.field_vars: dict[Variable, str] = {}
+        self.start_dates: list[str] = []
+        self.end_dates: list[str] = []
+        self.topics: list[str] = []
+        # Sets of allowed values, all of which apply, and excluded values
+        self.allowed: dict[str, list[list[str]]] = {}
+        self.excluded: dict[str, list[str]] = {}
+        self.given_names: list[str] = []
+        self.surnames: list[str] = []
+
+    def classify(self) -> dict[str, str | list[str]]:
+        self._collect_bindings(self._algebra, negated=False, optional=False)
+        self._collect_filters(self._algebra, conjunctive=True)
+        # NB A speaker can only be identified by their full name.
+        if len(set(self.given_names)) == 1 and len(set(self.surnames)) == 1:
+            self.allowed[CRK_SPEAKER] = [
+                [f"{self.given_names[0]} {self.surnames[0]}"]]
+        cl_res: dict[str, str | list[str]] = {
+            # If several bounds are given, the tightest applies.
+            CRK_START_DATE: max(self.start_dates, default=""),
+            CRK_END_DATE: min(self.end_dates, default=""),
+            CRK_TOPIC: " ".join(dict.fromkeys(self.topics)),
+        }
+        for key in [CRK_PARTY, CRK_SPEAKER, CRK_PERIOD, CRK_SESSION,
+            CRK_READING]:
+            # Values must be allowed by all constraints. If none is,
+            # the constraints are contradictory, and are ignored.
+            allowed = self.allowed.get(key, [])
+            values = [v for v in dict.fromkeys(allowed[0])
+                if all(v in a for a in allowed[1:])] if allowed else []
+            cl_res[key] = _values_str(values)
+            cl_res[CRK_EXCLUDED_PREFIX+key] = _values_str(
+                list(dict.fromkeys(self.excluded.get(key, []))))
+        return cl_res
+
+    def _add_value(self, key: str, values: list[str],
+        negated: bool) -> None:
+        if negated:
+            self.excluded.setdefault(key, []).extend(values)
+        else:
+            self.allowed.setdefault(key, []).append(values)
+
+    def _collect_triples(self, triples, negated: bool,
+        optional: bool) -> None:
+        # NB Literal values of patterns that are not required to match,
+        # e.g. in OPTIONAL blocks, neither require nor exclude speeches,
+        # whereas variables bound there may still be filtered on.
+        for s, p, o in triples:
+            for iri, key in FIELD_PREDICATES.items():
+                if _predicate_ends_with(p, iri):
+                    if isinstance(o, Literal) and not optional:
+                        self._add_value(key, [str(o)], negated)
+                    elif isinstance(o, Variable) and not negated:
+                        self.field_vars[o] = key
+            if negated:
+                # Only literal values can be excluded.
+                continue
+            if _predicate_ends_with(p, HAS_TEXT_IRI):
+                if isinstance(o, Variable):
+                    self.text_vars.add(o)
+            elif isinstance(o, Literal) and not optional:
+                if _predicate_ends_with(p, HAS_GIVEN_NAME_IRI):
+                    self.given_names.append(str(o))
+                elif _predicate_ends_with(p, HAS_SURNAME_IRI):
+                    self.surnames.append(str(o))
+
+    def _collect_bindings(self, node, negated: bool,
+        optional: bool) -> None:
+        if isinstance(node, CompValue):
+            if node.name == "BGP" or (negated
+                and node.name == "TriplesBlock"):
+                self._collect_triples(node.triples, negated, optional)
+            elif node.name == "Builtin_NOTEXISTS":
+                negated = True
+            elif node.name == "Minus":
+                self._collect_bindings(node.p1, negated, optional)
+                self._collect_bindings(node.p2, True, optional)
+                return
+            non_conjunctive = NON_CONJUNCTIVE_OPERANDS.get(node.name, set())
+            for k, v in node.items():
+                self._collect_bindings(v, negated,
+                    optional or k in non_conjunctive)
+        elif isinstance(node, list):
+            for v in node:
+                self._collect_bindings(v, negated, optional)
+
+    def _collect_filters(self, node, conjunctive: bool) -> None:
+        if isinstance(node, CompValue):
+            if node.name == "Filter":
+                self._classify_expr(node.expr, conjunctive)
+                self._collect_filters(node.p, conjunctive)
+                return
+            optional = NON_CONJUNCTIVE_OPERANDS.get(node.name, set())
+            if node.name == "LeftJoin":
+                # NB Unlike other expressions, e.g. of BIND, this is a
+                # filter, which only applies to the OPTIONAL block.
+                self._classify_expr(node.expr, False)
+            for k, v in node.items():
+                if k != "expr":
+                    self._collect_filters(v,
+                        conjunctive and (k not in optional))
+        elif isinstance(node, list):
+            for v in node:
+                self._collect_filters(v, conjunctive)
+
+    def _classify_expr(self, expr, conjunctive: bool) -> None:
+        if not isinstance(expr, CompValue):
+            return
+        if expr.name == "ConditionalAndExpression":
+            for e in [expr.expr] + list(expr.other or []):
+                self._classify_expr(e, conjunctive)
+            return
+        if expr.name in ("ConditionalOrExpression", "UnaryNot"):
+            conjunctive = False
+            for v in expr.values():
+                for e in (v if isinstance(v, list) else [v]):
+                    self._classify_expr(e, conjunctive)
+            return
+        found = (self._classify_topic(expr)
+            or self._classify_date(expr) or self._classify_field(expr))
+        if found and not conjunctive:
+            raise UnsupportedQueryError(
+                f"Ambiguous filter expression: {expr.name}")
+
+    def _classify_topic(self, expr: CompValue) -> bool:
+        if expr.name == "Builtin_CONTAINS":
+            text_expr, topic = expr.arg1, expr.arg2
+        elif expr.name == "Builtin_REGEX":
+            text_expr, topic = expr.text, expr.pattern
+        else:
+            return False
+        if _unwrap_var(text_expr) in self.text_vars and (
+            isinstance(topic, Literal)):
+            self.topics.append(str(topic))
+            return True
+        return False
+
+    def _classify_date(self, expr: CompValue) -> bool:
+        if expr.name != "RelationalExpression":
+            return False
+        op, lhs, rhs = expr.op, expr.expr, expr.other
+        # Normalise to the form `?var op literal`.
+        if isinstance(lhs, Literal):
+            lhs, rhs = rhs, lhs
+            op = {"<": ">", "<=": ">=", ">": "<", ">=": "<="}.get(op, op)
+        if isinstance(lhs, CompValue) and lhs.name == "Builtin_YEAR" and (
+            isinstance(rhs, Literal) and str(rhs).isdigit()):
+            year = int(str(rhs))
+            start = f"{year + (1 if op == '>' else 0)}-01-01"
+            end = f"{year - (1 if op == '<' else 0)}-12-31"
+        elif _unwrap_var(lhs) is not None and _is_date_literal(rhs):
+            start = end = str(rhs)
+        else:
+            return False
+        if op in (">", ">=", "="):
+            self.start_dates.append(start)
+        if op in ("<", "<=", "="):
+            self.end_dates.append(end)
+        return op in (">", ">=", "=", "<", "<=")
+
+    def _classify_field(self, expr: CompValue) -> bool:
+        if expr.name != "RelationalExpression" or expr.op not in (
+            "=", "!=", "IN", "NOT IN"):
+            return False
+        operands = [(expr.expr, expr.other)]
+        if expr.op in ("=", "!="):
+            operands.append((expr.other, expr.expr))
+        for var, lits in operands:
+            key = self.field_vars.get(_unwrap_var(var))
+            lits = lits if isinstance(lits, list) else [lits]
+            if key is not None and all(isinstance(l, Literal) for l in lits):
+                self._add_value(key, [str(l) for l in lits],
+                    negated=expr.op in ("!=", "NOT IN"))
+                return True
+        return False
+
+def classify_sparql_query(query_str: str
+) -> dict[str, str | list[str]] | None:
+    """
+    Determines the date range, topic (i.e. a filter on speech texts),
+    and speech metadata values a SPARQL query is constrained to, in the
+    same form as expected from the LLM-based classification of queries.
+    Returns none if the query cannot be parsed or classified
+    unambiguously.
+    """
+    try:
+        algebra = parse_query_algebra(strip_sparql_keyword(query_str))
+        return _QueryClassifier(algebra).classify()
+    except RAGError as e:
+        log_msg(f"Local classification of SPARQL query failed: {e} "
+            f"({e.__cause__})", level=logging.DEBUG)
+        return None
+
+def limit_sparql_query(query_str: str, max_rows: int) -> str:
+    """
+    Rewrites a SELECT query such that it returns at most the given
+    number of rows, by adding a LIMIT clause, or by lowering an existing
+    one. Only the outermost query is limited, as limiting subqueries
+    would change the results of aggregates over them. As LIMIT applies
+    after grouping and ordering, the rows returned are the first ones
+    of the unlimited result. Other queries, and queries that cannot be
+    parsed or rewritten safely, are returned unchanged.
+    """
+    try:
+        query = parseQuery(query_str)[1]
+    except Exception as e:
+        log_msg(f"Not limiting SPARQL query that cannot be parsed: {e}",
+            level=logging.DEBUG)
+        return query_str
+    if query.name != "SelectQuery" or dict.get(query, "valuesClause"):
+        # NB A trailing VALUES clause would have to follow the LIMIT.
+        return query_str
+    limitoffset = dict.get(query, "limitoffset")
+    limit = None if limitoffset is None else dict.get(limitoffset, "limit")
+    if limit is None:
+        # NB A new line, in case the query ends in a comment.
+        return f"{query_str.rstrip()}\nLIMIT {max_rows}"
+    if int(limit) <= max_rows:
+        return query_str
+    # The solution modifiers of the outermost query follow the closing
+    # brace of its WHERE clause, i.e. the last brace of the query.
+    modifiers_start = query_str.rfind("}") + 1
+    matches = list(LIMIT_PATTERN.finditer(query_str, modifiers_start))
+    if len(matches) != 1:
+        return query_str
+    m = matches[0]
+    return "".join([query_str[:m.start(1)], str(max_rows),
+        query_str[m.end(1):]])
@@ -0,0 +1,141 @@
+"""
+Compact tabular representation of SPARQL SELECT query results, and
+parsers for the SPARQL 1.1 TSV and CSV result formats, which are much
+smaller than the JSON format for bulk reads.
+"""
+
+import csv
+import io
+import re
+
+# Result formats
+RF_JSON = "json"
+RF_TSV  = "tsv"
+RF_CSV  = "csv"
+
+# MIME types of result formats
+RESULT_FORMAT_MIME_TYPES = {
+    RF_JSON: "application/sparql-results+json",
+    RF_TSV: "text/tab-separated-values",
+    RF_CSV: "text/csv",
+}
+
+TSV_ESCAPE_PATTERN = re.compile(
+    r"\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))")
+TSV_ESCAPES = {"t": "\t", "b": "\b", "n": "\n", "r": "\r", "f": "\f",
+    '"': '"', "'": "'", "\\": "\\"}
+
+class ResultParseError(ValueError):
+    """
+    Raised if query results are malformed, e.g. if a row has more or
+    fewer values than there are variables.
+    """
+
+def _check_row_lengths(vars: list[str], rows: list) -> None:
+    for i, row in enumerate(rows):
+        if len(row) != len(vars):
+            raise ResultParseError(f"Row {i+1} of the results has "
+                f"{len(row)} values rather than {len(vars)}!")
+
+class TabularResult:
+    """
+    Result of a SELECT query as a list of rows, each of which is a tuple
+    of the plain values (i.e. IRIs, or lexical forms of literals) of the
+    variables, in the given order. Unbound variables have the empty
+    string as their value.
+    """
+
+    def __init__(self, vars: list[str], rows: list[tuple[str, ...]]) -> None:
+        self.vars = vars
+        self.rows = rows
+        # Column index by variable name
+        self.index = {v: i for i, v in enumerate(vars)}
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def column(self, var: str) -> list[str]:
+        """
+        Returns the values of the given variable in all rows.
+        """
+        i = self.index[var]
+        return [r[i] for r in self.rows]
+
+def _unescape_tsv_match(match: re.Match) -> str:
+    if match.group(3) is not None:
+        return TSV_ESCAPES.get(match.group(3), match.group(3))
+    return chr(int(match.group(1) or match.group(2), 16))
+
+def _unescape_tsv(value: str) -> str:
+    if "\\u" in value or "\\U" in value:
+        return TSV_ESCAPE_PATTERN.sub(_unescape_tsv_match, value)
+    # Faster than the regular expression for the common escapes. After
+    # splitting at escaped backslashes, any backslash starts an escape.
+    parts = value.split("\\\\")
+    for i, part in enumerate(parts):
+        if "\\" in part:
+            for escaped, char in TSV_ESCAPES.items():
+                part = part.replace("\\"+escaped, char)
+            parts[i] = part
+    return "\\".join(parts)
+
+def _tsv_values(terms: tuple[str, ...]) -> list[str]:
+    """
+    Returns the plain values of RDF terms in TSV (i.e. Turtle) syntax,
+    where IRIs are enclosed in angle brackets, and literals in quotes,
+    optionally followed by a language tag or datatype IRI. Other terms,
+    i.e. numbers and booleans in abbreviated form, and blank nodes, are
+    returned as they are.
+    """
+    values = [t[1:t.rfind(t[0])] if t[:1] == '"' or t[:1] == "'" else
+        t[1:-1] if t[:1] == "<" else t for t in terms]
+    return [_unescape_tsv(v) if "\\" in v else v for v in values]
+
+def parse_tsv_result(text: str) -> TabularResult:
+    """
+    Parses SELECT query results in SPARQL 1.1 TSV format. The values are
+    converted column by column, which is faster than row by row.
+    """
+    lines = text.split("\n")
+    vars = [v.strip().lstrip("?$") for v in lines[0].split("\t")]
+    cells = [line.rstrip("\r").split("\t") for line in lines[1:]
+        if line != "" and line != "\r"]
+    if len(cells) == 0:
+        return TabularResult(vars, [])
+    # NB Without this check, values of malformed rows would silently be
+    # dropped or end up in the wrong columns.
+    _check_row_lengths(vars, cells)
+    columns = [_tsv_values(c) for c in zip(*cells)]
+    return TabularResult(vars, list(zip(*columns)))
+
+def parse_csv_result(text: str) -> TabularResult:
+    """
+    Parses SELECT query results in SPARQL 1.1 CSV format.
+    """
+    reader = csv.reader(io.StringIO(text, newline=""))
+    vars = next(reader, [])
+    rows = [tuple(r) for r in reader if len(r) > 0]
+    _check_row_lengths(vars, rows)
+    return TabularResult(vars, rows)
+
+def tabular_from_json(result: dict) -> TabularResult:
+    """
+    Converts SELECT query results in SPARQL JSON format.
+    """
+    vars = result["head"]["vars"]
+    return TabularResult(vars, [
+        tuple(b[v]["value"] if v in b else "" for v in vars)
+        for b in result["results"]["bindings"]])
+
+def parse_tabular_result(text: str, result_format: str) -> TabularResult:
+    """
+    Parses SELECT query results in the given tabular format.
+    """
+    if result_format == RF_TSV:
+        return parse_tsv_result(text)
+    if result_format == RF_CSV:
+        return parse_csv_result(text)
+    raise ValueError(f"Unsupported tabular result format '{result_format}'!")
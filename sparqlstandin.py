@@ -0,0 +1,177 @@
+"""
+Local stand-in for a SPARQL endpoint, backed by an rdflib graph and
+served over HTTP, for testing store clients without a triple store.
+"""
+
+import gzip
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rdflib import Graph, Literal
+
+from sparqlresults import RF_JSON, RF_TSV, RF_CSV, RESULT_FORMAT_MIME_TYPES
+
+# rdflib parser formats by MIME type of RDF data that can be posted
+RDF_FORMATS = {
+    "application/n-triples": "nt",
+    "text/turtle": "turtle",
+}
+
+# Number of replicas served by `main`
+NUM_REPLICAS = 3
+BASE_PORT = 3838
+
+# Escapes of characters in the lexical forms of literals in TSV results
+TSV_LITERAL_ESCAPES = str.maketrans({"\\": "\\\\", '"': '\\"',
+    "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+def _tsv_term(t) -> str:
+    """
+    Returns an RDF term in TSV syntax, where, unlike in `n3`, literals
+    never contain tabs or line breaks.
+    """
+    if t is None:
+        return ""
+    if not isinstance(t, Literal):
+        return t.n3()
+    lexical = '"' + str(t).translate(TSV_LITERAL_ESCAPES) + '"'
+    if t.language is not None:
+        return f"{lexical}@{t.language}"
+    if t.datatype is not None:
+        return f"{lexical}^^<{t.datatype}>"
+    return lexical
+
+def _tsv_result(result) -> bytes:
+    lines = ["\t".join(f"?{v}" for v in result.vars)]
+    for row in result:
+        lines.append("\t".join(_tsv_term(t) for t in row))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+def _make_handler(g: Graph, delay: float) -> type[BaseHTTPRequestHandler]:
+    # NB rdflib's SPARQL parser is not thread-safe.
+    lock = threading.Lock()
+
+    class SPARQLHandler(BaseHTTPRequestHandler):
+
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+        def _reply(self, status: int, body: bytes, content_type: str) -> None:
+            gzipped = (len(body) > 0
+                and "gzip" in self.headers.get("Accept-Encoding", ""))
+            if gzipped:
+                body = gzip.compress(body)
+            self.send_response(status)
+            if gzipped:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _query(self, query_str: str) -> None:
+            accept = self.headers.get("Accept", "")
+            result_format = RF_JSON
+            for rf in [RF_TSV, RF_CSV]:
+                if RESULT_FORMAT_MIME_TYPES[rf] in accept:
+                    result_format = rf
+            try:
+                with lock:
+                    result = g.query(query_str)
+                    if result.type != "SELECT":
+                        result_format = RF_JSON
+                    if result_format == RF_TSV:
+                        body = _tsv_result(result)
+                    else:
+                        body = result.serialize(format=result_format)
+            except Exception as e:
+                self._reply(400, str(e).encode("utf-8"), "text/plain")
+                return
+            self._reply(200, body, RESULT_FORMAT_MIME_TYPES[result_format])
+
+        def _update(self, update_str: str) -> None:
+            try:
+                with lock:
+                    g.update(update_str)
+            except Exception as e:
+                self._reply(400, str(e).encode("utf-8"), "text/plain")
+                return
+            self._reply(200, b"", "text/plain")
+
+        def do_GET(self) -> None:
+            time.sleep(delay)
+            params = urllib.parse.parse_qs(
+                urllib.parse.urlparse(self.path).query)
+            if "query" not in params:
+                self._reply(400, b"Missing query", "text/plain")
+                return
+            self._query(params["query"][0])
+
+        def _insert_rdf(self, data: bytes, content_type: str) -> None:
+            try:
+                with lock:
+                    g.parse(data=data, format=RDF_FORMATS[content_type])
+            except Exception as e:
+                self._reply(400, str(e).encode("utf-8"), "text/plain")
+                return
+            self._reply(200, b"", "text/plain")
+
+        def do_POST(self) -> None:
+            time.sleep(delay)
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            content_type = self.headers.get("Content-Type", "").split(";")[0]
+            if content_type in RDF_FORMATS:
+                # Graph Store Protocol
+                self._insert_rdf(body, content_type)
+                return
+            form = urllib.parse.parse_qs(body.decode())
+            if "query" in form:
+                self._query(form["query"][0])
+            elif "update" in form:
+                self._update(form["update"][0])
+            else:
+                self._reply(400, b"Missing query or update", "text/plain")
+
+    return SPARQLHandler
+
+def serve_graph(g: Graph, port: int = 0,
+    delay: float = 0.0) -> tuple[ThreadingHTTPServer, str]:
+    """
+    Serves the given graph as a SPARQL endpoint on the given local port,
+    or any free one, in a background thread, optionally delaying each
+    reply by the given number of seconds. Returns the server, which is
+    stopped via `shutdown`, and the URL of the endpoint.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _make_handler(g, delay))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/sparql"
+
+def main():
+    """
+    Serves replicas of the graph in the Turtle files given on the command
+    line, on consecutive ports.
+    """
+    servers = []
+    for i in range(NUM_REPLICAS):
+        g = Graph()
+        for filename in sys.argv[1:]:
+            g.parse(filename)
+        server, url = serve_graph(g, port=BASE_PORT+i)
+        servers.append(server)
+        print(f"Serving {len(g)} triples at {url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+
+if __name__ == "__main__":
+    main()
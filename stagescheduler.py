@@ -0,0 +1,106 @@
+"""
+Scheduling of interdependent asynchronous stages, e.g. the LLM, vector
+store and knowledge graph calls within a chain.
+"""
+
+import asyncio
+import logging
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Iterable
+
+from common import log_msg, RAGError
+
+class StageScheduler:
+    """
+    Runs named asynchronous stages as a dependency graph. Each stage is
+    started as soon as it is requested, either explicitly or as the
+    dependency of another stage, and receives the results of its
+    dependencies as positional arguments, in the order in which they
+    were declared. Stages without mutual dependencies therefore run
+    concurrently.
+
+    Stages may be started speculatively, i.e. before it is known whether
+    their results are going to be needed. Any stage that is still
+    running when the scheduler is closed is cancelled, and any result
+    that has not been requested is discarded.
+    """
+
+    def __init__(self) -> None:
+        self._stages: dict[str,
+            tuple[Callable[..., Awaitable[Any]], tuple[str, ...]]] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._used: set[str] = set()
+
+    def add(self, name: str, func: Callable[..., Awaitable[Any]],
+        deps: Iterable[str] = ()) -> "StageScheduler":
+        """
+        Registers a stage. All dependencies must have been registered
+        beforehand, which rules out cycles.
+        """
+        if name in self._stages:
+            raise RAGError(f"Stage '{name}' is already registered!")
+        deps = tuple(deps)
+        for d in deps:
+            if d not in self._stages:
+                raise RAGError(f"Dependency '{d}' of stage '{name}' "
+                    f"is not registered!")
+        self._stages[name] = (func, deps)
+        return self
+
+    def start(self, name: str) -> asyncio.Task:
+        """
+        Starts a stage, unless already started, and returns its task.
+        """
+        if name not in self._tasks:
+            if name not in self._stages:
+                raise RAGError(f"Stage '{name}' is not registered!")
+            self._tasks[name] = asyncio.create_task(self._run(name))
+        return self._tasks[name]
+
+    def speculate(self, *names: str) -> None:
+        """
+        Starts the given stages without waiting for them, so that their
+        results are ready, if needed, by the time they are requested.
+        """
+        for name in names:
+            self.start(name)
+
+    async def result(self, name: str) -> Any:
+        """
+        Starts a stage, unless already started, and returns its result.
+        """
+        self._used.add(name)
+        return await self.start(name)
+
+    async def _run(self, name: str) -> Any:
+        func, deps = self._stages[name]
+        # Mark dependencies as used, as their results are consumed here.
+        self._used.update(deps)
+        args = await asyncio.gather(*[self.start(d) for d in deps])
+        t_start = perf_counter()
+        res = await func(*args)
+        log_msg(f"Stage '{name}' finished in "
+            f"{perf_counter()-t_start:.3f} s.", level=logging.DEBUG)
+        return res
+
+    async def close(self) -> None:
+        """
+        Cancels any stages that are still running, and discards the
+        results of any stages that were started speculatively but
+        never used.
+        """
+        for name, task in self._tasks.items():
+            if not task.done():
+                task.cancel()
+                log_msg(f"Cancelled unused stage '{name}'.",
+                    level=logging.DEBUG)
+            elif name not in self._used:
+                log_msg(f"Discarded result of speculative stage '{name}'.",
+                    level=logging.DEBUG)
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def __aenter__(self) -> "StageScheduler":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
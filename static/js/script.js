@@ -89,6 +89,32 @@ async function fetchQa(question) {
         .then(res => res.json())
 }
 
+function streamQa(question, onEvent) {
+    const params = new URLSearchParams();
+    params.append("question", question);
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(`./stream/?${params}`)
+        const handle = (event) => onEvent(event.type, JSON.parse(event.data))
+        source.addEventListener("stage", handle)
+        source.addEventListener("token", handle)
+        source.addEventListener("sources", handle)
+        source.addEventListener("done", () => {
+            source.close()
+            resolve()
+        })
+        source.addEventListener("failure", (event) => {
+            source.close()
+            reject(new Error(JSON.parse(event.data)))
+        })
+        // NB Without this, the browser would keep reconnecting, i.e.
+        // asking the question again.
+        source.onerror = () => {
+            source.close()
+            reject(new Error("Connection to server lost"))
+        }
+    })
+}
+
 /* 
 ------------------------------
 UI Components
@@ -346,6 +372,20 @@ const qaDataContainer = (function () {
             }
             elem.innerHTML = display_html;
             elem.style.display = "block"
+        },
+
+        renderProgress(question, stage, answer, sources) {
+            display_html = "<b>Frage:</b> " + question +
+                "<br/><br/><b>Antwort:</b> " + answer.replaceAll("\n", "<br/>");
+            if (stage != "") {
+                display_html += "<br/><br/><i>" + stage + " ...</i>";
+            }
+            if (sources != "") {
+                display_html += "<br/><br/><b>Quellen:</b><br/>" +
+                    sources.replaceAll("\n", "<br/>");
+            }
+            elem.innerHTML = display_html;
+            elem.style.display = "block"
         }
     }
 })()
@@ -509,10 +549,25 @@ async function askQuestion() {
     //chatbotResponseCard.reset()
 
     try {
-        const results = await fetchQa(question)
-        //qaMetadataContainer.render(results["metadata"])
+        let stage = "Frage wird bearbeitet"
+        let answer = ""
+        let sources = ""
         resultSection.style.display = "block"
-        qaDataContainer.render(results)
+        qaDataContainer.renderProgress(question, stage, answer, sources)
+        await streamQa(question, (event, data) => {
+            if (event === "stage") {
+                stage = data
+            } else if (event === "token") {
+                // Once the answer is being generated, there is no more
+                // progress to report.
+                stage = ""
+                answer += data
+            } else if (event === "sources") {
+                sources = data
+            }
+            qaDataContainer.renderProgress(question, stage, answer, sources)
+        })
+        //qaMetadataContainer.render(results["metadata"])
         //chatbotResponseCard.render(question, results["data"])
     } catch (error) {
         console.log(error.toString())
@@ -1,6 +1,97 @@
+import asyncio
+import codecs
 import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import AsyncIterator, Iterable, Iterator
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
 from SPARQLWrapper import SPARQLWrapper, JSON, POST
-from rdflib import Graph
+from rdflib import BNode, Graph, Literal
+from rdflib.query import Result
+from rdflib.term import Identifier
+
+from SPARQLBuilder import SPARQLUpdateBuilder, BULK_MAX_TRIPLES
+from SPARQLBuilder import BULK_MAX_BYTES
+from sparqlresults import RF_JSON, RF_TSV, RESULT_FORMAT_MIME_TYPES
+from sparqlresults import TabularResult, parse_tabular_result
+from sparqlresults import tabular_from_json
+from ragconfig import RAGConfig, CVN_STORE_POOL_SIZE, CVN_STORE_KEEP_ALIVE
+from ragconfig import CVN_STORE_CONNECT_TIMEOUT, CVN_STORE_READ_TIMEOUT
+from ragconfig import CVN_STORE_SERVER_TIMEOUT
+
+# MIME types
+MT_N_TRIPLES           = "application/n-triples"
+MT_SPARQL_RESULTS_JSON = "application/sparql-results+json"
+
+# Blazegraph-specific HTTP header limiting query execution time in ms
+HN_BIGDATA_MAX_QUERY_MILLIS = "X-BIGDATA-MAX-QUERY-MILLIS"
+
+# Size in bytes of chunks in which streamed query results are read
+STREAM_CHUNK_SIZE = 65536
+
+class SPARQLJSONBindingsParser:
+    """
+    Incremental parser for SPARQL query results in JSON format, which is
+    fed the response text chunk by chunk, and returns the bindings that
+    are complete so far, without waiting for the whole response.
+    """
+
+    BINDINGS_START = re.compile(r'"bindings"\s*:\s*\[')
+    # Length of text kept while looking for the start of the bindings,
+    # in case it is split across chunks
+    LOOKBEHIND = 64
+
+    def __init__(self) -> None:
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._in_bindings = False
+        self.done = False
+
+    def feed(self, text: str) -> list[dict]:
+        """
+        Adds the given text to the parsed response, and returns the
+        bindings completed by it.
+        """
+        rows: list[dict] = []
+        if self.done:
+            return rows
+        self._buffer += text
+        if not self._in_bindings:
+            m = self.BINDINGS_START.search(self._buffer)
+            if m is None:
+                self._buffer = self._buffer[-self.LOOKBEHIND:]
+                return rows
+            self._buffer = self._buffer[m.end():]
+            self._in_bindings = True
+        buffer = self._buffer
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if buffer[pos] == "]":
+                self.done = True
+                break
+            try:
+                row, pos = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The binding is incomplete, so wait for more text.
+                break
+            rows.append(row)
+        self._buffer = "" if self.done else buffer[pos:]
+        return rows
+
+    def close(self) -> None:
+        """
+        Checks that the whole response has been parsed.
+        """
+        if self._in_bindings and not self.done:
+            raise ValueError("Incomplete or malformed SPARQL JSON results: "
+                f"'{self._buffer[:100]}'")
 
 class StoreClient:
 
@@ -12,6 +103,68 @@ class StoreClient:
         raise Exception(f"Update method is not implemented "
             f"for abstract {self.__class__.__name__} class!")
 
+    def query_iter(self, query_str: str,
+        max_rows: int | None = None) -> Iterator[dict]:
+        """
+        Returns an iterator over the result bindings of a query, which
+        stops after the given maximum number of rows, if any. Unless
+        overridden, the full result is retrieved first.
+        """
+        return islice(self.query(query_str)["results"]["bindings"], max_rows)
+
+    def query_rows(self, query_str: str,
+        result_format: str = RF_TSV) -> TabularResult:
+        """
+        Returns the result of a SELECT query as lightweight rows, using
+        the given result format for transfer where applicable. Unless
+        overridden, the result is converted from the JSON format.
+        """
+        return tabular_from_json(self.query(query_str))
+
+    def insert_data(self, triples: Iterable[tuple[str, str, str]],
+        prefixes: dict[str, str] | None = None,
+        max_triples: int | None = BULK_MAX_TRIPLES,
+        max_bytes: int | None = BULK_MAX_BYTES) -> int:
+        """
+        Inserts the given triples, in SPARQL syntax, using the given
+        prefixes, via INSERT DATA updates of at most the given numbers of
+        triples and bytes each. Returns the number of updates sent.
+        """
+        num_updates = 0
+
+        def flush(ustr: str) -> None:
+            nonlocal num_updates
+            self.update(ustr)
+            num_updates += 1
+
+        ub = SPARQLUpdateBuilder()
+        for prefix, iri in ({} if prefixes is None else prefixes).items():
+            ub.addPrefix(prefix, iri)
+        ub.set_bulk(flush, max_triples=max_triples, max_bytes=max_bytes)
+        for s, p, o in triples:
+            ub.addInsert(s, p, o)
+        ub.flush()
+        return num_updates
+
+    async def aquery(self, query_str: str) -> dict:
+        """
+        Asynchronous version of `query`. Unless overridden, the blocking
+        call is run in a worker thread so that it does not block the
+        event loop.
+        """
+        return await asyncio.to_thread(self.query, query_str)
+
+    async def aupdate(self, query_str: str) -> None:
+        """
+        Asynchronous version of `update`. Unless overridden, the blocking
+        call is run in a worker thread so that it does not block the
+        event loop.
+        """
+        await asyncio.to_thread(self.update, query_str)
+
+    def close(self) -> None:
+        pass
+
 class RemoteStoreClient(StoreClient):
 
     def __init__(self, url: str) -> None:
@@ -33,6 +186,137 @@ class RemoteStoreClient(StoreClient):
             w.setQuery(query_str)
             w.query()
 
+class PooledStoreClient(StoreClient):
+    """
+    Client for a remote SPARQL endpoint that keeps a pool of persistent
+    HTTP connections, rather than opening a new connection per request.
+    Requests time out on the client side after the given connect and read
+    timeouts (in seconds). In addition, the store can be asked to abort
+    queries running longer than the given server timeout (in seconds),
+    which is currently supported by Blazegraph.
+    """
+
+    def __init__(self, url: str, pool_size: int = 10,
+        keep_alive: bool = True, connect_timeout: float | None = 5.0,
+        read_timeout: float | None = 60.0,
+        server_timeout: float | None = None
+    ) -> None:
+        self._url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive" if keep_alive else "close"
+        })
+        if server_timeout is not None:
+            self.session.headers[HN_BIGDATA_MAX_QUERY_MILLIS] = str(
+                int(server_timeout*1000))
+
+    def url(self):
+        return self._url
+
+    def _post(self, data: dict[str, str],
+        headers: dict[str, str] | None = None) -> requests.Response:
+        # NB Queries are posted as form data, as LLM-generated queries
+        # may exceed URL length limits.
+        response = self.session.post(self.url(), data=data,
+            headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    def query(self, query_str: str) -> dict:
+        return self._post({"query": query_str},
+            headers={"Accept": MT_SPARQL_RESULTS_JSON}).json()
+
+    def query_rows(self, query_str: str,
+        result_format: str = RF_TSV) -> TabularResult:
+        response = self._post({"query": query_str},
+            headers={"Accept": RESULT_FORMAT_MIME_TYPES[result_format]})
+        if result_format == RF_JSON:
+            return tabular_from_json(response.json())
+        return parse_tabular_result(response.content.decode("utf-8"),
+            result_format)
+
+    def query_iter(self, query_str: str,
+        max_rows: int | None = None) -> Iterator[dict]:
+        """
+        Returns an iterator over the result bindings of a query, which
+        are parsed as the response arrives. Once the given maximum number
+        of rows has been read, or the iterator is closed, the connection
+        is closed, without reading the rest of the response.
+        """
+        if max_rows is not None and max_rows <= 0:
+            return
+        response = self.session.post(self.url(), data={"query": query_str},
+            headers={"Accept": MT_SPARQL_RESULTS_JSON}, timeout=self.timeout,
+            stream=True)
+        try:
+            response.raise_for_status()
+            parser = SPARQLJSONBindingsParser()
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            n = 0
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                for row in parser.feed(decoder.decode(chunk)):
+                    yield row
+                    n += 1
+                    if n == max_rows:
+                        return
+            parser.feed(decoder.decode(b"", final=True))
+            parser.close()
+        finally:
+            response.close()
+
+    def update(self, query_str: str) -> None:
+        if query_str is not None and query_str != "":
+            self._post({"update": query_str})
+
+    def post_rdf(self, data: bytes, content_type: str = MT_N_TRIPLES,
+        url: str | None = None) -> None:
+        """
+        Adds the RDF data in the request body to the store, as per the
+        SPARQL 1.1 Graph Store Protocol. By default, the data is posted
+        to the SPARQL endpoint itself, which Blazegraph accepts, but a
+        separate graph store URL may be given, e.g. ending in `?default`.
+        """
+        response = self.session.post(self.url() if url is None else url,
+            data=data, headers={"Content-Type": content_type},
+            timeout=self.timeout)
+        response.raise_for_status()
+
+    def close(self) -> None:
+        self.session.close()
+
+def make_store_client(config: RAGConfig, url: str) -> PooledStoreClient:
+    """
+    Returns a pooled client for the given SPARQL endpoint, with pool size
+    and timeouts as configured.
+    """
+    return PooledStoreClient(url,
+        pool_size=config.get_or_default(CVN_STORE_POOL_SIZE, 10),
+        keep_alive=config.get_or_default(CVN_STORE_KEEP_ALIVE, True),
+        connect_timeout=config.get_or_default(CVN_STORE_CONNECT_TIMEOUT, 5.0),
+        read_timeout=config.get_or_default(CVN_STORE_READ_TIMEOUT, 60.0),
+        server_timeout=config.get_or_default(CVN_STORE_SERVER_TIMEOUT)
+    )
+
+def term_to_binding(term: Identifier) -> dict[str, str]:
+    """
+    Returns the SPARQL JSON form of an rdflib term.
+    """
+    if isinstance(term, Literal):
+        binding = {"type": "literal", "value": str(term)}
+        if term.language is not None:
+            binding["xml:lang"] = term.language
+        elif term.datatype is not None:
+            binding["datatype"] = str(term.datatype)
+        return binding
+    if isinstance(term, BNode):
+        return {"type": "bnode", "value": str(term)}
+    return {"type": "uri", "value": str(term)}
+
 class RdflibStoreClient(StoreClient):
 
     def __init__(self,
@@ -45,18 +329,220 @@ class RdflibStoreClient(StoreClient):
         else:
             self._g = g
 
+    def _iter_bindings(self, reply: Result) -> Iterator[dict]:
+        vars = [str(v) for v in reply.vars]
+        for row in reply:
+            yield {var: term_to_binding(term)
+                for var, term in zip(vars, row) if term is not None}
+
     def query(self, query_str: str) -> dict:
+        """
+        Returns the result of a query in SPARQL JSON form, which is
+        converted from rdflib's result directly.
+        """
         reply = self._g.query(query_str)
-        json_bytes = reply.serialize(format='json')
-        if json_bytes is None:
-            q_result = {}
-        else:
-            # Decode UTF-8 bytes to Unicode, and convert single quotes
-            # to double quotes to make it a valid JSON string.
-            json_str = json_bytes.decode('utf8').replace("'", '"')
-            q_result = json.loads(json_str)
-        return q_result
+        if reply.type == "SELECT":
+            return {"head": {"vars": [str(v) for v in reply.vars]},
+                "results": {"bindings": list(self._iter_bindings(reply))}}
+        if reply.type == "ASK":
+            return {"head": {}, "boolean": reply.askAnswer}
+        return {}
+
+    def query_iter(self, query_str: str,
+        max_rows: int | None = None) -> Iterator[dict]:
+        """
+        Returns an iterator over the result bindings of a SELECT query,
+        which are converted one at a time, as they are iterated over.
+        """
+        return islice(self._iter_bindings(self._g.query(query_str)), max_rows)
+
+    def query_rows(self, query_str: str,
+        result_format: str = RF_TSV) -> TabularResult:
+        reply = self._g.query(query_str)
+        return TabularResult([str(v) for v in reply.vars],
+            [tuple("" if term is None else str(term) for term in row)
+                for row in reply])
 
     def update(self, query_str: str) -> None:
         if query_str is not None and query_str != "":
             self._g.update(query_str)
+
+class AsyncStoreClient:
+    """
+    Asynchronous counterpart of `StoreClient`, whose methods are
+    coroutines, such that several queries can be in flight at once.
+    """
+
+    async def query(self, query_str: str) -> dict:
+        raise Exception(f"Query method is not implemented "
+            f"for abstract {self.__class__.__name__} class!")
+
+    async def update(self, query_str: str) -> None:
+        raise Exception(f"Update method is not implemented "
+            f"for abstract {self.__class__.__name__} class!")
+
+    async def query_iter(self, query_str: str,
+        max_rows: int | None = None) -> AsyncIterator[dict]:
+        """
+        Asynchronous version of `StoreClient.query_iter`. Unless
+        overridden, the full result is retrieved first.
+        """
+        bindings = (await self.query(query_str))["results"]["bindings"]
+        for row in islice(bindings, max_rows):
+            yield row
+
+    async def query_rows(self, query_str: str,
+        result_format: str = RF_TSV) -> TabularResult:
+        """
+        Asynchronous version of `StoreClient.query_rows`. Unless
+        overridden, the result is converted from the JSON format.
+        """
+        return tabular_from_json(await self.query(query_str))
+
+    async def close(self) -> None:
+        pass
+
+class AsyncRemoteStoreClient(AsyncStoreClient):
+    """
+    Asynchronous client for a remote SPARQL endpoint with a pool of
+    persistent HTTP connections, see `PooledStoreClient` for the
+    meaning of the parameters.
+    """
+
+    def __init__(self, url: str, pool_size: int = 10,
+        keep_alive: bool = True, connect_timeout: float | None = 5.0,
+        read_timeout: float | None = 60.0,
+        server_timeout: float | None = None
+    ) -> None:
+        self._url = url
+        headers = {"Accept-Encoding": "gzip, deflate"}
+        if server_timeout is not None:
+            headers[HN_BIGDATA_MAX_QUERY_MILLIS] = str(int(server_timeout*1000))
+        self.client = httpx.AsyncClient(headers=headers,
+            limits=httpx.Limits(max_connections=pool_size,
+                max_keepalive_connections=pool_size if keep_alive else 0),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout))
+
+    def url(self):
+        return self._url
+
+    async def _post(self, data: dict[str, str],
+        headers: dict[str, str] | None = None) -> httpx.Response:
+        response = await self.client.post(self.url(), data=data,
+            headers=headers)
+        response.raise_for_status()
+        return response
+
+    async def query(self, query_str: str) -> dict:
+        return (await self._post({"query": query_str},
+            headers={"Accept": MT_SPARQL_RESULTS_JSON})).json()
+
+    async def query_rows(self, query_str: str,
+        result_format: str = RF_TSV) -> TabularResult:
+        response = await self._post({"query": query_str},
+            headers={"Accept": RESULT_FORMAT_MIME_TYPES[result_format]})
+        if result_format == RF_JSON:
+            return tabular_from_json(response.json())
+        return parse_tabular_result(response.content.decode("utf-8"),
+            result_format)
+
+    async def query_iter(self, query_str: str,
+        max_rows: int | None = None) -> AsyncIterator[dict]:
+        """
+        Asynchronous version of `PooledStoreClient.query_iter`.
+        """
+        if max_rows is not None and max_rows <= 0:
+            return
+        async with self.client.stream("POST", self.url(),
+            data={"query": query_str},
+            headers={"Accept": MT_SPARQL_RESULTS_JSON}) as response:
+            response.raise_for_status()
+            parser = SPARQLJSONBindingsParser()
+            n = 0
+            async for text in response.aiter_text(STREAM_CHUNK_SIZE):
+                for row in parser.feed(text):
+                    yield row
+                    n += 1
+                    if n == max_rows:
+                        return
+            parser.close()
+
+    async def update(self, query_str: str) -> None:
+        if query_str is not None and query_str != "":
+            await self._post({"update": query_str})
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+class ThreadedStoreClient(AsyncStoreClient):
+    """
+    Asynchronous client that runs the blocking calls of a synchronous
+    store client in a dedicated pool of worker threads.
+    """
+
+    def __init__(self, store_client: StoreClient,
+        max_workers: int = 4) -> None:
+        self.store_client = store_client
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    async def query(self, query_str: str) -> dict:
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, self.store_client.query, query_str)
+
+    async def query_iter(self, query_str: str,
+        max_rows: int | None = None) -> AsyncIterator[dict]:
+        rows = await asyncio.get_running_loop().run_in_executor(
+            self.executor,
+            lambda: list(self.store_client.query_iter(query_str, max_rows)))
+        for row in rows:
+            yield row
+
+    async def query_rows(self, query_str: str,
+        result_format: str = RF_TSV) -> TabularResult:
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, self.store_client.query_rows, query_str,
+            result_format)
+
+    async def update(self, query_str: str) -> None:
+        await asyncio.get_running_loop().run_in_executor(
+            self.executor, self.store_client.update, query_str)
+
+    async def close(self) -> None:
+        self.executor.shutdown(wait=False)
+
+class AsyncRdflibStoreClient(ThreadedStoreClient):
+    """
+    Asynchronous client for an rdflib graph, which is queried in a worker
+    thread, as rdflib itself is synchronous.
+    NB rdflib's SPARQL parser is not thread-safe, hence by default there
+    is only a single worker.
+    """
+
+    def __init__(self,
+        g: Graph | None = None, filename: str | None = None,
+        max_workers: int = 1
+    ) -> None:
+        super().__init__(RdflibStoreClient(g=g, filename=filename),
+            max_workers=max_workers)
+
+def make_async_store_client(config: RAGConfig,
+    url: str) -> AsyncRemoteStoreClient:
+    """
+    Returns an asynchronous pooled client for the given SPARQL endpoint,
+    with pool size and timeouts as configured.
+    """
+    return AsyncRemoteStoreClient(url,
+        pool_size=config.get_or_default(CVN_STORE_POOL_SIZE, 10),
+        keep_alive=config.get_or_default(CVN_STORE_KEEP_ALIVE, True),
+        connect_timeout=config.get_or_default(CVN_STORE_CONNECT_TIMEOUT, 5.0),
+        read_timeout=config.get_or_default(CVN_STORE_READ_TIMEOUT, 60.0),
+        server_timeout=config.get_or_default(CVN_STORE_SERVER_TIMEOUT)
+    )
+
+async def gather_queries(asc: AsyncStoreClient,
+    query_strs: list[str]) -> list[dict]:
+    """
+    Issues the given queries concurrently and returns their replies in
+    the same order.
+    """
+    return list(await asyncio.gather(*[asc.query(q) for q in query_strs]))
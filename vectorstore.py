@@ -0,0 +1,247 @@
+"""
+Set-up of the Qdrant vector store holding the speech embeddings, either
+as a local store in a cache directory, or on a Qdrant server.
+"""
+
+import logging
+
+from langchain_core.embeddings import Embeddings
+from langchain_qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient, models
+from qdrant_client.http.models import Distance, VectorParams
+from qdrant_client.http.models import PayloadSchemaType, PointStruct
+
+from common import ES_UTF_8, RAGError, log_msg
+from ragconfig import RAGConfig, CVN_EMBEDDING_DIM, CVN_VS_COLLECTION
+from ragconfig import CVN_VS_OVERSAMPLING, CVN_VS_QUANTIZATION
+from ragconfig import CVN_VSTORE_CACHE, CVN_VSTORE_URL, make_arg_parser
+
+# Payload key under which langchain stores document metadata
+METADATA_PAYLOAD_KEY = "metadata"
+
+# Types of the payload indexes of the metadata fields by which searches
+# are filtered, see `SpeechKGLoader`
+PAYLOAD_INDEXES = {
+    "Datum": PayloadSchemaType.DATETIME,
+    "Fraktion": PayloadSchemaType.KEYWORD,
+    "Wahlperiode": PayloadSchemaType.KEYWORD,
+    "Sitzungnr": PayloadSchemaType.KEYWORD,
+    "Redner": PayloadSchemaType.KEYWORD,
+    "Lesung": PayloadSchemaType.KEYWORD,
+}
+
+# Vector quantisation modes
+VQ_NONE   = "none"   # Original float32 vectors only
+VQ_SCALAR = "scalar" # int8 per dimension, a quarter of the memory
+VQ_BINARY = "binary" # One bit per dimension, a 32nd of the memory
+
+def metadata_key(field: str) -> str:
+    """
+    Returns the payload key of the given metadata field.
+    """
+    return f"{METADATA_PAYLOAD_KEY}.{field}"
+
+def is_local(client: QdrantClient) -> bool:
+    """
+    Returns whether the client uses a local store, in a directory or in
+    memory, rather than a Qdrant server.
+    """
+    options = client.init_options
+    return options["path"] is not None or options["location"] == ":memory:"
+
+def ensure_payload_indexes(client: QdrantClient,
+    collection_name: str) -> list[str]:
+    """
+    Creates any missing payload indexes of filtered metadata fields in
+    the given collection, and returns the fields indexed. This also
+    migrates collections created without indexes.
+    NB Local stores ignore payload indexes, and always scan all points
+    when filtering, so nothing is done for these.
+    """
+    if is_local(client):
+        return []
+    schema = client.get_collection(collection_name).payload_schema
+    created = []
+    for field, schema_type in PAYLOAD_INDEXES.items():
+        if metadata_key(field) not in schema:
+            client.create_payload_index(collection_name,
+                field_name=metadata_key(field), field_schema=schema_type,
+                wait=True)
+            created.append(field)
+    if len(created) > 0:
+        log_msg(f"Created payload indexes for {', '.join(created)} in "
+            f"collection '{collection_name}'.", level=logging.INFO)
+    return created
+
+def make_quantization_config(mode: str
+) -> models.ScalarQuantization | models.BinaryQuantization | None:
+    """
+    Returns the Qdrant quantisation config of the given mode, if any.
+    Quantised vectors are kept in RAM, whereas original vectors, which
+    are only needed for rescoring, may be kept on disk.
+    """
+    # https://qdrant.tech/documentation/guides/quantization/
+    if mode == VQ_NONE:
+        return None
+    if mode == VQ_SCALAR:
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=True))
+    if mode == VQ_BINARY:
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"Unsupported vector quantisation mode '{mode}'!")
+
+def make_search_params(config: RAGConfig) -> models.SearchParams | None:
+    """
+    Returns the search parameters for the configured quantisation, if
+    any, such that the configured multiple of the number of requested
+    results is retrieved via the quantised vectors, and then rescored
+    with the original vectors.
+    NB Local stores always search exhaustively, and warn about any
+    search parameters, so none are returned for these.
+    """
+    if (config.get_or_default(CVN_VSTORE_URL) is None
+        or config.get_or_default(CVN_VS_QUANTIZATION, VQ_NONE) == VQ_NONE):
+        return None
+    return models.SearchParams(quantization=models.QuantizationSearchParams(
+        rescore=True,
+        oversampling=config.get_or_default(CVN_VS_OVERSAMPLING, 2.0)))
+
+def ensure_quantization(client: QdrantClient, collection_name: str,
+    mode: str) -> bool:
+    """
+    Quantises the vectors of the given collection in place as per the
+    given mode, unless they are already, and returns whether anything
+    was changed. Enabling quantisation moves the original vectors to
+    disk, and the server rebuilds the collection's index in the
+    background, during which searches are slower.
+    NB Local stores ignore quantisation, and always search the original
+    vectors, so nothing is done for these.
+    """
+    if is_local(client):
+        if mode != VQ_NONE:
+            log_msg(f"Vector quantisation '{mode}' is not supported by "
+                "local vector stores, and is ignored.", level=logging.WARN)
+        return False
+    quantization_config = make_quantization_config(mode)
+    current = client.get_collection(collection_name).config.quantization_config
+    if type(current) is type(quantization_config):
+        return False
+    client.update_collection(collection_name,
+        vectors_config={"": models.VectorParamsDiff(
+            on_disk=quantization_config is not None)},
+        quantization_config=(models.Disabled.DISABLED
+            if quantization_config is None else quantization_config))
+    log_msg(f"Changed vector quantisation of collection '{collection_name}' "
+        f"to '{mode}'.", level=logging.INFO)
+    return True
+
+def make_qdrant_client(config: RAGConfig) -> QdrantClient:
+    """
+    Returns a client for the configured Qdrant server, if any, or for
+    the local store in the configured cache directory otherwise.
+    """
+    url = config.get_or_default(CVN_VSTORE_URL)
+    if url is not None:
+        return QdrantClient(url=url)
+    return QdrantClient(path=config.get(CVN_VSTORE_CACHE))
+
+def make_vector_store(config: RAGConfig,
+    embeddings: Embeddings) -> QdrantVectorStore:
+    """
+    Returns the configured vector store, reading the existing collection
+    if there is one, or creating a new one otherwise. Either way, the
+    collection is given payload indexes for filtered searches, and
+    quantised as configured.
+    """
+    client = make_qdrant_client(config)
+    collection_name = config.get(CVN_VS_COLLECTION)
+    mode = config.get_or_default(CVN_VS_QUANTIZATION, VQ_NONE)
+    location = config.get_or_default(CVN_VSTORE_URL,
+        config.get(CVN_VSTORE_CACHE))
+    if client.collection_exists(collection_name):
+        log_msg(f"Reading collection '{collection_name}' from "
+            f"existing vector store in '{location}'...")
+        info = client.get_collection(collection_name)
+        size = info.config.params.vectors.size
+        if size != config.get(CVN_EMBEDDING_DIM):
+            raise RAGError(f"Collection '{collection_name}' holds vectors "
+                f"of dimension {size} rather than the configured "
+                f"{config.get(CVN_EMBEDDING_DIM)}, see `reprojection.py`.")
+    else:
+        log_msg(f"Creating new vector store in '{location}', "
+            f"with new collection '{collection_name}'...")
+        # NB Unfortunately, at time of writing, there does not
+        # seem to be a good way to determine the dimension of
+        # the embedding, so we read that from config, too.
+        quantization_config = make_quantization_config(mode)
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config=VectorParams(
+                size=config.get(CVN_EMBEDDING_DIM),
+                distance=Distance.COSINE,
+                on_disk=quantization_config is not None
+            ),
+            quantization_config=quantization_config
+        )
+    ensure_payload_indexes(client, collection_name)
+    ensure_quantization(client, collection_name, mode)
+    return QdrantVectorStore(
+        client=client,
+        collection_name=collection_name,
+        embedding=embeddings
+    )
+
+def copy_collection(source: QdrantClient, target: QdrantClient,
+    collection_name: str, batch_size: int = 256) -> int:
+    """
+    Copies the points of a collection, with vectors and payloads, from
+    one store to another, e.g. from a local store to a Qdrant server,
+    creating the collection in the latter if necessary. Returns the
+    number of points copied.
+    """
+    if not target.collection_exists(collection_name):
+        info = source.get_collection(collection_name)
+        target.create_collection(collection_name=collection_name,
+            vectors_config=info.config.params.vectors)
+    num_points = 0
+    offset = None
+    while True:
+        points, offset = source.scroll(collection_name, limit=batch_size,
+            offset=offset, with_payload=True, with_vectors=True)
+        if len(points) > 0:
+            target.upsert(collection_name, points=[PointStruct(id=p.id,
+                vector=p.vector, payload=p.payload) for p in points])
+            num_points += len(points)
+        if offset is None:
+            return num_points
+
+def main():
+    """
+    Migrates the configured collection: if a Qdrant server is configured,
+    the collection is copied there from the local vector store cache,
+    and either way, any missing payload indexes are created, and the
+    vectors are quantised as configured.
+    """
+    args = make_arg_parser("Migrates the configured collection.").parse_args()
+    logging.basicConfig(filename="vectorstore.log", encoding=ES_UTF_8,
+        level=logging.INFO)
+    config = RAGConfig(args.config)
+    collection_name = config.get(CVN_VS_COLLECTION)
+    client = make_qdrant_client(config)
+    if not is_local(client):
+        local_client = QdrantClient(path=config.get(CVN_VSTORE_CACHE))
+        if local_client.collection_exists(collection_name):
+            num_points = copy_collection(local_client, client,
+                collection_name)
+            log_msg(f"Copied {num_points} points to '{collection_name}' "
+                f"on '{config.get(CVN_VSTORE_URL)}'.")
+        local_client.close()
+    ensure_payload_indexes(client, collection_name)
+    ensure_quantization(client, collection_name,
+        config.get_or_default(CVN_VS_QUANTIZATION, VQ_NONE))
+    client.close()
+
+if __name__ == "__main__":
+    main()